@@ -1,13 +1,10 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-import uuid
+import inspect
 import json
 import traceback
 from fastapi.responses import FileResponse, StreamingResponse
-from supabase import create_client, Client
 from gotrue.types import User
-import tempfile
 import os
-from docx2pdf import convert
 from app.services import recommendation_service
 from app.schemas.models import ChatRequest, QuizRequest, RecommendationRequest, ChatSessionCreate, ChatSessionResponse, DocumentResponse
 from docx import Document
@@ -17,121 +14,135 @@ from reportlab.lib.units import inch
 from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.platypus import Paragraph, SimpleDocTemplate
 import io
-from typing import List
-from app.services import document_service, vector_service, llm_service
-from app.schemas.models import ChatRequest, QuizRequest, RecommendationRequest, CommentRequest, CommentResponse
+from typing import List, Optional
+from app.services import document_service, vector_service, llm_service, ingestion_service, cache_service, session_index_service, session_service, study_service, context_service
+from app.schemas.models import ChatRequest, QuizRequest, RecommendationRequest, CommentRequest, CommentResponse, SummarizeRequest, MindMapRequest
 from app.core.auth import get_current_user
-from app.core.config import SUPABASE_URL, SUPABASE_SERVICE_KEY
+from app.core.config import SESSION_INDEX_ENABLED
+from app.core.executors import run_io, run_cpu
+from app.core.resources import get_supabase
+from app.core import db, metrics, storage
 
 router = APIRouter()
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
-def get_document_details(doc_ids: list[str]) -> list[dict]:
-    if not doc_ids:
-        return []
-    res = supabase.table("documents").select("file_name, storage_path").in_("storage_path", doc_ids).execute()
-    return res.data
+# Server-Sent Events helpers for the streaming mode of the LLM-backed endpoints.
+# The stream is a series of "token" events, optional trailing events (e.g. "citations"),
+# then "done" - or "error" if generation fails midway.
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_llm_answer(prompt: str, trailing_events: Optional[dict] = None, cached_answer: Optional[str] = None, on_complete=None) -> StreamingResponse:
+    async def event_stream():
+        try:
+            if cached_answer is not None:
+                yield sse_event("token", {"text": cached_answer})
+            else:
+                tokens = []
+                async for token in llm_service.stream_chat_completion(prompt):
+                    tokens.append(token)
+                    yield sse_event("token", {"text": token})
+                if on_complete:
+                    result = on_complete("".join(tokens))
+                    if inspect.isawaitable(result):
+                        await result
+            for event, data in (trailing_events or {}).items():
+                yield sse_event(event, data)
+            yield sse_event("done", {})
+        except Exception as e:
+            yield sse_event("error", {"detail": f"An error occurred while generating the answer: {e}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 # Helper function to verify that the user making the request owns the document.
 # This is called at the beginning of every endpoint that accesses a document.
-def verify_document_ownership(doc_id: str, user_id: str):
+def verify_document_ownership(doc_id: str, user_id: str, supabase):
     try:
         # .single() ensures that exactly one row is returned, otherwise it raises an error.
-        result = supabase.table("documents").select("id").eq("storage_path", doc_id).eq("user_id", user_id).single().execute()
+        result = db.execute(supabase.table("documents").select("id, content_hash").eq("storage_path", doc_id).eq("user_id", user_id).single())
         # If the query returns no data, the document does not exist or does not belong to the user.
         if not result.data:
             raise HTTPException(status_code=403, detail="Forbidden: You do not own this document or it does not exist.")
+        # The row says where the document's current index lives, so the request never reads
+        # the artifacts of a version replaced on another worker.
+        vector_service.remember_artifact_prefix(doc_id, result.data.get("content_hash"))
     except Exception as e:
         # Catches errors from .single() (e.g., if more than one row is found) or other DB issues.
         print(f"Ownership verification failed: {e}")
         raise HTTPException(status_code=403, detail="Forbidden: You do not own this document or it does not exist.")
 
 
-@router.post("/upload")
+@router.post("/upload", status_code=202)
 async def upload_document(file: UploadFile = File(...), current_user: User = Depends(get_current_user)):
-    doc_id = str(uuid.uuid4())
-    has_pdf_viewable = False
-
-    # Use a temporary directory for safe file handling
-    with tempfile.TemporaryDirectory() as temp_dir:
-        original_file_path = os.path.join(temp_dir, file.filename)
-        
-        # Save the uploaded file to a temporary location on disk
-        with open(original_file_path, "wb") as f:
-            content = await file.read() # Read the content once
-            f.write(content)
-
-        text = ""
-        
-        # --- PDF Handling ---
-        if file.content_type == "application/pdf":
-            # Re-open the saved file for reading text
-            with open(original_file_path, "rb") as f:
-                text = document_service.extract_text_from_pdf(f)
-            
-            # Upload the original PDF directly as 'viewable.pdf'
-            supabase.storage.from_("files").upload(
-                file=original_file_path, 
-                path=f"{doc_id}/viewable.pdf",
-                file_options={"content-type": "application/pdf"}
-            )
-            has_pdf_viewable = True
-
-        # --- DOCX Handling ---
-        elif file.content_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-            # Re-open the saved file for reading text
-            with open(original_file_path, "rb") as f:
-                text = document_service.extract_text_from_docx(f)
-
-            pdf_path = os.path.join(temp_dir, f"{doc_id}.pdf")
-            try:
-                # Convert the saved DOCX file to PDF
-                convert(original_file_path, pdf_path)
-                
-                # Upload the NEWLY CREATED PDF as 'viewable.pdf'
-                supabase.storage.from_("files").upload(
-                    file=pdf_path, 
-                    path=f"{doc_id}/viewable.pdf",
-                    file_options={"content-type": "application/pdf"}
-                )
-                has_pdf_viewable = True
-            except Exception as e:
-                print(f"CRITICAL: Failed to convert DOCX to PDF for doc_id {doc_id}. Error: {e}")
-                has_pdf_viewable = False # Gracefully fail; doc won't be viewable
-        
-        else:
-            raise HTTPException(status_code=400, detail="Unsupported file type.")
-
-    # --- Text processing and DB insert (same as before) ---
-    chunks = document_service.chunk_text(text)
-    if not chunks:
-        # If text extraction failed, it's better to stop here
-        raise HTTPException(status_code=400, detail="Could not extract any text from the document.")
-
-    vector_service.create_and_store_embeddings(doc_id, chunks)
-    
-    try:
-        supabase.table("documents").insert({
-            "user_id": str(current_user.id),
-            "file_name": file.filename,
-            "storage_path": doc_id,
-            "has_pdf_viewable": has_pdf_viewable
-        }).execute()
-    except Exception as e:
-        # Cleanup logic...
-        raise HTTPException(status_code=500, detail=f"Database error: {e}")
-
-    return {"document_id": doc_id, "filename": file.filename}
+    if file.content_type not in (document_service.PDF_CONTENT_TYPE, document_service.DOCX_CONTENT_TYPE):
+        raise HTTPException(status_code=400, detail="Unsupported file type.")
+
+    # Extraction, conversion, embedding and storage happen in the background ingestion
+    # pipeline; the client polls GET /jobs/{job_id} until the document is ready.
+    content = await file.read()
+    job = await run_io(ingestion_service.submit_upload, str(current_user.id), file.filename, file.content_type, content)
+
+    return {"job_id": job["id"], "document_id": job["document_id"], "filename": job["file_name"], "status": job["status"]}
+
+
+@router.put("/documents/{doc_id}", status_code=202)
+async def replace_document(doc_id: str, file: UploadFile = File(...), current_user: User = Depends(get_current_user), supabase=Depends(get_supabase)):
+    await run_io(verify_document_ownership, doc_id, str(current_user.id), supabase)
+    if file.content_type not in (document_service.PDF_CONTENT_TYPE, document_service.DOCX_CONTENT_TYPE):
+        raise HTTPException(status_code=400, detail="Unsupported file type.")
+
+    # The new version goes through the same ingestion pipeline and keeps the document's
+    # storage_path, so its chat sessions and comments stay attached to it.
+    content = await file.read()
+    job = await run_io(ingestion_service.submit_replace, str(current_user.id), doc_id, file.filename, file.content_type, content)
+
+    return {"job_id": job["id"], "document_id": job["document_id"], "filename": job["file_name"], "status": job["status"]}
+
+
+@router.get("/jobs/{job_id}")
+async def get_job_status(job_id: str, current_user: User = Depends(get_current_user)):
+    job = await run_io(ingestion_service.get_job, job_id)
+    if not job or job["user_id"] != str(current_user.id):
+        raise HTTPException(status_code=404, detail="Job not found.")
+
+    return {
+        "job_id": job["id"],
+        "kind": job.get("kind", "upload"),
+        "document_id": job["document_id"],
+        "filename": job["file_name"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "progress": job["progress"],
+        "attempts": job["attempts"],
+        "error": job["error"],
+        # Replacements only: how many chunks kept their embedding / had to be encoded.
+        "unchanged_chunks": job.get("unchanged_chunks"),
+        "changed_chunks": job.get("changed_chunks"),
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
 
 
 @router.post("/chat")
-async def chat_with_document(request: ChatRequest, current_user: User = Depends(get_current_user)):
-    verify_document_ownership(request.doc_id, str(current_user.id))
-    
-    context_chunks = vector_service.retrieve_relevant_chunks(request.doc_id, request.query)
+async def chat_with_document(request: ChatRequest, current_user: User = Depends(get_current_user), supabase=Depends(get_supabase)):
+    await run_io(verify_document_ownership, request.doc_id, str(current_user.id), supabase)
+
+    # A near-duplicate of an earlier question about this document reuses its answer.
+    query_vector = await vector_service.encode_query_async(request.query)
+    prefix = vector_service.artifact_prefix(request.doc_id)
+    cached_answer = cache_service.get_semantic_response(prefix, query_vector)
+    if cached_answer is not None:
+        if request.stream:
+            return stream_llm_answer("", cached_answer=cached_answer)
+        return {"answer": cached_answer}
+
+    context_chunks = await vector_service.retrieve_chunk_records_async(request.doc_id, request.query, query_vector=query_vector)
     if not context_chunks:
         raise HTTPException(status_code=404, detail="Could not retrieve relevant context from your document to answer this question.")
 
-    context = "\n\n".join(context_chunks)
+    context = (await context_service.assemble_async(context_chunks))["text"]
     prompt = f"""Based ONLY on the following context, answer the user's question.
     Context:
     {context}
@@ -139,172 +150,133 @@ async def chat_with_document(request: ChatRequest, current_user: User = Depends(
     Question: {request.query}
     """
     
-    answer = llm_service.generate_chat_completion(prompt)
+    def remember_answer(answer: str):
+        cache_service.set_semantic_response(prefix, query_vector, answer)
+
+    if request.stream:
+        return stream_llm_answer(prompt, on_complete=remember_answer)
+
+    answer = await llm_service.generate_chat_completion_async(prompt)
+    remember_answer(answer)
     return {"answer": answer}
 
 
 @router.post("/mindmap")
-async def generate_mindmap(request: ChatRequest, current_user: User = Depends(get_current_user)):
-    verify_document_ownership(request.doc_id, str(current_user.id))
+async def generate_mindmap(request: MindMapRequest, current_user: User = Depends(get_current_user), supabase=Depends(get_supabase)):
+    await run_io(verify_document_ownership, request.doc_id, str(current_user.id), supabase)
     
     try:
-        context_chunks = vector_service.retrieve_relevant_chunks(request.doc_id, request.query, top_k=15)
+        # Without a topic, the document's overview mind map is served from storage.
+        if not request.query.strip():
+            mind_map_json = await study_service.get_default_mindmap(request.doc_id, refresh=request.refresh)
+            if mind_map_json is None:
+                raise HTTPException(status_code=404, detail="Could not find content for the mind map.")
+            return mind_map_json
+
+        context_chunks = await vector_service.retrieve_chunk_records_async(request.doc_id, request.query, top_k=15)
         if not context_chunks:
             raise HTTPException(status_code=404, detail="Could not find relevant context for the mind map topic.")
-        
-        context = "\n\n".join(context_chunks)
-        
-        # This is a much more sophisticated prompt designed to extract a knowledge graph.
-        prompt = f"""
-        Analyze the following text based on the central topic: "{request.query}".
-        Your task is to act as a knowledge graph expert and generate a JSON object representing a detailed mind map.
-
-        The JSON object must have two keys: "nodes" and "edges".
-
-        ### Instructions for "nodes":
-        - Each node must be an object with "id" (string), "position" ({{ "x": 0, "y": 0 }}), and a "data" object.
-        - The "data" object for each node MUST contain the following three keys:
-          1. "label": A string for the main concept/entity name.
-          2. "description": A concise, one-sentence explanation of the concept based on the text.
-          3. "category": A single-word category for the concept. Choose from: ["Core Concept", "Process", "Example", "Property", "Person", "Location"]. This will be used for coloring.
-
-        ### Instructions for "edges":
-        - Each edge must be an object with "id", "source" (source node id), "target" (target node id), and "label" (a string describing the relationship, e.g., "is a type of", "leads to", "defined by").
-
-        ### Example Structure:
-        {{
-          "nodes": [
-            {{ "id": "1", "position": {{"x":0, "y":0}}, "data": {{ "label": "Photosynthesis", "description": "The process used by plants to convert light energy into chemical energy.", "category": "Process" }} }},
-            {{ "id": "2", "position": {{"x":0, "y":0}}, "data": {{ "label": "Chlorophyll", "description": "The green pigment responsible for absorbing light.", "category": "Property" }} }}
-          ],
-          "edges": [
-            {{ "id": "e1-2", "source": "1", "target": "2", "label": "requires" }}
-          ]
-        }}
-
-        IMPORTANT: Your response MUST be ONLY the valid JSON object. Do not include any explanations, markdown formatting, or any text outside the JSON structure.
-
-        Context to analyze:
-        ---
-        {context}
-        ---
-        JSON Output:
-        """
-        
-        llm_response_str = llm_service.generate_chat_completion(prompt)
 
-        # The robust JSON extraction and validation logic remains the same.
-        json_start_index = llm_response_str.find('{')
-        json_end_index = llm_response_str.rfind('}')
-        
-        if json_start_index != -1 and json_end_index != -1:
-            clean_json_str = llm_response_str[json_start_index : json_end_index + 1]
-            mind_map_json = json.loads(clean_json_str)
-        else:
-            raise ValueError("No JSON object found in the LLM response.")
-        
-        if "nodes" not in mind_map_json or "edges" not in mind_map_json:
-            raise ValueError("Missing 'nodes' or 'edges' key in JSON")
-        
-        return mind_map_json
+        context = (await context_service.assemble_async(context_chunks))["text"]
+        return await study_service.generate_mindmap(context, request.query)
 
     except (json.JSONDecodeError, ValueError) as e:
         print(f"Failed to parse LLM response into JSON: {e}")
-        print(f"LLM Response was: {llm_response_str}")
         raise HTTPException(status_code=500, detail="Failed to generate a valid mind map structure.")
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"An internal server error occurred: {e}")
 
 @router.post("/summarize")
-async def summarize_document(request: ChatRequest, current_user: User = Depends(get_current_user)):
-    verify_document_ownership(request.doc_id, str(current_user.id))
+async def summarize_document(request: SummarizeRequest, current_user: User = Depends(get_current_user), supabase=Depends(get_supabase)):
+    await run_io(verify_document_ownership, request.doc_id, str(current_user.id), supabase)
 
     try:
-        context_chunks = vector_service.retrieve_relevant_chunks(
-            doc_id=request.doc_id, 
-            query="Provide a comprehensive summary of this document.",
-            top_k=20
-        )
-        if not context_chunks:
+        if request.mode == "full":
+            # Served from storage when it has been generated for this content before.
+            summary_text = None if request.refresh else await study_service.load_stored(request.doc_id, study_service.SUMMARY_FILE)
+            if summary_text is not None:
+                return stream_llm_answer("", cached_answer=summary_text) if request.stream else {"summary": summary_text}
+
+        # In "full" mode, group summaries are produced (or read from cache) first, and only
+        # the final combining prompt is completed or streamed here.
+        prompt = await study_service.summary_prompt(request.doc_id, request.mode)
+        if prompt is None:
             raise HTTPException(status_code=404, detail="Could not find content to summarize in the document.")
 
-        context = "\n\n".join(context_chunks)
-        prompt = f"""
-        Based ONLY on the following text, provide a high-quality summary with a main paragraph and a "Key Points" list.
-        Do not add any preamble like "Here is the summary".
-        Text to Summarize: --- {context} --- Summary:
-        """
-        summary_text = llm_service.generate_chat_completion(prompt)
+        async def remember_summary(summary: str):
+            if request.mode == "full":
+                await study_service.store(request.doc_id, study_service.SUMMARY_FILE, summary)
+
+        if request.stream:
+            return stream_llm_answer(prompt, on_complete=remember_summary)
+
+        summary_text = await llm_service.generate_chat_completion_async(prompt)
+        await remember_summary(summary_text)
         return {"summary": summary_text}
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"An internal server error occurred during summarization: {e}")
 
 
 @router.post("/quiz")
-async def generate_quiz(request: QuizRequest, current_user: User = Depends(get_current_user)):
-    verify_document_ownership(request.doc_id, str(current_user.id))
+async def generate_quiz(request: QuizRequest, current_user: User = Depends(get_current_user), supabase=Depends(get_supabase)):
+    await run_io(verify_document_ownership, request.doc_id, str(current_user.id), supabase)
     
     try:
-        context_chunks = vector_service.retrieve_relevant_chunks(
-            doc_id=request.doc_id, 
-            query="Generate a quiz based on the key concepts in this document.",
-            top_k=15
-        )
-        if not context_chunks:
+        # Questions are sampled from the document's stored quiz pool.
+        quiz_json = await study_service.get_quiz(request.doc_id, request.num_questions, refresh=request.refresh)
+        if not quiz_json:
             raise HTTPException(status_code=404, detail="Could not find content to generate a quiz from.")
-
-        context = "\n\n".join(context_chunks)
-        prompt = f"""
-        Based ONLY on the following text, create a multiple-choice quiz with {request.num_questions} questions.
-        Generate a JSON array of objects. Each object must have "question", "options" (an array of 4 strings), and "correctAnswer".
-        IMPORTANT: Your entire response MUST be ONLY the JSON array.
-        Text to analyze: --- {context} --- JSON Array Output:
-        """
-        llm_response_str = llm_service.generate_chat_completion(prompt)
-        json_start_index = llm_response_str.find('[')
-        json_end_index = llm_response_str.rfind(']')
-        
-        if json_start_index != -1 and json_end_index != -1:
-            clean_json_str = llm_response_str[json_start_index : json_end_index + 1]
-            quiz_json = json.loads(clean_json_str)
-        else:
-            raise ValueError("No JSON array found in the LLM response.")
-        
-        if not isinstance(quiz_json, list) or not all("question" in q for q in quiz_json):
-             raise ValueError("Generated JSON is not a valid list of questions.")
-        
         return quiz_json
     except (json.JSONDecodeError, ValueError) as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate a valid quiz: {e}")
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"An internal server error occurred during quiz generation: {e}")
 
 @router.delete("/documents/{doc_id}")
-async def delete_document(doc_id: str, current_user: User = Depends(get_current_user)):
+async def delete_document(doc_id: str, current_user: User = Depends(get_current_user), supabase=Depends(get_supabase)):
     # 1. First, verify the user owns this document before proceeding.
     # This is the most critical security step.
-    verify_document_ownership(doc_id, str(current_user.id))
+    await run_io(verify_document_ownership, doc_id, str(current_user.id), supabase)
 
     try:
+        # Find the chat sessions using this document before the links are cascade-deleted,
+        # so its vectors can be removed from their consolidated indexes.
+        linked_sessions = (await run_io(db.execute, supabase.table("session_documents").select(
+            "session_id, documents!inner(storage_path)"
+        ).eq("documents.storage_path", doc_id))).data
+        session_ids = [link['session_id'] for link in linked_sessions]
+        document_record = (await run_io(db.execute, supabase.table("documents").select("content_hash").eq("storage_path", doc_id).single())).data
+        content_hash = document_record.get("content_hash")
+
         # 2. Delete the associated files from Supabase Storage.
         # It's better to delete from storage first. If this fails, we haven't lost the database record.
-        storage_path = f"{doc_id}/" # The folder path in the bucket
-        # Supabase storage doesn't have a simple "delete folder" command,
-        # so we list files in the "folder" and delete them.
-        files_to_delete_response = supabase.storage.from_("files").list(path=storage_path)
-        if files_to_delete_response:
-            files_to_delete = [f['name'] for f in files_to_delete_response]
-            # Prepend the folder path to each file name for deletion
-            full_file_paths = [f"{storage_path}{name}" for name in files_to_delete]
-            if full_file_paths:
-                supabase.storage.from_("files").remove(full_file_paths)
+        # Supabase storage doesn't have a simple "delete folder" command, so this lists the
+        # files in the document's "folder" and deletes them.
+        await run_io(storage.remove_folder, f"{doc_id}/")
+
+        # Drop any locally cached copy of the index and chunks, and cached answers.
+        cache_service.invalidate_artifacts(vector_service.artifact_prefix(doc_id))
+        vector_service.invalidate_document(doc_id)
+        session_service.invalidate_document(doc_id)
+        if session_ids:
+            await run_io(session_index_service.remove_document, doc_id, session_ids)
 
         # 3. Delete the document's metadata record from the Supabase database.
         # This uses the `storage_path` column which is our `doc_id`.
-        supabase.table("documents").delete().eq("storage_path", doc_id).eq("user_id", str(current_user.id)).execute()
+        await run_io(db.execute, supabase.table("documents").delete().eq("storage_path", doc_id).eq("user_id", str(current_user.id)))
+
+        # 4. Delete the shared index and chunks once no other document uses the same file.
+        if content_hash:
+            await run_io(vector_service.release_artifacts, content_hash)
 
         return {"message": "Document and associated files deleted successfully."}
         
@@ -317,19 +289,12 @@ async def delete_document(doc_id: str, current_user: User = Depends(get_current_
         )
         
 @router.post("/recommendations")
-async def get_recommendations(request: RecommendationRequest, current_user: User = Depends(get_current_user)):
-    verify_document_ownership(request.doc_id, str(current_user.id))
+async def get_recommendations(request: RecommendationRequest, current_user: User = Depends(get_current_user), supabase=Depends(get_supabase)):
+    await run_io(verify_document_ownership, request.doc_id, str(current_user.id), supabase)
     
     try:
-        search_query = f"{request.topic} tutorial explanation"
-        
-        youtube_results = recommendation_service.search_youtube(search_query)
-        article_results = recommendation_service.search_web_articles(search_query)
-
-        return {
-            "youtube": youtube_results,
-            "articles": article_results
-        }
+        # Both lookups run concurrently, and repeated topics are served from a cache.
+        return await recommendation_service.get_recommendations(request.topic)
 
     except Exception as e:
         print(f"An error occurred during recommendation fetching: {e}")
@@ -339,97 +304,58 @@ async def get_recommendations(request: RecommendationRequest, current_user: User
             detail=f"An internal server error occurred while fetching recommendations: {e}"
         )
         
-@router.post("/upload")
-async def upload_document(file: UploadFile = File(...), current_user: User = Depends(get_current_user)):
-    doc_id = str(uuid.uuid4())
-    has_pdf_viewable = False
-
-    # We use a temporary directory to safely handle file operations
-    with tempfile.TemporaryDirectory() as temp_dir:
-        original_file_path = os.path.join(temp_dir, file.filename)
-        with open(original_file_path, "wb") as f:
-            f.write(file.file.read())
-            file.file.seek(0) # Reset file pointer
-
-        text = ""
-        # Handle PDF upload
-        if file.content_type == "application/pdf":
-            text = document_service.extract_text_from_pdf(file.file)
-            # Upload the original PDF to storage for viewing
-            with open(original_file_path, "rb") as f_read:
-                supabase.storage.from_("files").upload(file=f_read.read(), path=f"{doc_id}/viewable.pdf", file_options={"content-type": "application/pdf"})
-            has_pdf_viewable = True
-
-        # Handle DOCX upload and conversion
-        elif file.content_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-            text = document_service.extract_text_from_docx(file.file)
-            pdf_path = os.path.join(temp_dir, "converted.pdf")
-            try:
-                convert(original_file_path, pdf_path)
-                # Upload the converted PDF to storage for viewing
-                with open(pdf_path, "rb") as f_read:
-                    supabase.storage.from_("files").upload(file=f_read.read(), path=f"{doc_id}/viewable.pdf", file_options={"content-type": "application/pdf"})
-                has_pdf_viewable = True
-            except Exception as e:
-                print(f"Failed to convert DOCX to PDF: {e}")
-                # If conversion fails, we still proceed, but the doc won't be viewable
-                has_pdf_viewable = False
-
-        else:
-            raise HTTPException(status_code=400, detail="Unsupported file type.")
-
-    # Process text and store embeddings (same as before)
-    chunks = document_service.chunk_text(text)
-    if not chunks:
-        raise HTTPException(status_code=400, detail="Could not extract text from the document.")
-    vector_service.create_and_store_embeddings(doc_id, chunks)
-    
-    # Insert metadata into the database, including the new flag
-    try:
-        supabase.table("documents").insert({
-            "user_id": str(current_user.id),
-            "file_name": file.filename,
-            "storage_path": doc_id,
-            "has_pdf_viewable": has_pdf_viewable
-        }).execute()
-    except Exception as e:
-        # Cleanup logic...
-        raise HTTPException(status_code=500, detail=f"Database error: {e}")
-
-    return {"document_id": doc_id, "filename": file.filename}
-
-
 # --- NEW ENDPOINTS FOR COMMENTS ---
 
 @router.get("/documents/{doc_id}/comments", response_model=list[CommentResponse])
-async def get_comments(doc_id: str, current_user: User = Depends(get_current_user)):
-    doc_meta = supabase.table("documents").select("id").eq("storage_path", doc_id).eq("user_id", str(current_user.id)).single().execute()
+async def get_comments(doc_id: str, current_user: User = Depends(get_current_user), supabase=Depends(get_supabase)):
+    doc_meta = await run_io(db.execute, supabase.table("documents").select("id").eq("storage_path", doc_id).eq("user_id", str(current_user.id)).single())
     if not doc_meta.data:
         raise HTTPException(status_code=403, detail="Forbidden: You do not own this document.")
     
     document_internal_id = doc_meta.data['id']
     
-    comments = supabase.table("comments").select("*").eq("document_id", document_internal_id).order("created_at", desc=True).execute()
+    comments = await run_io(db.execute, supabase.table("comments").select("*").eq("document_id", document_internal_id).order("created_at", desc=True))
     return comments.data
 
 
 @router.post("/documents/{doc_id}/comments", response_model=CommentResponse)
-async def add_comment(doc_id: str, comment: CommentRequest, current_user: User = Depends(get_current_user)):
-    doc_meta = supabase.table("documents").select("id").eq("storage_path", doc_id).eq("user_id", str(current_user.id)).single().execute()
+async def add_comment(doc_id: str, comment: CommentRequest, current_user: User = Depends(get_current_user), supabase=Depends(get_supabase)):
+    doc_meta = await run_io(db.execute, supabase.table("documents").select("id").eq("storage_path", doc_id).eq("user_id", str(current_user.id)).single())
     if not doc_meta.data:
         raise HTTPException(status_code=403, detail="Forbidden: You do not own this document.")
 
     document_internal_id = doc_meta.data['id']
 
-    new_comment = supabase.table("comments").insert({
+    new_comment = await run_io(db.execute, supabase.table("comments").insert({
         "document_id": document_internal_id,
         "user_id": str(current_user.id),
         "page_number": comment.page_number,
         "comment_text": comment.comment_text
-    }).execute()
+    }))
 
     return new_comment.data[0]
 
+def build_pdf_from_docx(content: bytes) -> io.BytesIO:
+    docx_buffer = io.BytesIO(content)
+    document = Document(docx_buffer)
+
+    # 2. Prepare to build the PDF in memory
+    pdf_buffer = io.BytesIO()
+    doc = SimpleDocTemplate(pdf_buffer, pagesize=letter)
+    
+    # 3. Define styles and build the story (the content) for the PDF
+    styles = getSampleStyleSheet()
+    story = []
+    for para in document.paragraphs:
+        if para.text.strip(): # Add non-empty paragraphs
+            p = Paragraph(para.text, styles['Normal'])
+            story.append(p)
+    
+    # 4. Generate the PDF
+    doc.build(story)
+    pdf_buffer.seek(0)
+    return pdf_buffer
+
 @router.post("/convert-to-pdf")
 async def convert_to_pdf(file: UploadFile = File(...), current_user: User = Depends(get_current_user)):
     if file.content_type != "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
@@ -438,24 +364,9 @@ async def convert_to_pdf(file: UploadFile = File(...), current_user: User = Depe
     try:
         # 1. Read the uploaded DOCX file into memory
         content = await file.read()
-        docx_buffer = io.BytesIO(content)
-        document = Document(docx_buffer)
 
-        # 2. Prepare to build the PDF in memory
-        pdf_buffer = io.BytesIO()
-        doc = SimpleDocTemplate(pdf_buffer, pagesize=letter)
-        
-        # 3. Define styles and build the story (the content) for the PDF
-        styles = getSampleStyleSheet()
-        story = []
-        for para in document.paragraphs:
-            if para.text.strip(): # Add non-empty paragraphs
-                p = Paragraph(para.text, styles['Normal'])
-                story.append(p)
-        
-        # 4. Generate the PDF
-        doc.build(story)
-        pdf_buffer.seek(0)
+        # 2-4. Parsing and PDF layout are CPU-bound, so they run on the CPU pool
+        pdf_buffer = await run_cpu(build_pdf_from_docx, content)
 
         # 5. Create a streaming response to send the file
         # This is more memory-efficient than returning FileResponse from a temp file
@@ -473,17 +384,17 @@ async def convert_to_pdf(file: UploadFile = File(...), current_user: User = Depe
         raise HTTPException(status_code=500, detail="Failed to convert the document to PDF.")
 
 @router.post("/chat-sessions", response_model=ChatSessionResponse)
-async def create_chat_session(session_data: ChatSessionCreate, current_user: User = Depends(get_current_user)):
+async def create_chat_session(session_data: ChatSessionCreate, current_user: User = Depends(get_current_user), supabase=Depends(get_supabase)):
     # 1. Create the new chat session record
-    new_session = supabase.table("chat_sessions").insert({
+    new_session = (await run_io(db.execute, supabase.table("chat_sessions").insert({
         "user_id": str(current_user.id),
         "session_name": session_data.session_name
-    }).execute().data[0]
+    }))).data[0]
     
     # 2. Link the selected documents to this new session
     documents_to_link = []
     # First, get the internal UUIDs of the documents from their storage_paths
-    doc_metas = supabase.table("documents").select("id, storage_path").in_("storage_path", session_data.document_ids).execute().data
+    doc_metas = (await run_io(db.execute, supabase.table("documents").select("id, storage_path").in_("storage_path", session_data.document_ids))).data
     
     for doc_meta in doc_metas:
         documents_to_link.append({
@@ -492,31 +403,26 @@ async def create_chat_session(session_data: ChatSessionCreate, current_user: Use
         })
         
     if documents_to_link:
-        supabase.table("session_documents").insert(documents_to_link).execute()
+        await run_io(db.execute, supabase.table("session_documents").insert(documents_to_link))
 
     return new_session
 
 @router.get("/chat-sessions", response_model=list[ChatSessionResponse])
-async def get_chat_sessions(current_user: User = Depends(get_current_user)):
-    sessions = supabase.table("chat_sessions").select("*").eq("user_id", str(current_user.id)).order("created_at", desc=True).execute()
+async def get_chat_sessions(current_user: User = Depends(get_current_user), supabase=Depends(get_supabase)):
+    sessions = await run_io(db.execute, supabase.table("chat_sessions").select("*").eq("user_id", str(current_user.id)).order("created_at", desc=True))
     return sessions.data
 
 @router.get("/chat-sessions/{session_id}")
-async def get_chat_session_details(session_id: str, current_user: User = Depends(get_current_user)):
-    # Verify user owns the session
-    session = supabase.table("chat_sessions").select("*").eq("id", session_id).eq("user_id", str(current_user.id)).single().execute().data
-    if not session:
+async def get_chat_session_details(session_id: str, current_user: User = Depends(get_current_user), supabase=Depends(get_supabase)):
+    # Verify user owns the session, and get the details of its linked documents in the same query
+    rows = (await run_io(db.execute, supabase.table("chat_sessions").select(
+        "*, session_documents(documents(file_name, storage_path))"
+    ).eq("id", session_id).eq("user_id", str(current_user.id)).limit(1))).data
+    if not rows:
         raise HTTPException(status_code=404, detail="Chat session not found or you do not have permission to access it.")
 
-    # Get the linked documents
-    linked_docs_res = supabase.table("session_documents").select("document_id").eq("session_id", session_id).execute().data
-    doc_internal_ids = [doc['document_id'] for doc in linked_docs_res]
-    
-    # Get the full details of the linked documents
-    doc_details = []
-    if doc_internal_ids:
-        doc_details = supabase.table("documents").select("file_name, storage_path").in_("id", doc_internal_ids).execute().data
-
+    session = rows[0]
+    doc_details = [link['documents'] for link in session.pop('session_documents') if link.get('documents')]
     return {"session": session, "documents": doc_details}
 
 @router.post("/chat/{session_id}")
@@ -525,22 +431,28 @@ async def chat_with_session(session_id: str, request: dict, current_user: User =
     if not query:
         raise HTTPException(status_code=400, detail="Query is missing.")
 
-    # 1. Verify user owns the session
-    session = supabase.table("chat_sessions").select("id").eq("id", session_id).eq("user_id", str(current_user.id)).single().execute().data
-    if not session:
+    # 1. Verify user owns the session and get its linked documents, with their file names for
+    # the citations, in one joined query (cached for a short while between chat turns)
+    documents = await run_io(session_service.get_session_documents, session_id, str(current_user.id))
+    if documents is None:
         raise HTTPException(status_code=404, detail="Chat session not found.")
 
     # 2. Get all document IDs linked to this session
-    linked_docs_res = supabase.table("session_documents").select(
-        "documents(storage_path)" # Use a join to get the storage_path directly
-    ).eq("session_id", session_id).execute().data
-    
-    doc_ids = [doc['documents']['storage_path'] for doc in linked_docs_res if doc.get('documents')]
+    doc_ids = [doc['storage_path'] for doc in documents]
+    file_names = {doc['storage_path']: doc['file_name'] for doc in documents}
     if not doc_ids:
         return {"answer": "This chat session has no documents associated with it. Please add documents to the session to start chatting."}
 
-    # 3. Use the new multi-document retrieval service
-    context_chunks_with_meta = vector_service.retrieve_relevant_chunks_from_multiple_docs(doc_ids, query)
+    # 3. Use the new multi-document retrieval service: either one search over the session's
+    # consolidated index, or one search per document merged together.
+    context_chunks_with_meta = None
+    if SESSION_INDEX_ENABLED:
+        try:
+            context_chunks_with_meta = await session_index_service.retrieve_from_session_async(session_id, doc_ids, query)
+        except Exception as e:
+            print(f"Session index search failed for {session_id}, falling back to per-document search: {e}")
+    if context_chunks_with_meta is None:
+        context_chunks_with_meta = await vector_service.retrieve_relevant_chunks_from_multiple_docs_async(doc_ids, query)
     
     if not context_chunks_with_meta:
         return {"answer": "I could not find any relevant information across your selected documents to answer this question."}
@@ -549,8 +461,7 @@ async def chat_with_session(session_id: str, request: dict, current_user: User =
     context = ""
     citations = {}
     for chunk in context_chunks_with_meta:
-        doc_details = get_document_details([chunk['doc_id']])[0]
-        file_name = doc_details['file_name']
+        file_name = file_names[chunk['doc_id']]
         context += f"Source: {file_name}\nContent: {chunk['text']}\n\n"
         citations[file_name] = chunk['doc_id']
 
@@ -564,18 +475,22 @@ async def chat_with_session(session_id: str, request: dict, current_user: User =
     Question: {query}
     """
     
-    answer = llm_service.generate_chat_completion(prompt)
+    if request.get("stream"):
+        # Citations are known before generation starts, but are sent after the answer.
+        return stream_llm_answer(prompt, {"citations": {"citations": list(citations.keys())}})
+
+    answer = await llm_service.generate_chat_completion_async(prompt)
     return {"answer": answer, "citations": list(citations.keys())}
 
 @router.get("/documents", response_model=List[DocumentResponse])
-async def get_all_documents(current_user: User = Depends(get_current_user)):
+async def get_all_documents(current_user: User = Depends(get_current_user), supabase=Depends(get_supabase)):
     """
     Fetches all document metadata for the currently authenticated user.
     """
     try:
-        documents = supabase.table("documents").select(
+        documents = await run_io(db.execute, supabase.table("documents").select(
             "file_name, storage_path"
-        ).eq("user_id", str(current_user.id)).order("created_at", desc=True).execute()
+        ).eq("user_id", str(current_user.id)).order("created_at", desc=True))
         
         return documents.data
     except Exception as e:
@@ -583,14 +498,14 @@ async def get_all_documents(current_user: User = Depends(get_current_user)):
         raise HTTPException(status_code=500, detail="Failed to fetch documents.")
     
 @router.delete("/chat-sessions/{session_id}")
-async def delete_chat_session(session_id: str, current_user: User = Depends(get_current_user)):
+async def delete_chat_session(session_id: str, current_user: User = Depends(get_current_user), supabase=Depends(get_supabase)):
     """
     Deletes a specific chat session and its associated document links for the current user.
     """
     try:
         # 1. Verify Ownership: First, ensure the session belongs to the user making the request.
         # We perform a select before the delete to make sure we don't try to delete something that isn't ours.
-        session_to_delete = supabase.table("chat_sessions").select("id").eq("id", session_id).eq("user_id", str(current_user.id)).single().execute()
+        session_to_delete = await run_io(db.execute, supabase.table("chat_sessions").select("id").eq("id", session_id).eq("user_id", str(current_user.id)).single())
 
         if not session_to_delete.data:
             raise HTTPException(status_code=404, detail="Chat session not found or you do not have permission to delete it.")
@@ -599,7 +514,11 @@ async def delete_chat_session(session_id: str, current_user: User = Depends(get_
         # Because we set up `ON DELETE CASCADE` in our SQL schema, when we delete this
         # `chat_sessions` record, the database will automatically delete all corresponding
         # rows in the `session_documents` table.
-        supabase.table("chat_sessions").delete().eq("id", session_id).eq("user_id", str(current_user.id)).execute()
+        await run_io(db.execute, supabase.table("chat_sessions").delete().eq("id", session_id).eq("user_id", str(current_user.id)))
+
+        # 3. Remove the session's consolidated vector index, if one was built.
+        await run_io(session_index_service.delete_session, session_id)
+        session_service.invalidate_session(session_id)
 
         return {"message": "Chat session deleted successfully."}
 
@@ -609,4 +528,11 @@ async def delete_chat_session(session_id: str, current_user: User = Depends(get_
         raise HTTPException(
             status_code=500,
             detail=f"An internal server error occurred while trying to delete the chat session: {e}"
-        )
\ No newline at end of file
+        )
+
+@router.get("/metrics")
+async def get_metrics(current_user: User = Depends(get_current_user)):
+    """
+    Returns cache hit rates and the raw process-wide counters.
+    """
+    return {"caches": cache_service.stats(), "counters": metrics.snapshot()}
@@ -1,30 +1,124 @@
 # backend/app/core/auth.py (New File)
+import hashlib
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+import jwt
+from cachetools import TTLCache
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from supabase import create_client, Client
-
-from app.core.config import SUPABASE_URL, SUPABASE_SERVICE_KEY
+from gotrue.types import User
 
-# Initialize Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+from app.core import metrics
+from app.core.config import (
+    SUPABASE_URL, SUPABASE_JWT_SECRET, AUTH_TOKEN_CACHE_MAX_ENTRIES, AUTH_TOKEN_CACHE_TTL_SECONDS,
+)
+from app.core.executors import run_io
+from app.core.resources import get_supabase
 
 # This scheme will look for a token in the "Authorization: Bearer <token>" header
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+# Supabase access tokens are JWTs signed either with the project's JWT secret (HS256) or
+# with an asymmetric signing key published at the project's JWKS endpoint. Tokens are
+# verified locally whenever one of the two is available, and through a round trip to
+# Supabase Auth otherwise. Validated tokens are cached (by hash) until they expire or
+# AUTH_TOKEN_CACHE_TTL_SECONDS pass, whichever is first.
+AUDIENCE = "authenticated"
+_jwks_client = jwt.PyJWKClient(f"{SUPABASE_URL}/auth/v1/.well-known/jwks.json", cache_keys=True) if SUPABASE_URL else None
+
+_validated_tokens = TTLCache(maxsize=AUTH_TOKEN_CACHE_MAX_ENTRIES, ttl=AUTH_TOKEN_CACHE_TTL_SECONDS)  # hash -> (user, exp)
+_cache_lock = threading.Lock()
+
+
+class LocalVerificationUnavailable(Exception):
+    """Neither the JWT secret nor a published signing key can verify the token."""
+
+
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def _user_from_claims(claims: dict) -> User:
+    return User(
+        id=claims["sub"],
+        aud=claims.get("aud") or AUDIENCE,
+        role=claims.get("role"),
+        email=claims.get("email"),
+        phone=claims.get("phone"),
+        app_metadata=claims.get("app_metadata") or {},
+        user_metadata=claims.get("user_metadata") or {},
+        is_anonymous=claims.get("is_anonymous", False),
+        # Not carried by the token; the time it was issued is the closest known value.
+        created_at=datetime.fromtimestamp(claims.get("iat", 0), tz=timezone.utc),
+    )
+
+def _signing_key(token: str, algorithm: str) -> tuple:
+    """Returns the key for the token and the only algorithms it may be verified with. The
+    unverified header only picks where the key comes from; the algorithm is pinned to the key."""
+    if algorithm == "HS256":
+        if not SUPABASE_JWT_SECRET:
+            raise LocalVerificationUnavailable("SUPABASE_JWT_SECRET is not set")
+        return SUPABASE_JWT_SECRET, ["HS256"]
+    if _jwks_client is None:
+        raise LocalVerificationUnavailable("SUPABASE_URL is not set")
     try:
-        # Ask Supabase to validate the token
-        user_response = supabase.auth.get_user(token)
-        user = user_response.user
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid user token",
-            )
+        # PyJWKClient caches the key set, so this only hits the network for unknown key ids.
+        signing_key = _jwks_client.get_signing_key_from_jwt(token)
+    except jwt.PyJWKClientError as e:
+        raise LocalVerificationUnavailable(str(e))
+    return signing_key.key, [signing_key.algorithm_name]
+
+def verify_token_locally(token: str) -> dict:
+    """Checks the token's signature, expiry and audience and returns its claims. Raises
+    jwt.InvalidTokenError for a bad token, LocalVerificationUnavailable if it cannot be checked."""
+    key, algorithms = _signing_key(token, jwt.get_unverified_header(token).get("alg"))
+    return jwt.decode(token, key, algorithms=algorithms, audience=AUDIENCE, options={"require": ["exp", "sub"]})
+
+def _verify_token_remotely(token: str) -> User:
+    # Ask Supabase to validate the token (a network call)
+    user = get_supabase().auth.get_user(token).user
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid user token",
+        )
+    return user
+
+def _verify_token(token: str) -> User:
+    try:
+        claims = verify_token_locally(token)
+        metrics.increment("auth.local_verifications")
+        user, expires_at = _user_from_claims(claims), claims["exp"]
+    except LocalVerificationUnavailable:
+        metrics.increment("auth.remote_verifications")
+        user = _verify_token_remotely(token)
+        expires_at = jwt.decode(token, options={"verify_signature": False}).get("exp", time.time())
+    with _cache_lock:
+        _validated_tokens[_token_key(token)] = (user, expires_at)
+    return user
+
+def _cached_user(token: str) -> Optional[User]:
+    with _cache_lock:
+        entry = _validated_tokens.get(_token_key(token))
+    if entry is not None and entry[1] > time.time():
+        metrics.increment("auth_cache.hits")
+        return entry[0]
+    metrics.increment("auth_cache.misses")
+    return None
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    user = _cached_user(token)
+    if user is not None:
         return user
+    try:
+        # Local verification is CPU-only, except for fetching an unknown JWKS key or the
+        # remote fallback, so it runs on the I/O pool to keep the event loop free.
+        return await run_io(_verify_token, token)
     except Exception:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
-        )
\ No newline at end of file
+        )
@@ -11,4 +11,142 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY")
 PSE_API_KEY = os.getenv("PSE_API_KEY")
-PSE_CX = os.getenv("PSE_CX")
\ No newline at end of file
+PSE_CX = os.getenv("PSE_CX")
+# Local cache for per-document FAISS indexes and chunk lists
+VECTOR_CACHE_DIR = os.getenv("VECTOR_CACHE_DIR", os.path.join("data", "vector_cache"))
+VECTOR_CACHE_MAX_BYTES = int(os.getenv("VECTOR_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# Files under VECTOR_CACHE_DIR are evicted least recently used beyond this many bytes
+VECTOR_CACHE_DISK_MAX_BYTES = int(os.getenv("VECTOR_CACHE_DISK_MAX_BYTES", str(4 * 1024 * 1024 * 1024)))
+
+# Parallel multi-document retrieval
+RETRIEVAL_MAX_WORKERS = int(os.getenv("RETRIEVAL_MAX_WORKERS", "8"))
+RETRIEVAL_DOC_TIMEOUT_SECONDS = float(os.getenv("RETRIEVAL_DOC_TIMEOUT_SECONDS", "15"))
+
+# Executors used to keep blocking work off the event loop
+IO_EXECUTOR_WORKERS = int(os.getenv("IO_EXECUTOR_WORKERS", "32"))
+CPU_EXECUTOR_WORKERS = int(os.getenv("CPU_EXECUTOR_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+
+# Background ingestion pipeline for uploads
+INGEST_WORK_DIR = os.getenv("INGEST_WORK_DIR", os.path.join("data", "ingest"))
+INGEST_PROCESS_WORKERS = int(os.getenv("INGEST_PROCESS_WORKERS", "2"))
+INGEST_MAX_CONCURRENT_JOBS = int(os.getenv("INGEST_MAX_CONCURRENT_JOBS", "2"))
+INGEST_STAGE_RETRIES = int(os.getenv("INGEST_STAGE_RETRIES", "3"))
+# Finished job records, and upload files left behind by a crashed worker, are removed after this long
+INGEST_JOB_TTL_SECONDS = int(os.getenv("INGEST_JOB_TTL_SECONDS", str(24 * 60 * 60)))
+
+# LLM backend: "groq" for the real API, "fake" for a deterministic offline stand-in
+LLM_BACKEND = os.getenv("LLM_BACKEND", "groq")
+
+# Response cache in front of the LLM
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024"))
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(6 * 60 * 60)))
+LLM_SEMANTIC_CACHE_ENABLED = os.getenv("LLM_SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+LLM_SEMANTIC_CACHE_THRESHOLD = float(os.getenv("LLM_SEMANTIC_CACHE_THRESHOLD", "0.95"))
+LLM_SEMANTIC_CACHE_MAX_PER_DOC = int(os.getenv("LLM_SEMANTIC_CACHE_MAX_PER_DOC", "64"))
+
+# Embedding micro-batching
+EMBED_MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", "32"))
+EMBED_MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", "5"))
+EMBED_INGEST_SLICE_SIZE = int(os.getenv("EMBED_INGEST_SLICE_SIZE", "64"))
+
+# Memo of query text -> embedding
+QUERY_EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_EMBEDDING_CACHE_MAX_ENTRIES", "10000"))
+QUERY_EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("QUERY_EMBEDDING_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# Fixed retrieval query used by /summarize in "retrieval" mode (its embedding is precomputed at startup)
+SUMMARY_RETRIEVAL_QUERY = "Provide a comprehensive summary of this document."
+
+# Consolidated per-session vector index (one search per session chat turn)
+SESSION_INDEX_ENABLED = os.getenv("SESSION_INDEX_ENABLED", "false").lower() == "true"
+SESSION_INDEX_CACHE_SIZE = int(os.getenv("SESSION_INDEX_CACHE_SIZE", "64"))
+
+# Per-document index type, chosen from the chunk count (Flat -> HNSW -> IVF-PQ)
+INDEX_FLAT_MAX_VECTORS = int(os.getenv("INDEX_FLAT_MAX_VECTORS", "2000"))
+INDEX_HNSW_MAX_VECTORS = int(os.getenv("INDEX_HNSW_MAX_VECTORS", "50000"))
+INDEX_HNSW_M = int(os.getenv("INDEX_HNSW_M", "32"))
+INDEX_HNSW_EF_CONSTRUCTION = int(os.getenv("INDEX_HNSW_EF_CONSTRUCTION", "80"))
+INDEX_HNSW_EF_SEARCH = int(os.getenv("INDEX_HNSW_EF_SEARCH", "64"))
+INDEX_IVF_NPROBE = int(os.getenv("INDEX_IVF_NPROBE", "16"))
+INDEX_PQ_M = int(os.getenv("INDEX_PQ_M", "48"))  # must divide the embedding dimension (384)
+
+# Binary chunk store: compress each block of chunk text with zlib
+CHUNK_STORE_COMPRESS = os.getenv("CHUNK_STORE_COMPRESS", "true").lower() == "true"
+
+# Open cached per-document indexes with FAISS's mmap IO flag, so worker processes share page-cached copies
+INDEX_MMAP_ENABLED = os.getenv("INDEX_MMAP_ENABLED", "true").lower() == "true"
+
+# Page-parallel PDF extraction (page ranges are spread over the ingestion worker processes)
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "32"))
+
+# Token-aware chunking (all-MiniLM-L6-v2 truncates its input at 256 word pieces)
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "240"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "40"))
+# A sentence too long for one chunk is split into pieces; a last piece that would add fewer
+# new tokens than this is extended back into the one before it instead
+CHUNK_MIN_TOKENS = int(os.getenv("CHUNK_MIN_TOKENS", "60"))
+
+# Content-addressed storage: per-chunk embeddings shared across documents, keyed by chunk hash
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join("data", "embedding_cache.sqlite3"))
+
+# A replaced document moves to a new blob; workers re-resolve doc_id -> blob after this long
+ARTIFACT_PREFIX_TTL_SECONDS = int(os.getenv("ARTIFACT_PREFIX_TTL_SECONDS", "60"))
+
+# Hierarchical (map-reduce) summaries of whole documents
+SUMMARY_CACHE_DIR = os.getenv("SUMMARY_CACHE_DIR", os.path.join("data", "summary_cache"))
+SUMMARY_CACHE_MAX_BYTES = int(os.getenv("SUMMARY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))  # evicted LRU beyond this
+SUMMARY_GROUP_CHUNKS = int(os.getenv("SUMMARY_GROUP_CHUNKS", "8"))  # average chunks per map group
+SUMMARY_REDUCE_FANOUT = int(os.getenv("SUMMARY_REDUCE_FANOUT", "8"))  # average summaries per reduce group
+SUMMARY_MAX_CONCURRENCY = int(os.getenv("SUMMARY_MAX_CONCURRENCY", "4"))  # LLM calls in flight
+
+# Stored per-document study artifacts (summary, overview mind map, quiz pool)
+PRECOMPUTE_STUDY_ARTIFACTS = os.getenv("PRECOMPUTE_STUDY_ARTIFACTS", "false").lower() == "true"  # generate them at ingest
+QUIZ_POOL_SIZE = int(os.getenv("QUIZ_POOL_SIZE", "20"))
+QUIZ_POOL_CONTEXT_CHUNKS = int(os.getenv("QUIZ_POOL_CONTEXT_CHUNKS", "30"))
+
+# Short-lived cache of a chat session's owner and linked documents
+SESSION_METADATA_CACHE_SIZE = int(os.getenv("SESSION_METADATA_CACHE_SIZE", "1024"))
+SESSION_METADATA_TTL_SECONDS = int(os.getenv("SESSION_METADATA_TTL_SECONDS", "30"))
+
+# Local JWT verification in get_current_user (HS256 tokens with the project's JWT secret,
+# asymmetric ones against the project's JWKS), with a cache of validated tokens
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+AUTH_TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_TOKEN_CACHE_MAX_ENTRIES", "10000"))
+AUTH_TOKEN_CACHE_TTL_SECONDS = int(os.getenv("AUTH_TOKEN_CACHE_TTL_SECONDS", "300"))
+
+# Shared clients and models are created on first use. Names listed here (comma-separated:
+# supabase, embedding_model, groq, async_groq) are loaded in the background at startup instead.
+# The embedding model is by default, so the summary query embedding is also computed up front.
+RESOURCE_PREWARM = [name.strip() for name in os.getenv("RESOURCE_PREWARM", "embedding_model").split(",") if name.strip()]
+
+# Connection pools of the shared HTTP clients (Groq), and the Supabase request timeouts
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", "30"))
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "5"))
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "60"))
+SUPABASE_TIMEOUT_SECONDS = int(os.getenv("SUPABASE_TIMEOUT_SECONDS", "30"))
+
+# Retries with jittered exponential backoff, and a circuit breaker per dependency (storage, db, llm)
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BASE_DELAY_SECONDS = float(os.getenv("RETRY_BASE_DELAY_SECONDS", "0.2"))
+RETRY_MAX_DELAY_SECONDS = float(os.getenv("RETRY_MAX_DELAY_SECONDS", "5"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+# Recommendation (YouTube / Custom Search) responses, per normalised topic: fresh for the TTL,
+# then served stale for up to RECOMMENDATION_STALE_SECONDS more while they are refreshed
+RECOMMENDATION_CACHE_MAX_ENTRIES = int(os.getenv("RECOMMENDATION_CACHE_MAX_ENTRIES", "2048"))
+RECOMMENDATION_CACHE_TTL_SECONDS = int(os.getenv("RECOMMENDATION_CACHE_TTL_SECONDS", str(24 * 60 * 60)))
+RECOMMENDATION_STALE_SECONDS = int(os.getenv("RECOMMENDATION_STALE_SECONDS", str(7 * 24 * 60 * 60)))
+
+# Hybrid retrieval: a per-document BM25 index fused with the vector search (reciprocal rank fusion)
+HYBRID_RETRIEVAL_ENABLED = os.getenv("HYBRID_RETRIEVAL_ENABLED", "true").lower() == "true"
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "50"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+LEXICAL_CACHE_MAX_BYTES = int(os.getenv("LEXICAL_CACHE_MAX_BYTES", str(128 * 1024 * 1024)))
+
+# Context assembly before prompting: retrieved chunks that overlap their neighbours are merged,
+# near-duplicates (embedding cosine similarity >= threshold) dropped, and the rest packed into
+# the token budget by relevance
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.95"))
@@ -0,0 +1,14 @@
+# backend/app/core/db.py
+from app.core import metrics
+from app.core.resilience import db_breaker, is_connect_error, is_transient
+
+# PostgREST methods that are safe to repeat after a timeout or 5xx, when the first attempt may
+# have been applied. Writes are only retried when the request was never sent.
+_IDEMPOTENT_METHODS = {"GET", "HEAD"}
+
+def execute(query):
+    """Runs a Supabase (PostgREST) query builder. Every database round trip goes through here,
+    so the db.requests counter is the number of queries made (e.g. per chat turn in tests)."""
+    metrics.increment("db.requests")
+    idempotent = getattr(query, "http_method", "").upper() in _IDEMPOTENT_METHODS
+    return db_breaker.call(query.execute, retry_if=is_transient if idempotent else is_connect_error)
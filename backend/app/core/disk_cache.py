@@ -0,0 +1,69 @@
+# backend/app/core/disk_cache.py
+import os
+import threading
+from typing import Optional
+
+from app.core import metrics
+
+# Byte budget for a directory of cached files, evicted least recently used first. Recency is
+# the file's mtime: writers create files, and readers call touch() on a hit. The directory's
+# size is estimated from what this process added since it last scanned the directory, so the
+# directory is only walked when the estimate exceeds the budget (other workers on the host
+# add files too, which the scan then accounts for).
+
+
+class DiskBudget:
+    def __init__(self, name: str, directory: str, max_bytes: int, low_water: float = 0.9):
+        self.name = name
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # Eviction frees space down to this fraction of the budget, so that it does not run
+        # again on the very next write.
+        self.low_water = low_water
+        self._estimate: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def touch(self, path: str):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _files(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(".tmp"):
+                    # Still being written.
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield stat.st_mtime, stat.st_size, path
+
+    def added(self, nbytes: int):
+        """Accounts for nbytes just written under the directory, evicting if over budget."""
+        with self._lock:
+            if self._estimate is None:
+                self._estimate = sum(size for _, size, _ in self._files())
+            else:
+                self._estimate += nbytes
+            if self._estimate > self.max_bytes:
+                self._estimate = self._evict()
+
+    def _evict(self) -> int:
+        files = sorted(self._files())
+        total = sum(size for _, size, _ in files)
+        target = self.max_bytes * self.low_water
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # e.g. a file another process holds open on Windows; it goes next time.
+                continue
+            total -= size
+            metrics.increment(f"{self.name}.disk_evictions")
+        return total
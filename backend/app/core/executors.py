@@ -0,0 +1,23 @@
+# backend/app/core/executors.py
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core.config import IO_EXECUTOR_WORKERS, CPU_EXECUTOR_WORKERS
+
+# Blocking network calls (Supabase, Google APIs) spend their time waiting, so this pool is wide.
+io_executor = ThreadPoolExecutor(max_workers=IO_EXECUTOR_WORKERS, thread_name_prefix="io")
+
+# Embedding, FAISS search and document parsing are CPU-bound and already use several cores
+# internally, so only a few of them should run at once.
+cpu_executor = ThreadPoolExecutor(max_workers=CPU_EXECUTOR_WORKERS, thread_name_prefix="cpu")
+
+async def run_io(func, *args, **kwargs):
+    """Runs a blocking I/O call on the I/O pool without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_executor, functools.partial(func, *args, **kwargs))
+
+async def run_cpu(func, *args, **kwargs):
+    """Runs a CPU-bound call on the CPU pool without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(cpu_executor, functools.partial(func, *args, **kwargs))
@@ -0,0 +1,48 @@
+# backend/app/core/metrics.py
+import threading
+from collections import defaultdict
+
+# Process-wide counters (cache hits/misses, request counts, ...). Hooks registered with
+# add_hook are called on every increment, e.g. to forward the numbers to a metrics backend.
+_counters = defaultdict(int)
+_hooks = []
+_lock = threading.Lock()
+
+def add_hook(hook):
+    """Registers hook(name, value), called after every increment."""
+    _hooks.append(hook)
+
+def increment(name: str, value: int = 1):
+    with _lock:
+        _counters[name] += value
+    for hook in _hooks:
+        try:
+            hook(name, value)
+        except Exception as e:
+            print(f"Metrics hook failed for {name}: {e}")
+
+def observe(name: str, value: int, bounds=(0, 50, 100, 250, 500, 1000, 2000, 4000)):
+    """Records one observation in a cumulative histogram made of counters: '{name}.count',
+    '{name}.sum', and '{name}.le_{bound}' for every bound the value does not exceed."""
+    increment(f"{name}.count")
+    increment(f"{name}.sum", value)
+    for bound in bounds:
+        if value <= bound:
+            increment(f"{name}.le_{bound}")
+
+def get(name: str) -> int:
+    with _lock:
+        return _counters.get(name, 0)
+
+def snapshot() -> dict:
+    with _lock:
+        return dict(_counters)
+
+def hit_rate(prefix: str) -> float:
+    """Hit rate for counters named '{prefix}.hits' and '{prefix}.misses'."""
+    hits, misses = get(f"{prefix}.hits"), get(f"{prefix}.misses")
+    return hits / (hits + misses) if hits + misses else 0.0
+
+def reset():
+    with _lock:
+        _counters.clear()
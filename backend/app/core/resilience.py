@@ -0,0 +1,147 @@
+# backend/app/core/resilience.py
+import asyncio
+import random
+import threading
+import time
+
+import httpx
+
+from app.core import metrics
+from app.core.config import (
+    RETRY_MAX_ATTEMPTS, RETRY_BASE_DELAY_SECONDS, RETRY_MAX_DELAY_SECONDS,
+    CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS,
+)
+
+# Retries with jittered exponential backoff, behind one circuit breaker per dependency.
+# Only transient failures (network errors, timeouts, 408/429/5xx responses) are retried and
+# count towards opening a breaker; any other error means the dependency answered, so it is
+# raised at once. While a breaker is open, calls fail fast with CircuitOpenError instead of
+# piling up on a dependency that is down; after CIRCUIT_RESET_SECONDS one trial call is let
+# through, and closes the breaker again if it succeeds.
+
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit breaker is open."""
+
+
+def _status_code(exc: Exception):
+    # httpx and Groq errors carry status_code, storage3 errors status, and PostgREST errors
+    # the HTTP status as their code when the response was not a PostgREST error body.
+    response = getattr(exc, "response", None)
+    for value in (getattr(exc, "status_code", None), getattr(exc, "status", None),
+                  getattr(exc, "code", None), getattr(response, "status_code", None)):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+def is_transient(exc: Exception) -> bool:
+    """Whether exc is worth retrying: a network error or timeout, or a 408/429/5xx response."""
+    if isinstance(exc, httpx.TransportError) or isinstance(exc.__cause__, httpx.TransportError):
+        return True
+    return _status_code(exc) in RETRYABLE_STATUS_CODES
+
+def is_connect_error(exc: Exception) -> bool:
+    """Whether exc happened before the request was sent, so even a non-idempotent one can be retried."""
+    connect_errors = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+    return isinstance(exc, connect_errors) or isinstance(exc.__cause__, connect_errors)
+
+def backoff_delay(attempt: int) -> float:
+    """'Full jitter' backoff: uniform in [0, min(max delay, base * 2^(attempt - 1))]."""
+    return random.uniform(0, min(RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_seconds: float = CIRCUIT_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at = None
+        # When the current half-open trial call started. A trial that never reports back
+        # (e.g. a cancelled request) stops blocking new ones after reset_seconds.
+        self._trial_started = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self._opened_at >= self.reset_seconds else "open"
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            now = time.monotonic()
+            trial_pending = self._trial_started is not None and now - self._trial_started < self.reset_seconds
+            if now - self._opened_at >= self.reset_seconds and not trial_pending:
+                self._trial_started = now
+                return
+        metrics.increment(f"{self.name}.circuit_rejections")
+        raise CircuitOpenError(f"Circuit breaker '{self.name}' is open")
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._opened_at is None and self._failures >= self.failure_threshold:
+                metrics.increment(f"{self.name}.circuit_opened")
+                self._opened_at = time.monotonic()
+            elif self._trial_started is not None:
+                # The trial call failed: stay open for another reset period.
+                self._opened_at = time.monotonic()
+                self._trial_started = None
+
+    def _outcome(self, exc: Exception, retry_if) -> bool:
+        """Records a failed call and returns whether it may be retried."""
+        if not is_transient(exc):
+            # The dependency answered (e.g. 404 or a constraint violation); it is healthy.
+            self.record_success()
+            return False
+        self.record_failure()
+        return retry_if(exc)
+
+    def call(self, func, *args, retry_if=is_transient, attempts: int = RETRY_MAX_ATTEMPTS, **kwargs):
+        """Calls func(*args, **kwargs), retrying failures that retry_if accepts."""
+        for attempt in range(1, attempts + 1):
+            self.before_call()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if not self._outcome(e, retry_if) or attempt == attempts:
+                    raise
+                metrics.increment(f"{self.name}.retries")
+                time.sleep(backoff_delay(attempt))
+                continue
+            self.record_success()
+            return result
+
+    async def call_async(self, func, *args, retry_if=is_transient, attempts: int = RETRY_MAX_ATTEMPTS, **kwargs):
+        """Awaits func(*args, **kwargs), retrying failures that retry_if accepts."""
+        for attempt in range(1, attempts + 1):
+            self.before_call()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                if not self._outcome(e, retry_if) or attempt == attempts:
+                    raise
+                metrics.increment(f"{self.name}.retries")
+                await asyncio.sleep(backoff_delay(attempt))
+                continue
+            self.record_success()
+            return result
+
+
+storage_breaker = CircuitBreaker("storage")
+db_breaker = CircuitBreaker("db")
+llm_breaker = CircuitBreaker("llm")
@@ -0,0 +1,137 @@
+# backend/app/core/resources.py
+import inspect
+import threading
+import time
+from typing import Callable, Iterable
+
+from app.core.config import (
+    SUPABASE_URL, SUPABASE_SERVICE_KEY, GROQ_API_KEY, EMBEDDING_MODEL, SUPABASE_TIMEOUT_SECONDS,
+    HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS, HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    HTTP_CONNECT_TIMEOUT_SECONDS, HTTP_TIMEOUT_SECONDS,
+)
+
+# Registry of the process-wide clients and models. Each resource is created on first use
+# (or by prewarm, in the background) and then shared, so a worker starts serving requests
+# without loading torch or the embedding model, and routes that need none of these never
+# pay for them. The get_* functions below can also be used as FastAPI dependencies.
+
+
+class ResourceRegistry:
+    def __init__(self):
+        self._factories: dict[str, Callable] = {}
+        self._resources: dict = {}
+        self._locks: dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, factory: Callable):
+        self._factories[name] = factory
+        self._locks[name] = threading.Lock()
+
+    def get(self, name: str):
+        resource = self._resources.get(name)
+        if resource is not None:
+            return resource
+        # One lock per resource: loading the embedding model must not hold up the first
+        # request that only needs the Supabase client.
+        with self._locks[name]:
+            resource = self._resources.get(name)
+            if resource is None:
+                started = time.perf_counter()
+                resource = self._factories[name]()
+                print(f"Loaded resource '{name}' in {time.perf_counter() - started:.2f}s")
+                with self._lock:
+                    self._resources[name] = resource
+        return resource
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._resources
+
+    def prewarm(self, names: Iterable[str]) -> threading.Thread:
+        """Creates the named resources on a background thread and returns that thread."""
+        def load_all():
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception as e:
+                    print(f"Warning: Could not prewarm resource '{name}'. Error: {e}")
+
+        thread = threading.Thread(target=load_all, name="resource-prewarm", daemon=True)
+        thread.start()
+        return thread
+
+    async def close(self):
+        """Closes the resources that hold connections (called on application shutdown)."""
+        with self._lock:
+            resources, self._resources = self._resources, {}
+        for name, resource in resources.items():
+            # httpx.AsyncClient closes with aclose(); the other clients with close().
+            close = getattr(resource, "aclose", None) or getattr(resource, "close", None)
+            if callable(close):
+                try:
+                    result = close()
+                    if inspect.isawaitable(result):
+                        await result
+                except Exception as e:
+                    print(f"Warning: Could not close resource '{name}'. Error: {e}")
+
+
+def _create_supabase():
+    # supabase-py keeps one keep-alive (HTTP/2) session per service (PostgREST, Storage), so
+    # sharing this one client is what pools the connections.
+    from supabase import ClientOptions, create_client
+    options = ClientOptions(postgrest_client_timeout=SUPABASE_TIMEOUT_SECONDS, storage_client_timeout=SUPABASE_TIMEOUT_SECONDS)
+    return create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY, options=options)
+
+def _http_client_options() -> dict:
+    import httpx
+    return {
+        "http2": True,
+        "limits": httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        "timeout": httpx.Timeout(HTTP_TIMEOUT_SECONDS, connect=HTTP_CONNECT_TIMEOUT_SECONDS),
+    }
+
+def _create_http_client():
+    import httpx
+    return httpx.Client(**_http_client_options())
+
+def _create_async_http_client():
+    import httpx
+    return httpx.AsyncClient(**_http_client_options())
+
+def _load_embedding_model():
+    # Importing sentence_transformers pulls in torch, which alone takes seconds.
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(EMBEDDING_MODEL)
+
+def _create_async_groq():
+    from groq import AsyncGroq
+    # Retries are left to app.core.resilience, so they are counted against the circuit breaker.
+    return AsyncGroq(api_key=GROQ_API_KEY, http_client=get_async_http_client(), max_retries=0)
+
+
+registry = ResourceRegistry()
+registry.register("supabase", _create_supabase)
+registry.register("http", _create_http_client)
+registry.register("async_http", _create_async_http_client)
+registry.register("embedding_model", _load_embedding_model)
+registry.register("async_groq", _create_async_groq)
+
+def get_supabase():
+    return registry.get("supabase")
+
+def get_http_client():
+    """The shared keep-alive HTTP/2 client for outbound API calls."""
+    return registry.get("http")
+
+def get_async_http_client():
+    return registry.get("async_http")
+
+def get_embedding_model():
+    return registry.get("embedding_model")
+
+def get_async_groq():
+    return registry.get("async_groq")
@@ -0,0 +1,57 @@
+# backend/app/core/storage.py
+import time
+from typing import Optional
+
+from app.core import metrics
+from app.core.config import SUPABASE_URL, SUPABASE_SERVICE_KEY
+from app.core.resilience import storage_breaker
+from app.core.resources import get_http_client, get_supabase
+
+# Supabase Storage calls on the "files" bucket. Like app.core.db, every round trip goes
+# through here (counted as storage.requests) and is retried on transient failures; all of
+# them are idempotent, as uploads overwrite.
+BUCKET_NAME = "files"
+
+def _bucket():
+    return get_supabase().storage.from_(BUCKET_NAME)
+
+def _call(method: str, *args, **kwargs):
+    metrics.increment("storage.requests")
+    return storage_breaker.call(lambda: getattr(_bucket(), method)(*args, **kwargs))
+
+def upload(path: str, data: bytes, content_type: str = "application/octet-stream"):
+    return _call("upload", file=data, path=path, file_options={"content-type": content_type, "upsert": "true"})
+
+def _download_by(path: str, deadline: float) -> bytes:
+    # The storage client only has a client-wide timeout, so a download bounded by its
+    # caller's deadline goes to the same REST endpoint through the shared HTTP client.
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise TimeoutError(f"No time left to download {path}")
+    response = get_http_client().get(
+        f"{SUPABASE_URL}/storage/v1/object/{BUCKET_NAME}/{path}",
+        headers={"Authorization": f"Bearer {SUPABASE_SERVICE_KEY}", "apikey": SUPABASE_SERVICE_KEY},
+        timeout=remaining,
+    )
+    response.raise_for_status()
+    return response.content
+
+def download(path: str, deadline: Optional[float] = None) -> bytes:
+    """Downloads path. With a deadline (a time.monotonic() value), every attempt only gets the
+    time left before it, and TimeoutError is raised once none is left."""
+    if deadline is None:
+        return _call("download", path=path)
+    metrics.increment("storage.requests")
+    return storage_breaker.call(_download_by, path, deadline)
+
+def list_files(path: str) -> list:
+    return _call("list", path=path) or []
+
+def remove(paths: list[str]):
+    return _call("remove", paths)
+
+def remove_folder(path: str):
+    """Removes every file directly under path ("{prefix}/"); storage has no folder delete."""
+    names = [f["name"] for f in list_files(path)]
+    if names:
+        remove([f"{path}{name}" for name in names])
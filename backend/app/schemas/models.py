@@ -1,16 +1,35 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
 import uuid
-from typing import List
+from typing import List, Literal
 
 class ChatRequest(BaseModel):
     doc_id: str
     query: str
+    # When true, /chat and /summarize stream the answer as Server-Sent Events
+    stream: bool = False
+
+class SummarizeRequest(BaseModel):
+    doc_id: str
+    # "retrieval" summarises the chunks most similar to a generic summary query (fast);
+    # "full" summarises every chunk hierarchically (map-reduce)
+    mode: Literal["retrieval", "full"] = "retrieval"
+    stream: bool = False
+    # Regenerate instead of serving the stored whole-document summary ("full" mode)
+    refresh: bool = False
+
+class MindMapRequest(BaseModel):
+    doc_id: str
+    # Central topic; when empty, the document's stored overview mind map is served
+    query: str = ""
+    refresh: bool = False
 
 class QuizRequest(BaseModel):
     doc_id: str
     # Add a default value and validation using Field
     num_questions: int = Field(default=5, ge=1, le=10)
+    # Regenerate the document's stored question pool before sampling from it
+    refresh: bool = False
     
 class RecommendationRequest(BaseModel):
     doc_id: str
@@ -0,0 +1,92 @@
+# backend/app/services/cache_service.py
+import hashlib
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+import numpy as np
+from cachetools import TTLCache
+
+from app.core import metrics
+from app.core.config import (
+    MODEL_NAME, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL_SECONDS, LLM_SEMANTIC_CACHE_ENABLED,
+    LLM_SEMANTIC_CACHE_THRESHOLD, LLM_SEMANTIC_CACHE_MAX_PER_DOC,
+)
+
+# Exact tier: sha256(model + prompt) -> completion. /summarize and /quiz build the same
+# prompt for the same document every time, so repeated clicks are served from here.
+_response_cache = TTLCache(maxsize=LLM_CACHE_MAX_ENTRIES, ttl=LLM_CACHE_TTL_SECONDS)
+
+# Semantic tier: artifact prefix -> recent (normalised query embedding, answer, expiry) entries
+# for /chat, so a rephrased question about the same document reuses the earlier answer. The
+# prefix names the document's content (its blob), so once a document is replaced every worker
+# looks its answers up under the new prefix, and entries for the old content are never read.
+_semantic_cache = TTLCache(maxsize=LLM_CACHE_MAX_ENTRIES, ttl=LLM_CACHE_TTL_SECONDS)
+
+_lock = threading.Lock()
+
+def _prompt_key(prompt: str) -> str:
+    return hashlib.sha256(f"{MODEL_NAME}\0{prompt}".encode("utf-8")).hexdigest()
+
+def get_response(prompt: str) -> Optional[str]:
+    with _lock:
+        answer = _response_cache.get(_prompt_key(prompt))
+    metrics.increment("llm_cache.hits" if answer is not None else "llm_cache.misses")
+    return answer
+
+def set_response(prompt: str, answer: str):
+    with _lock:
+        _response_cache[_prompt_key(prompt)] = answer
+
+def _normalize(vector: np.ndarray) -> np.ndarray:
+    vector = np.asarray(vector, dtype="float32").reshape(-1)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def get_semantic_response(prefix: str, query_vector: np.ndarray) -> Optional[str]:
+    if not LLM_SEMANTIC_CACHE_ENABLED:
+        return None
+    query_vector = _normalize(query_vector)
+    now = time.monotonic()
+    best_answer, best_similarity = None, LLM_SEMANTIC_CACHE_THRESHOLD
+    with _lock:
+        for cached_vector, answer, expires_at in _semantic_cache.get(prefix, ()):
+            similarity = float(np.dot(cached_vector, query_vector))
+            if expires_at > now and similarity >= best_similarity:
+                best_answer, best_similarity = answer, similarity
+    metrics.increment("semantic_cache.hits" if best_answer is not None else "semantic_cache.misses")
+    return best_answer
+
+def set_semantic_response(prefix: str, query_vector: np.ndarray, answer: str):
+    if not LLM_SEMANTIC_CACHE_ENABLED:
+        return
+    entry = (_normalize(query_vector), answer, time.monotonic() + LLM_CACHE_TTL_SECONDS)
+    with _lock:
+        entries = _semantic_cache.get(prefix)
+        if entries is None:
+            entries = deque(maxlen=LLM_SEMANTIC_CACHE_MAX_PER_DOC)
+        entries.append(entry)
+        _semantic_cache[prefix] = entries
+
+def invalidate_artifacts(prefix: str):
+    # Exact-tier entries embed the document text in their key, so only the semantic tier
+    # holds answers for a prefix; dropping them just frees the space early.
+    with _lock:
+        _semantic_cache.pop(prefix, None)
+
+def stats() -> dict:
+    return {
+        "llm_cache": {
+            "hits": metrics.get("llm_cache.hits"),
+            "misses": metrics.get("llm_cache.misses"),
+            "hit_rate": metrics.hit_rate("llm_cache"),
+            "entries": len(_response_cache),
+        },
+        "semantic_cache": {
+            "hits": metrics.get("semantic_cache.hits"),
+            "misses": metrics.get("semantic_cache.misses"),
+            "hit_rate": metrics.hit_rate("semantic_cache"),
+            "documents": len(_semantic_cache),
+        },
+    }
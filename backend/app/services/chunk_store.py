@@ -0,0 +1,187 @@
+# backend/app/services/chunk_store.py
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import zlib
+from typing import Optional
+
+from cachetools import LRUCache
+
+# Binary chunk store ("chunks.bin"), replacing the "\n---\n"-joined chunks.txt.
+#
+#   header       MAGIC | version u16 | flags u16 | chunk_count u32 | block_count u32 | metadata_length u64
+#   block table  block_count x (offset u64, stored_length u32, raw_length u32)
+#   chunk table  chunk_count x (block u32, offset_in_block u32, length u32)
+#   metadata     JSON list with one dict per chunk (page range, char offsets, ...)
+#   blocks       UTF-8 chunk text, grouped into blocks of ~BLOCK_SIZE bytes
+#
+# Block offsets are relative to the start of the blocks section. With FLAG_COMPRESSED the
+# metadata and each block are zlib-compressed independently, so reading one chunk only
+# inflates its own block. Without it, a chunk is a direct slice of the memory-mapped file.
+MAGIC = b"SHCK"
+VERSION = 1
+FLAG_COMPRESSED = 1
+BLOCK_SIZE = 64 * 1024
+
+_HEADER = struct.Struct("<4sHHIIQ")
+_BLOCK_ENTRY = struct.Struct("<QII")
+_CHUNK_ENTRY = struct.Struct("<III")
+
+LEGACY_SEPARATOR = "\n---\n"
+
+
+class ChunkStoreWriter:
+    """Writes a chunk store incrementally: chunks are appended one at a time and only the
+    current block is held in memory; finished blocks go to a temporary file."""
+
+    def __init__(self, path: str, compress: bool = True):
+        self.path = path
+        self.compress = compress
+        self._blocks_file = tempfile.TemporaryFile()
+        self._block_entries = []
+        self._chunk_entries = []
+        self._metadata = []
+        self._block = bytearray()
+        self._blocks_length = 0
+
+    def add(self, text: str, metadata: Optional[dict] = None):
+        data = text.encode("utf-8")
+        self._chunk_entries.append((len(self._block_entries), len(self._block), len(data)))
+        self._metadata.append(metadata or {})
+        self._block += data
+        if len(self._block) >= BLOCK_SIZE:
+            self._flush_block()
+
+    def __len__(self) -> int:
+        return len(self._chunk_entries)
+
+    def _flush_block(self):
+        if not self._block:
+            return
+        stored = zlib.compress(bytes(self._block)) if self.compress else bytes(self._block)
+        self._blocks_file.write(stored)
+        self._block_entries.append((self._blocks_length, len(stored), len(self._block)))
+        self._blocks_length += len(stored)
+        self._block = bytearray()
+
+    def close(self):
+        self._flush_block()
+        metadata = json.dumps(self._metadata, separators=(",", ":")).encode("utf-8")
+        if self.compress:
+            metadata = zlib.compress(metadata)
+        flags = FLAG_COMPRESSED if self.compress else 0
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, flags, len(self._chunk_entries), len(self._block_entries), len(metadata)))
+            for entry in self._block_entries:
+                f.write(_BLOCK_ENTRY.pack(*entry))
+            for entry in self._chunk_entries:
+                f.write(_CHUNK_ENTRY.pack(*entry))
+            f.write(metadata)
+            self._blocks_file.seek(0)
+            while True:
+                data = self._blocks_file.read(1024 * 1024)
+                if not data:
+                    break
+                f.write(data)
+        self._blocks_file.close()
+        os.replace(tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._blocks_file.close()
+
+
+class ChunkStoreReader:
+    """Random access to the chunks of a chunk store file through mmap."""
+
+    def __init__(self, path: str, block_cache_size: int = 8):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, flags, chunk_count, block_count, metadata_length = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} chunk store.")
+        self.compressed = bool(flags & FLAG_COMPRESSED)
+        self._chunk_count = chunk_count
+
+        position = _HEADER.size
+        self._blocks = [_BLOCK_ENTRY.unpack_from(self._mmap, position + i * _BLOCK_ENTRY.size) for i in range(block_count)]
+        self._chunk_table_offset = position + block_count * _BLOCK_ENTRY.size
+        self._metadata_offset = self._chunk_table_offset + chunk_count * _CHUNK_ENTRY.size
+        self._metadata_length = metadata_length
+        self._blocks_offset = self._metadata_offset + metadata_length
+        self._metadata = None
+        self._block_cache = LRUCache(maxsize=block_cache_size)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._chunk_count
+
+    def _read_block(self, block: int) -> bytes:
+        offset, stored_length, _ = self._blocks[block]
+        start = self._blocks_offset + offset
+        if not self.compressed:
+            return self._mmap[start:start + stored_length]
+        with self._lock:
+            data = self._block_cache.get(block)
+        if data is None:
+            data = zlib.decompress(self._mmap[start:start + stored_length])
+            with self._lock:
+                self._block_cache[block] = data
+        return data
+
+    def __getitem__(self, i: int) -> str:
+        if not 0 <= i < self._chunk_count:
+            raise IndexError(i)
+        block, offset, length = _CHUNK_ENTRY.unpack_from(self._mmap, self._chunk_table_offset + i * _CHUNK_ENTRY.size)
+        if not self.compressed:
+            start = self._blocks_offset + self._blocks[block][0] + offset
+            return self._mmap[start:start + length].decode("utf-8")
+        return self._read_block(block)[offset:offset + length].decode("utf-8")
+
+    def __iter__(self):
+        for i in range(self._chunk_count):
+            yield self[i]
+
+    def metadata(self, i: int) -> dict:
+        if self._metadata is None:
+            data = self._mmap[self._metadata_offset:self._metadata_offset + self._metadata_length]
+            self._metadata = json.loads(zlib.decompress(data) if self.compressed else data)
+        return self._metadata[i]
+
+
+class LegacyChunkReader:
+    """Same interface as ChunkStoreReader for documents stored before chunks.bin existed."""
+
+    def __init__(self, path: str):
+        with open(path, "r", encoding="utf-8") as f:
+            self._chunks = f.read().strip().split(LEGACY_SEPARATOR)
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    def __getitem__(self, i: int) -> str:
+        return self._chunks[i]
+
+    def __iter__(self):
+        return iter(self._chunks)
+
+    def metadata(self, i: int) -> dict:
+        return {}
+
+
+def open_chunks(path: str):
+    """Opens a chunk store, or a legacy chunks.txt file, by looking at its first bytes."""
+    with open(path, "rb") as f:
+        is_chunk_store = f.read(len(MAGIC)) == MAGIC
+    return ChunkStoreReader(path) if is_chunk_store else LegacyChunkReader(path)
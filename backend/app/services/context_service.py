@@ -0,0 +1,130 @@
+# backend/app/services/context_service.py
+from typing import List, Optional
+
+import numpy as np
+
+from app.core import metrics
+from app.core.config import CONTEXT_TOKEN_BUDGET, CONTEXT_DEDUP_THRESHOLD
+from app.core.executors import run_cpu
+from app.services import vector_service
+
+# Context assembly: turns retrieved chunk records (vector_service.retrieve_chunk_records_async
+# or chunk_records, best first) into the context text of a prompt.
+#   1. near-duplicates are dropped: a chunk whose embedding has cosine similarity of at least
+#      CONTEXT_DEDUP_THRESHOLD with a better-ranked chunk adds nothing to the prompt;
+#   2. chunks that are neighbours in the document are merged into one passage, with the
+#      text they share through the chunker's overlap included once;
+#   3. passages are packed into the token budget in order of relevance (best chunk first),
+#      and written out in document order.
+# The prompt tokens and the tokens saved against plain concatenation are recorded per request
+# in the context.* metrics (totals and histograms).
+
+SEPARATOR = "\n\n"
+# Without char offsets (documents chunked before they were stored), neighbouring chunks are
+# only merged when their texts visibly overlap by at least this much, on whole words.
+MIN_TEXT_OVERLAP = 20
+
+def _token_count(record: dict) -> int:
+    return record.get("token_count") or vector_service.count_tokens(record["text"])
+
+def _record_vectors(records: List[dict]) -> Optional[np.ndarray]:
+    doc_ids = {record.get("doc_id") for record in records}
+    if len(doc_ids) != 1 or None in doc_ids:
+        return None
+    hashes = [record.get("hash") or vector_service.chunk_hash(record["text"]) for record in records]
+    try:
+        return vector_service.chunk_vectors(doc_ids.pop(), [record["position"] for record in records], hashes)
+    except Exception as e:
+        print(f"Warning: Could not get chunk vectors for deduplication. Error: {e}")
+        return None
+
+def _drop_near_duplicates(records: List[dict]) -> List[dict]:
+    if len(records) < 2:
+        return records
+    vectors = _record_vectors(records)
+    if vectors is None:
+        # Deduplication is an optimisation; without vectors the chunks are all kept.
+        metrics.increment("context.dedup_skipped")
+        return records
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    kept = []
+    for i in range(len(records)):
+        if kept and float(np.max(vectors[kept] @ vectors[i])) >= CONTEXT_DEDUP_THRESHOLD:
+            continue
+        kept.append(i)
+    metrics.increment("context.duplicates_dropped", len(records) - len(kept))
+    return [records[i] for i in kept]
+
+def _word_overlap(a: str, b: str, min_chars: int) -> int:
+    """Length of the longest suffix of a, of at least min_chars, that starts b and both starts
+    and ends on a word boundary; 0 if there is none."""
+    for p in range(max(0, len(a) - len(b)), len(a) - max(1, min_chars) + 1):
+        if (p > 0 and not a[p - 1].isspace()) or a[p].isspace() or not b.startswith(a[p:]):
+            continue
+        overlap = len(a) - p
+        if overlap == len(b) or b[overlap].isspace():
+            return overlap
+    return 0
+
+def _join(previous: dict, following: dict) -> Optional[str]:
+    """The text of two neighbouring chunks as one passage, or None if they cannot be shown to
+    be contiguous. Chunks with char offsets either overlap (following starts before previous
+    ends, and the shared text is found on whole words) or touch, with only the whitespace the
+    chunker dropped between them. Chunks without offsets must overlap visibly."""
+    a, b = previous["text"], following["text"]
+    if "char_end" in previous and "char_start" in following:
+        if following["char_start"] >= previous["char_end"]:
+            return f"{a} {b}"
+        overlap = _word_overlap(a, b, 1)
+    else:
+        overlap = _word_overlap(a, b, MIN_TEXT_OVERLAP)
+    return a + b[overlap:] if overlap else None
+
+def _merge_neighbours(records: List[dict]) -> List[dict]:
+    """Groups the records into passages of consecutive chunks, each with its text, token
+    count, document position and rank (the best input rank among its chunks)."""
+    passages = []
+    for rank, record in sorted(enumerate(records), key=lambda item: item[1]["position"]):
+        last = passages[-1] if passages else None
+        joined = None
+        if last is not None and record["position"] == last["last"]["position"] + 1:
+            joined = _join(last["last"], record)
+        if joined is not None:
+            last["text"] = last["text"][:len(last["text"]) - len(last["last"]["text"])] + joined
+            last["last"] = record
+            last["rank"] = min(last["rank"], rank)
+            last["merged"] = True
+        else:
+            passages.append({"text": record["text"], "position": record["position"], "rank": rank, "last": record, "merged": False})
+    for passage in passages:
+        passage["tokens"] = vector_service.count_tokens(passage["text"]) if passage["merged"] else _token_count(passage["last"])
+    return passages
+
+def assemble(records: List[dict], budget_tokens: Optional[int] = CONTEXT_TOKEN_BUDGET) -> dict:
+    """Returns {"text", "tokens", "tokens_saved"} for records ranked best first. With
+    budget_tokens=None, nothing is dropped for length."""
+    if not records:
+        return {"text": "", "tokens": 0, "tokens_saved": 0}
+    tokens_in = sum(_token_count(record) for record in records)
+    passages = _merge_neighbours(_drop_near_duplicates(records))
+
+    packed, used = [], 0
+    for passage in sorted(passages, key=lambda passage: passage["rank"]):
+        # The best passage is always kept, even on its own over the budget.
+        if budget_tokens is None or not packed or used + passage["tokens"] <= budget_tokens:
+            packed.append(passage)
+            used += passage["tokens"]
+    packed.sort(key=lambda passage: passage["position"])
+
+    tokens_saved = max(0, tokens_in - used)
+    metrics.increment("context.requests")
+    metrics.increment("context.prompt_tokens", used)
+    metrics.increment("context.tokens_saved", tokens_saved)
+    # Per-request distributions, alongside the totals above.
+    metrics.observe("context.prompt_tokens_per_request", used)
+    metrics.observe("context.tokens_saved_per_request", tokens_saved)
+    return {"text": SEPARATOR.join(passage["text"] for passage in packed), "tokens": used, "tokens_saved": tokens_saved}
+
+async def assemble_async(records: List[dict], budget_tokens: Optional[int] = CONTEXT_TOKEN_BUDGET) -> dict:
+    # Embedding lookups and token counting are CPU work.
+    return await run_cpu(assemble, records, budget_tokens)
@@ -1,21 +1,166 @@
 import fitz  # PyMuPDF
 import docx
+import re
+from collections import deque
+from typing import Callable, Iterator
 
-def extract_text_from_pdf(file_stream) -> str:
-    doc = fitz.open(stream=file_stream.read(), filetype="pdf")
-    text = "".join(page.get_text() for page in doc)
-    doc.close()
-    return text
+from app.core.config import PDF_PAGES_PER_TASK, CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS, CHUNK_MIN_TOKENS
+
+PDF_CONTENT_TYPE = "application/pdf"
+DOCX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
 
 def extract_text_from_docx(file_stream) -> str:
     doc = docx.Document(file_stream)
     return "\n".join([para.text for para in doc.paragraphs])
 
-def chunk_text(text: str, chunk_size: int = 500, chunk_overlap: int = 80) -> list[str]:
-    if not text:
-        return []
-    words = text.split()
-    chunks = []
-    for i in range(0, len(words), chunk_size - chunk_overlap):
-        chunks.append(" ".join(words[i:i + chunk_size]))
-    return chunks
\ No newline at end of file
+# --- Streaming extraction ---
+# Documents are read from a path, page by page, instead of as one in-memory stream and one
+# giant string. Pages are yielded as (page_number, text) with 1-based page numbers.
+
+def extract_pdf_page_range(file_path: str, start: int, end: int) -> list[str]:
+    # Runs in a worker process: each task opens the file itself, so only the path and the
+    # page range are sent over, and only that range's text comes back.
+    with fitz.open(file_path) as doc:
+        return [doc[page_index].get_text() for page_index in range(start, end)]
+
+def iter_pdf_pages(file_path: str, executor=None, workers: int = 1,
+                   pages_per_task: int = PDF_PAGES_PER_TASK) -> Iterator[tuple[int, str]]:
+    """Yields the text of each page in order. With an executor (e.g. a process pool of
+    workers processes) the page ranges are extracted in parallel, with up to twice as many
+    ranges in flight as there are workers."""
+    with fitz.open(file_path) as doc:
+        page_count = doc.page_count
+        if executor is None:
+            for page in doc:
+                yield page.number + 1, page.get_text()
+            return
+
+    ranges = iter(range(0, page_count, pages_per_task))
+    max_in_flight = max(2, workers * 2)
+    pending = deque()
+
+    def submit_next():
+        start = next(ranges, None)
+        if start is not None:
+            end = min(start + pages_per_task, page_count)
+            pending.append((start, executor.submit(extract_pdf_page_range, file_path, start, end)))
+
+    for _ in range(max_in_flight):
+        submit_next()
+    while pending:
+        start, future = pending.popleft()
+        texts = future.result()
+        submit_next()
+        for offset, text in enumerate(texts):
+            yield start + offset + 1, text
+
+def extract_docx_file(file_path: str) -> str:
+    with open(file_path, "rb") as f:
+        return extract_text_from_docx(f)
+
+def iter_document_pages(file_path: str, content_type: str, executor=None, workers: int = 1) -> Iterator[tuple[int, str]]:
+    if content_type == PDF_CONTENT_TYPE:
+        yield from iter_pdf_pages(file_path, executor=executor, workers=workers)
+    elif content_type == DOCX_CONTENT_TYPE:
+        # DOCX files have no fixed pages, so the whole text counts as page 1.
+        text = executor.submit(extract_docx_file, file_path).result() if executor else extract_docx_file(file_path)
+        yield 1, text
+    else:
+        raise ValueError(f"Unsupported content type: {content_type}")
+
+# --- Token-aware chunking ---
+# Chunks are sized in the embedding model's tokens (so none of a chunk is lost to the
+# model's truncation) and snapped to sentence boundaries. The chunker consumes the page
+# iterator lazily and yields chunks as it goes, holding only the current window.
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+_WORD = re.compile(r"\S+")
+
+def _iter_sentences(pages: Iterator[tuple[int, str]]) -> Iterator[tuple[str, int, int, int]]:
+    """Yields (sentence, page_number, char_start, char_end), with char offsets counted over
+    the concatenated text of all pages, spanning the sentence without surrounding whitespace."""
+    page_offset = 0
+    for page_number, text in pages:
+        boundaries = [(match.start(), match.end()) for match in _SENTENCE_END.finditer(text)]
+        starts = [0] + [boundary_end for _, boundary_end in boundaries]
+        ends = [boundary_start for boundary_start, _ in boundaries] + [len(text)]
+        for start, end in zip(starts, ends):
+            raw = text[start:end]
+            sentence = raw.strip()
+            if sentence:
+                sentence_start = page_offset + start + len(raw) - len(raw.lstrip())
+                yield sentence, page_number, sentence_start, sentence_start + len(sentence)
+        page_offset += len(text)
+
+def _split_long_sentence(sentence: str, char_start: int, count_tokens: Callable[[str], int], max_tokens: int,
+                         overlap_tokens: int, min_tokens: int) -> Iterator[tuple[str, int, int, int]]:
+    """Splits a sentence into pieces of whole words of at most max_tokens tokens, yielded as
+    (text, char_start, char_end, token_count). Each piece after the first starts with up to
+    overlap_tokens tokens of the words before it, and a last piece that would add fewer than
+    min_tokens new tokens takes more of the previous piece's words instead."""
+    # WordPiece tokenises each whitespace-separated word independently, so summing per-word
+    # counts gives the exact token count of the joined piece.
+    words = [(match.group(), match.start(), match.end(), count_tokens(match.group())) for match in _WORD.finditer(sentence)]
+    start, new_from = 0, 0  # new_from: the first word no earlier piece contains
+    while new_from < len(words):
+        end, tokens = start, 0
+        while end < len(words) and (end <= new_from or tokens + words[end][3] <= max_tokens):
+            tokens += words[end][3]
+            end += 1
+        if end == len(words) and new_from > 0 and sum(word[3] for word in words[new_from:]) < min_tokens:
+            while start > 0 and tokens + words[start - 1][3] <= max_tokens:
+                start -= 1
+                tokens += words[start][3]
+        yield (" ".join(word[0] for word in words[start:end]),
+               char_start + words[start][1], char_start + words[end - 1][2], tokens)
+        new_from = end
+        # The next piece starts with the trailing words of this one that fit in the overlap.
+        overlap = 0
+        while end > start + 1 and overlap + words[end - 1][3] <= overlap_tokens:
+            end -= 1
+            overlap += words[end][3]
+        start = end
+
+def _make_chunk(window: list) -> dict:
+    return {
+        "text": " ".join(sentence for sentence, _, _, _, _ in window),
+        "page_start": window[0][1],
+        "page_end": window[-1][1],
+        "char_start": window[0][2],
+        "char_end": window[-1][3],
+        "token_count": sum(tokens for _, _, _, _, tokens in window),
+    }
+
+def iter_chunks(pages: Iterator[tuple[int, str]], count_tokens: Callable[[str], int],
+                max_tokens: int = CHUNK_MAX_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+                min_tokens: int = CHUNK_MIN_TOKENS) -> Iterator[dict]:
+    """Yields chunks of at most max_tokens tokens made of whole sentences, each overlapping the
+    previous one by up to overlap_tokens tokens of whole sentences. A sentence longer than a
+    chunk is split into word pieces (see _split_long_sentence), one chunk each. Every chunk is
+    a dict with its text, page range, char offsets and token count."""
+    window, window_tokens = [], 0
+    for sentence, page_number, char_start, char_end in _iter_sentences(pages):
+        tokens = count_tokens(sentence)
+        if tokens <= max_tokens:
+            pieces = [(sentence, char_start, char_end, tokens)]
+        else:
+            # Pieces leave room for the overlap carried over from the chunk before them.
+            pieces = _split_long_sentence(sentence, char_start, count_tokens, max(1, max_tokens - overlap_tokens),
+                                          overlap_tokens, min_tokens)
+        for position, (piece, piece_start, piece_end, piece_tokens) in enumerate(pieces):
+            continuation = position > 0
+            if window and (continuation or window_tokens + piece_tokens > max_tokens):
+                yield _make_chunk(window)
+                # Carry the trailing sentences that fit in the overlap into the next chunk. A
+                # continuation piece already starts with the end of the piece before it.
+                overlap, overlap_size = [], 0
+                for entry in ([] if continuation else reversed(window)):
+                    if overlap_size + entry[4] > overlap_tokens or overlap_size + entry[4] + piece_tokens > max_tokens:
+                        break
+                    overlap.insert(0, entry)
+                    overlap_size += entry[4]
+                window, window_tokens = overlap, overlap_size
+            window.append((piece, page_number, piece_start, piece_end, piece_tokens))
+            window_tokens += piece_tokens
+    if window:
+        yield _make_chunk(window)
@@ -0,0 +1,408 @@
+# backend/app/services/ingestion_service.py
+import asyncio
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Optional
+
+from docx2pdf import convert
+from filelock import FileLock, Timeout
+
+from app.core.config import (
+    INGEST_WORK_DIR, INGEST_PROCESS_WORKERS,
+    INGEST_MAX_CONCURRENT_JOBS, INGEST_STAGE_RETRIES, INGEST_JOB_TTL_SECONDS, PRECOMPUTE_STUDY_ARTIFACTS,
+)
+from app.core import db, metrics, storage
+from app.core.resources import get_supabase
+from app.services import document_service, vector_service, cache_service, session_index_service, session_service, study_service
+
+JOBS_DIR = os.path.join(INGEST_WORK_DIR, "jobs")
+UPLOADS_DIR = os.path.join(INGEST_WORK_DIR, "uploads")
+WORKERS_DIR = os.path.join(INGEST_WORK_DIR, "workers")
+
+# Text extraction runs in separate worker processes ("spawn" so the children do not inherit
+# torch/FAISS thread state), with large PDFs split into page ranges across them. The jobs
+# themselves are driven from a small thread pool, which also runs the embedding stage
+# because the model is already loaded here.
+_process_pool = ProcessPoolExecutor(max_workers=INGEST_PROCESS_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+_job_runner = ThreadPoolExecutor(max_workers=INGEST_MAX_CONCURRENT_JOBS, thread_name_prefix="ingest")
+_jobs_lock = threading.Lock()
+
+# Jobs only run in the executor of the worker process that accepted them. Each job records
+# that worker's id, and the worker holds WORKERS_DIR/{id}.lock for as long as it lives, so a
+# queued or running job whose worker's lock can be taken was interrupted (see recover_jobs).
+_WORKER_ID = uuid.uuid4().hex
+_worker_lock: Optional[FileLock] = None
+
+# The server's event loop. LLM calls go through the async Groq client, whose connection
+# pool belongs to that loop, so async work of a job is submitted to it.
+_server_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def attach_event_loop(loop: asyncio.AbstractEventLoop):
+    global _server_loop
+    _server_loop = loop
+
+
+class IngestionError(Exception):
+    """A failure that retrying will not fix (e.g. a document with no extractable text)."""
+
+
+# --- Job state ---
+# Job records are small JSON files so that every uvicorn worker on the host can answer
+# GET /jobs/{id}, whichever worker accepted the upload.
+
+def _job_path(job_id: str) -> str:
+    return os.path.join(JOBS_DIR, f"{job_id}.json")
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def _save_job(job: dict):
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    job["updated_at"] = _now()
+    tmp_path = f"{_job_path(job['id'])}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(job, f)
+    os.replace(tmp_path, _job_path(job["id"]))
+
+def _update_job(job: dict, **fields):
+    with _jobs_lock:
+        job.update(fields)
+        _save_job(job)
+
+def get_job(job_id: str) -> Optional[dict]:
+    try:
+        with open(_job_path(job_id), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+# --- Pipeline stages ---
+# Each stage takes the job and a context dict shared by the stages of that job, and may be
+# retried on its own, so a flaky storage upload does not redo the text extraction.
+
+def _stage_store_viewable(job: dict, ctx: dict):
+    doc_id = job["document_id"]
+    pdf_path = ctx["file_path"]
+    if job["content_type"] == document_service.DOCX_CONTENT_TYPE:
+        pdf_path = os.path.join(ctx["work_dir"], f"{doc_id}.pdf")
+        try:
+            convert(ctx["file_path"], pdf_path)
+        except Exception as e:
+            print(f"CRITICAL: Failed to convert DOCX to PDF for doc_id {doc_id}. Error: {e}")
+            ctx["has_pdf_viewable"] = False # Gracefully fail; doc won't be viewable
+            return
+
+    with open(pdf_path, "rb") as f:
+        storage.upload(f"{doc_id}/viewable.pdf", f.read(), content_type="application/pdf")
+    ctx["has_pdf_viewable"] = True
+
+def _stage_index(job: dict, ctx: dict):
+    # A byte-identical file was indexed before: its blob is shared instead of rebuilt.
+    prefix = vector_service.content_prefix(job["content_hash"])
+    if vector_service.artifacts_exist(prefix):
+        ctx["reused_artifacts"] = True
+        metrics.increment("ingest.deduplicated")
+        return
+    if job.get("kind") == "replace":
+        # Seed the chunk embedding cache from the version being replaced, so only the
+        # chunks whose text changed are encoded.
+        ctx["previous_chunk_hashes"] = vector_service.seed_chunk_embeddings(job["document_id"])
+    # Pages are extracted in parallel on the worker processes and streamed back in order,
+    # then chunked lazily and embedded slice by slice, so memory stays flat for large documents.
+    pages = document_service.iter_document_pages(ctx["file_path"], job["content_type"],
+                                                 executor=_process_pool, workers=INGEST_PROCESS_WORKERS)
+    chunks = document_service.iter_chunks(pages, vector_service.count_tokens)
+    if vector_service.build_document_artifacts(prefix, chunks) == 0:
+        raise IngestionError("Could not extract any text from the document.")
+    ctx["reused_artifacts"] = False
+    if "previous_chunk_hashes" in ctx:
+        new_hashes = vector_service.local_chunk_hashes(prefix)
+        unchanged = sum(1 for chunk_hash in new_hashes if chunk_hash in ctx["previous_chunk_hashes"])
+        _update_job(job, unchanged_chunks=unchanged, changed_chunks=len(new_hashes) - unchanged)
+
+def _stage_upload_index(job: dict, ctx: dict):
+    if not ctx.get("reused_artifacts"):
+        vector_service.upload_document_artifacts(vector_service.content_prefix(job["content_hash"]))
+
+def _ensure_reused_blob(job: dict, ctx: dict):
+    # A reused blob may have been released by a concurrent delete since _stage_index found
+    # it; build it again (the chunk embeddings are still cached).
+    if ctx.get("reused_artifacts") and not vector_service.artifacts_exist(vector_service.content_prefix(job["content_hash"])):
+        _stage_index(job, ctx)
+        _stage_upload_index(job, ctx)
+
+def _stage_register(job: dict, ctx: dict):
+    # Last stage: the document only shows up in the user's library once its index is stored.
+    # The stage is retried, so it must be safe to run again after a partial success.
+    _ensure_reused_blob(job, ctx)
+    documents = get_supabase().table("documents")
+    existing = db.execute(documents.select("id").eq("storage_path", job["document_id"]).limit(1)).data
+    if not existing:
+        db.execute(documents.insert({
+            "user_id": job["user_id"],
+            "file_name": job["file_name"],
+            "storage_path": job["document_id"],
+            "content_hash": job["content_hash"],
+            "has_pdf_viewable": ctx.get("has_pdf_viewable", False)
+        }))
+    # The record now holds a reference to the blob, so it can no longer be released; check
+    # once more for a release that happened between the check above and the insert.
+    _ensure_reused_blob(job, ctx)
+
+def _stage_switch(job: dict, ctx: dict):
+    # Last stage of a replacement: point the existing record (same storage_path, so chat
+    # sessions and comments stay attached) at the new blob, then drop everything derived
+    # from the previous version.
+    doc_id = job["document_id"]
+    if "previous_content_hash" not in job:
+        # Read once and kept in the job record: once the update below has been applied, a
+        # retry (or a recovered job) would read the new hash back and never release the old blob.
+        previous = db.execute(get_supabase().table("documents").select("content_hash").eq("storage_path", doc_id).single()).data
+        _update_job(job, previous_content_hash=previous.get("content_hash"))
+    previous_hash = job["previous_content_hash"]
+    db.execute(get_supabase().table("documents").update({
+        "file_name": job["file_name"],
+        "content_hash": job["content_hash"],
+        "has_pdf_viewable": ctx.get("has_pdf_viewable", False)
+    }).eq("storage_path", doc_id))
+    _update_job(job, switched=True)
+
+    # Caches are keyed by artifact prefix, so other workers move to the new content as soon
+    # as a request reads the updated row; what is dropped here only frees space early.
+    cache_service.invalidate_artifacts(vector_service.content_prefix(previous_hash) if previous_hash else doc_id)
+    vector_service.invalidate_document(doc_id)
+    session_service.invalidate_document(doc_id)
+    linked_sessions = db.execute(get_supabase().table("session_documents").select(
+        "session_id, documents!inner(storage_path)"
+    ).eq("documents.storage_path", doc_id)).data
+    session_index_service.remove_document(doc_id, [link["session_id"] for link in linked_sessions])
+    if not previous_hash:
+        # Uploaded before content addressing: its index and chunks live in {doc_id}/.
+        vector_service.release_legacy_artifacts(doc_id)
+    elif previous_hash != job["content_hash"]:
+        vector_service.release_artifacts(previous_hash)
+
+def _stage_precompute(job: dict, ctx: dict):
+    # Optional, and never fails the job: the document is already usable, and whatever is
+    # missing here is generated on the first /summarize, /mindmap or /quiz request instead.
+    if not PRECOMPUTE_STUDY_ARTIFACTS:
+        return
+    if _server_loop is None:
+        print(f"Ingestion job {job['id']}: no event loop attached, skipping precomputation.")
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(study_service.precompute(job["document_id"]), _server_loop).result()
+    except Exception as e:
+        print(f"Ingestion job {job['id']}: could not precompute study artifacts: {e}")
+
+STAGES = [
+    ("store_viewable", _stage_store_viewable),
+    ("index", _stage_index),
+    ("upload_index", _stage_upload_index),
+    ("register", _stage_register),
+    ("precompute", _stage_precompute),
+]
+
+# A replacement only overwrites the viewable PDF once the new index is stored, so a failed
+# job leaves the current version intact.
+REPLACE_STAGES = [
+    ("index", _stage_index),
+    ("upload_index", _stage_upload_index),
+    ("store_viewable", _stage_store_viewable),
+    ("switch", _stage_switch),
+    ("precompute", _stage_precompute),
+]
+
+
+def _run_stage(job: dict, ctx: dict, stage_name: str, stage):
+    for attempt in range(1, INGEST_STAGE_RETRIES + 1):
+        try:
+            stage(job, ctx)
+            return
+        except IngestionError:
+            raise
+        except Exception as e:
+            print(f"Ingestion job {job['id']}: stage '{stage_name}' failed (attempt {attempt}/{INGEST_STAGE_RETRIES}): {e}")
+            if attempt == INGEST_STAGE_RETRIES:
+                raise
+            _update_job(job, attempts=job.get("attempts", 0) + 1)
+            time.sleep(2 ** (attempt - 1))
+
+def _cleanup_failed_job(job: dict):
+    doc_id = job["document_id"]
+    if job.get("kind") == "replace":
+        # The document keeps its current version and only a new blob nothing refers to goes,
+        # unless the record was already switched to the new blob: then the previous one goes.
+        try:
+            if not job.get("switched"):
+                vector_service.release_artifacts(job["content_hash"])
+            elif not job.get("previous_content_hash"):
+                vector_service.release_legacy_artifacts(doc_id)
+            elif job["previous_content_hash"] != job["content_hash"]:
+                vector_service.release_artifacts(job["previous_content_hash"])
+        except Exception as e:
+            print(f"Ingestion job {job['id']}: could not release the artifacts of {doc_id}: {e}")
+        return
+    try:
+        # The register stage may have inserted the record before a later stage failed; it
+        # goes first, so the blob below is no longer referenced.
+        db.execute(get_supabase().table("documents").delete().eq("storage_path", doc_id).eq("user_id", job["user_id"]))
+    except Exception as e:
+        print(f"Ingestion job {job['id']}: could not delete the record of {doc_id}: {e}")
+    try:
+        storage.remove_folder(f"{doc_id}/")
+    except Exception as e:
+        print(f"Ingestion job {job['id']}: could not clean up storage for {doc_id}: {e}")
+    try:
+        vector_service.release_artifacts(job["content_hash"])
+    except Exception as e:
+        print(f"Ingestion job {job['id']}: could not release the artifacts of {doc_id}: {e}")
+    vector_service.invalidate_document(doc_id)
+
+def _run_job(job: dict):
+    work_dir = os.path.join(UPLOADS_DIR, job["id"])
+    ctx = {"work_dir": work_dir, "file_path": os.path.join(work_dir, job["file_name"])}
+    stages = REPLACE_STAGES if job.get("kind") == "replace" else STAGES
+    _update_job(job, status="running")
+    try:
+        for position, (stage_name, stage) in enumerate(stages):
+            _update_job(job, stage=stage_name, progress=int(100 * position / len(stages)))
+            _run_stage(job, ctx, stage_name, stage)
+        _update_job(job, status="completed", stage=None, progress=100)
+    except Exception as e:
+        _cleanup_failed_job(job)
+        _update_job(job, status="failed", error=str(e))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        remove_expired()
+
+
+def _submit(user_id: str, document_id: str, kind: str, file_name: str, content_type: str, content: bytes) -> dict:
+    job_id = str(uuid.uuid4())
+    file_name = os.path.basename(file_name)
+    work_dir = os.path.join(UPLOADS_DIR, job_id)
+    os.makedirs(work_dir, exist_ok=True)
+    with open(os.path.join(work_dir, file_name), "wb") as f:
+        f.write(content)
+
+    job = {
+        "id": job_id,
+        "kind": kind,
+        "user_id": user_id,
+        "document_id": document_id,
+        "file_name": file_name,
+        "content_type": content_type,
+        "content_hash": vector_service.content_hash(content),
+        "status": "queued",
+        "stage": None,
+        "progress": 0,
+        "attempts": 0,
+        "error": None,
+        "worker_id": _WORKER_ID,
+        "created_at": _now(),
+    }
+    _update_job(job)
+    _job_runner.submit(_run_job, job)
+    return job
+
+def submit_upload(user_id: str, file_name: str, content_type: str, content: bytes) -> dict:
+    """Saves the upload to the local work directory and queues it for ingestion."""
+    return _submit(user_id, str(uuid.uuid4()), "upload", file_name, content_type, content)
+
+def submit_replace(user_id: str, doc_id: str, file_name: str, content_type: str, content: bytes) -> dict:
+    """Queues a new version of an existing document; it keeps its doc_id (storage_path)."""
+    return _submit(user_id, doc_id, "replace", file_name, content_type, content)
+
+
+# --- Recovery ---
+
+def _worker_lock_path(worker_id: str) -> str:
+    return os.path.join(WORKERS_DIR, f"{worker_id}.lock")
+
+def _worker_alive(worker_id: Optional[str]) -> bool:
+    if worker_id == _WORKER_ID:
+        return True
+    if not worker_id:
+        # Recorded before jobs had an owner.
+        return False
+    lock = FileLock(_worker_lock_path(worker_id))
+    try:
+        lock.acquire(timeout=0)
+    except Timeout:
+        return True
+    lock.release()
+    try:
+        os.remove(_worker_lock_path(worker_id))
+    except OSError:
+        pass
+    return False
+
+def _recover(job: dict):
+    if os.path.exists(os.path.join(UPLOADS_DIR, job["id"], job["file_name"])):
+        # Every stage is safe to run again, so the job simply starts over on this worker.
+        _update_job(job, status="queued", stage=None, progress=0, worker_id=_WORKER_ID)
+        metrics.increment("ingest.recovered")
+        _job_runner.submit(_run_job, job)
+        return
+    _cleanup_failed_job(job)
+    _update_job(job, status="failed", error="Processing was interrupted. Please upload the file again.")
+    metrics.increment("ingest.abandoned")
+
+def remove_expired():
+    """Removes finished job records, and upload files no queued or running job uses, once they
+    are INGEST_JOB_TTL_SECONDS old."""
+    cutoff = time.time() - INGEST_JOB_TTL_SECONDS
+    for directory in (JOBS_DIR, UPLOADS_DIR):
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            continue
+        for name in names:
+            path = os.path.join(directory, name)
+            try:
+                if os.path.getmtime(path) >= cutoff:
+                    continue
+            except OSError:
+                continue
+            if directory == UPLOADS_DIR:
+                job = get_job(name)
+                if job is None or job["status"] not in ("queued", "running"):
+                    shutil.rmtree(path, ignore_errors=True)
+            elif name.endswith(".json"):
+                job = get_job(name[:-len(".json")])
+                if job is None or job["status"] in ("completed", "failed"):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+def recover_jobs():
+    """Startup sweep: registers this worker, then re-queues the jobs of workers that died while
+    the jobs were queued or running (or fails them, if their upload is gone), and removes
+    expired job files. Runs under a lock, so workers starting together recover each job once."""
+    global _worker_lock
+    os.makedirs(WORKERS_DIR, exist_ok=True)
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    if _worker_lock is None:
+        _worker_lock = FileLock(_worker_lock_path(_WORKER_ID))
+        _worker_lock.acquire()
+    with FileLock(os.path.join(INGEST_WORK_DIR, "recovery.lock")):
+        for name in os.listdir(JOBS_DIR):
+            if not name.endswith(".json"):
+                continue
+            job = get_job(name[:-len(".json")])
+            if job is None or job["status"] not in ("queued", "running") or _worker_alive(job.get("worker_id")):
+                continue
+            try:
+                _recover(job)
+            except Exception as e:
+                print(f"Ingestion job {job['id']}: could not recover: {e}")
+        remove_expired()
@@ -0,0 +1,162 @@
+# backend/app/services/lexical_index.py
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+from array import array
+from collections import Counter, defaultdict
+from typing import List, Tuple
+
+import numpy as np
+
+# Per-document BM25 inverted index ("lexical.bin"), built next to the FAISS index so exact
+# terms (formula names, chapter codes, identifiers) are found even when the embedding misses
+# them.
+#
+#   header         MAGIC | version u16 | reserved u16 | chunk_count u32 | term_count u32
+#                  | posting_count u32 | vocabulary_length u64 | padding
+#   chunk lengths  chunk_count x u32 (tokens per chunk)
+#   term offsets   (term_count + 1) x u32, postings of term t are [offsets[t], offsets[t + 1])
+#   chunk ids      posting_count x u32, ascending within a term
+#   term freqs     posting_count x u16 (saturated at 65535)
+#   vocabulary     JSON list of the terms, in term id order
+#
+# The arrays are read in place from the memory-mapped file, so loading an index costs one
+# JSON parse of the vocabulary, and a query only touches the postings of its own terms.
+MAGIC = b"SHLX"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sHHIIIQ4x")
+
+# Okapi BM25 parameters (the usual defaults).
+K1 = 1.2
+B = 0.75
+
+# Words and dotted/hyphenated codes ("3.2.1", "cs-101", "h2o"). A compound token is indexed
+# both whole and by its parts, so "3.2" and "eq. 3.2" both match "3.2".
+_TOKEN_PATTERN = re.compile(r"\w+(?:[.\-/]\w+)*")
+_PART_PATTERN = re.compile(r"[.\-/]")
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in _TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in _PART_PATTERN.split(token) if part)
+    return tokens
+
+
+class LexicalIndexWriter:
+    """Builds the inverted index while chunks are added one at a time, in chunk order."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._chunk_lengths = array("I")
+        self._postings = defaultdict(lambda: (array("I"), array("H")))  # term -> (chunk ids, tfs)
+
+    def add(self, text: str):
+        chunk_id = len(self._chunk_lengths)
+        tokens = tokenize(text)
+        self._chunk_lengths.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            chunk_ids, tfs = self._postings[term]
+            chunk_ids.append(chunk_id)
+            tfs.append(min(tf, 65535))
+
+    def __len__(self) -> int:
+        return len(self._chunk_lengths)
+
+    def close(self):
+        terms = sorted(self._postings)
+        offsets = array("I", [0])
+        for term in terms:
+            offsets.append(offsets[-1] + len(self._postings[term][0]))
+        vocabulary = json.dumps(terms, separators=(",", ":")).encode("utf-8")
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, 0, len(self._chunk_lengths), len(terms), offsets[-1], len(vocabulary)))
+            f.write(np.asarray(self._chunk_lengths, dtype="<u4").tobytes())
+            f.write(np.asarray(offsets, dtype="<u4").tobytes())
+            for term in terms:
+                f.write(np.asarray(self._postings[term][0], dtype="<u4").tobytes())
+            for term in terms:
+                f.write(np.asarray(self._postings[term][1], dtype="<u2").tobytes())
+            f.write(vocabulary)
+        os.replace(tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+
+
+class LexicalIndex:
+    """BM25 search over a lexical.bin file, read through mmap."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, chunk_count, term_count, posting_count, vocabulary_length = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} lexical index.")
+        self.chunk_count = chunk_count
+
+        position = _HEADER.size
+        self._chunk_lengths = np.frombuffer(self._mmap, dtype="<u4", count=chunk_count, offset=position)
+        position += 4 * chunk_count
+        self._offsets = np.frombuffer(self._mmap, dtype="<u4", count=term_count + 1, offset=position)
+        position += 4 * (term_count + 1)
+        self._chunk_ids = np.frombuffer(self._mmap, dtype="<u4", count=posting_count, offset=position)
+        position += 4 * posting_count
+        self._tfs = np.frombuffer(self._mmap, dtype="<u2", count=posting_count, offset=position)
+        position += 2 * posting_count
+        terms = json.loads(self._mmap[position:position + vocabulary_length])
+        self._term_ids = {term: i for i, term in enumerate(terms)}
+
+        average_length = float(self._chunk_lengths.mean()) if chunk_count else 0.0
+        # The length part of the BM25 denominator, per chunk.
+        self._length_norm = K1 * (1 - B + B * self._chunk_lengths.astype("float32") / average_length) if average_length else None
+        # Roughly what the vocabulary dict adds on top of the mapped file, for cache accounting.
+        self.nbytes = len(self._mmap) + 4 * chunk_count + 100 * term_count
+
+    def search(self, query: str, top_k: int) -> List[Tuple[int, float]]:
+        """Returns up to top_k (chunk id, BM25 score) pairs, best first. Chunks sharing no
+        term with the query are not returned."""
+        if self._length_norm is None:
+            return []
+        scores = np.zeros(self.chunk_count, dtype="float32")
+        for term in set(tokenize(query)):
+            term_id = self._term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = int(self._offsets[term_id]), int(self._offsets[term_id + 1])
+            document_frequency = end - start
+            idf = math.log(1 + (self.chunk_count - document_frequency + 0.5) / (document_frequency + 0.5))
+            chunk_ids = self._chunk_ids[start:end]
+            tfs = self._tfs[start:end].astype("float32")
+            # Chunk ids are unique within a term's postings, so the fancy-indexed add is exact.
+            scores[chunk_ids] += idf * tfs * (K1 + 1) / (tfs + self._length_norm[chunk_ids])
+
+        matched = np.flatnonzero(scores)
+        if not len(matched):
+            return []
+        if len(matched) > top_k:
+            matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(int(i), float(scores[i])) for i in matched]
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = 60) -> List[int]:
+    """Fuses ranked lists of ids: each id scores sum(1 / (k + rank)) over the lists it is in."""
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            fused[item] += 1.0 / (k + rank)
+    return sorted(fused, key=lambda item: -fused[item])
@@ -1,20 +1,103 @@
 # backend/app/services/llm_service.py (Complete, Updated File)
 
-from groq import Groq
-from app.core.config import GROQ_API_KEY, MODEL_NAME
+import asyncio
+from typing import AsyncIterator, Optional
 
-client = Groq(api_key=GROQ_API_KEY)
+from app.core.config import MODEL_NAME, LLM_BACKEND
+from app.core.resilience import llm_breaker
+from app.core.resources import get_async_groq
+from app.services import cache_service
 
-def generate_chat_completion(prompt: str) -> str:
-    try:
-        chat_completion = client.chat.completions.create(
+
+class GroqLLM:
+    # The async client comes from the shared resource registry and is created on first use.
+    # Calls go through the "llm" circuit breaker, which retries rate limits, 5xx and network errors.
+    @property
+    def async_client(self):
+        return get_async_groq()
+
+    async def complete_async(self, prompt: str) -> str:
+        chat_completion = await llm_breaker.call_async(
+            self.async_client.chat.completions.create,
             messages=[{"role": "user", "content": prompt}],
             model=MODEL_NAME,
             temperature=0.2,
         )
         return chat_completion.choices[0].message.content
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        # Only opening the stream is retried; tokens already sent to the client cannot be.
+        stream = await llm_breaker.call_async(
+            self.async_client.chat.completions.create,
+            messages=[{"role": "user", "content": prompt}],
+            model=MODEL_NAME,
+            temperature=0.2,
+            stream=True,
+        )
+        async for chunk in stream:
+            token = chunk.choices[0].delta.content
+            if token:
+                yield token
+
+
+class FakeLLM:
+    """Offline stand-in for GroqLLM. Replays the given responses in order (cycling), or
+    returns a fixed sentence when none are given, and streams them word by word."""
+
+    def __init__(self, responses: Optional[list[str]] = None, token_delay: float = 0.0):
+        self.responses = responses or ["This is a fake response from the offline LLM."]
+        self.token_delay = token_delay
+        self.prompts: list[str] = []
+
+    def complete(self, prompt: str) -> str:
+        self.prompts.append(prompt)
+        return self.responses[(len(self.prompts) - 1) % len(self.responses)]
+
+    async def complete_async(self, prompt: str) -> str:
+        return self.complete(prompt)
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        words = self.complete(prompt).split(" ")
+        for i, word in enumerate(words):
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            yield word if i == len(words) - 1 else word + " "
+
+
+_llm = FakeLLM() if LLM_BACKEND == "fake" else GroqLLM()
+
+def set_llm(llm):
+    """Swaps the backend used by this module, e.g. set_llm(FakeLLM([...])) in offline runs."""
+    global _llm
+    _llm = llm
+
+async def generate_chat_completion_async(prompt: str) -> str:
+    # Uses Groq's native async client, so the endpoints await the LLM without holding up
+    # the event loop. Errors are re-raised, so the endpoints can report Groq's own error.
+    cached = cache_service.get_response(prompt)
+    if cached is not None:
+        return cached
+    try:
+        answer = await _llm.complete_async(prompt)
     except Exception as e:
-        # IMPORTANT CHANGE: Instead of returning a string, we re-raise the exception.
-        # This allows our endpoints to catch the specific error from Groq.
         print(f"An error occurred while calling Groq API: {e}")
-        raise e
\ No newline at end of file
+        raise e
+    cache_service.set_response(prompt, answer)
+    return answer
+
+async def stream_chat_completion(prompt: str) -> AsyncIterator[str]:
+    # Yields the answer token by token as the model generates it. A cached answer is sent
+    # as a single token; a fresh one is cached once the stream has completed.
+    cached = cache_service.get_response(prompt)
+    if cached is not None:
+        yield cached
+        return
+    tokens = []
+    try:
+        async for token in _llm.stream(prompt):
+            tokens.append(token)
+            yield token
+    except Exception as e:
+        print(f"An error occurred while streaming from Groq API: {e}")
+        raise e
+    cache_service.set_response(prompt, "".join(tokens))
@@ -1,57 +1,134 @@
 # backend/app/services/recommendation_service.py (New File)
+import asyncio
+import threading
+import time
+
+from cachetools import TTLCache
 from googleapiclient.discovery import build
-from app.core.config import YOUTUBE_API_KEY, PSE_API_KEY, PSE_CX
-
-def search_youtube(query: str, max_results: int = 5):
-    try:
-        youtube = build('youtube', 'v3', developerKey=YOUTUBE_API_KEY)
-        
-        request = youtube.search().list(
-            q=query,
-            part='snippet',
-            type='video',
-            maxResults=max_results,
-            videoCategoryId='27' # Category for Education
-        )
-        response = request.execute()
-
-        videos = []
-        for item in response.get('items', []):
-            video_data = {
-                "title": item['snippet']['title'],
-                "link": f"https://www.youtube.com/watch?v={item['id']['videoId']}",
-                "snippet": item['snippet']['description'],
-                "thumbnail": item['snippet']['thumbnails']['high']['url']
-            }
-            videos.append(video_data)
-        return videos
-    except Exception as e:
-        print(f"An error occurred with the YouTube API: {e}")
-        return []
-
-def search_web_articles(query: str, max_results: int = 5):
-    try:
-        service = build("customsearch", "v1", developerKey=PSE_API_KEY)
-        
-        res = service.cse().list(
-            q=query,
-            cx=PSE_CX,
-            num=max_results,
-        ).execute()
-
-        articles = []
-        for item in res.get('items', []):
-            article_data = {
-                "title": item.get('title'),
-                "link": item.get('link'),
-                "snippet": item.get('snippet'),
-                # Use pagemap to get a thumbnail if available
-                "thumbnail": (item.get('pagemap', {}).get('cse_thumbnail', [{}])[0].get('src') 
-                              if item.get('pagemap') and item['pagemap'].get('cse_thumbnail') 
-                              else None)
-            }
-            articles.append(article_data)
-        return articles
-    except Exception as e:
-        print(f"An error occurred with the Custom Search API: {e}")
-        return []
\ No newline at end of file
+
+from app.core import metrics
+from app.core.config import (
+    YOUTUBE_API_KEY, PSE_API_KEY, PSE_CX, RECOMMENDATION_CACHE_MAX_ENTRIES,
+    RECOMMENDATION_CACHE_TTL_SECONDS, RECOMMENDATION_STALE_SECONDS,
+)
+from app.core.executors import run_io
+
+# Discovery clients are built once per I/O thread rather than once per call: their httplib2
+# transport is not thread-safe, so they cannot be shared across the pool.
+_services = threading.local()
+
+# Normalised topic -> ({"youtube": [...], "articles": [...]}, fetched_at). Entries older than
+# RECOMMENDATION_CACHE_TTL_SECONDS are still served, but refreshed in the background.
+_responses = TTLCache(maxsize=RECOMMENDATION_CACHE_MAX_ENTRIES, ttl=RECOMMENDATION_CACHE_TTL_SECONDS + RECOMMENDATION_STALE_SECONDS)
+_lock = threading.Lock()
+_in_flight: dict = {}  # normalised topic -> asyncio.Task fetching it
+_background_refreshes = set()
+
+def _service(name: str, version: str, api_key: str):
+    key = f"{name}_{version}"
+    service = getattr(_services, key, None)
+    if service is None:
+        service = build(name, version, developerKey=api_key, cache_discovery=False)
+        setattr(_services, key, service)
+    return service
+
+def _search_youtube(query: str, max_results: int = 5):
+    youtube = _service('youtube', 'v3', YOUTUBE_API_KEY)
+
+    request = youtube.search().list(
+        q=query,
+        part='snippet',
+        type='video',
+        maxResults=max_results,
+        videoCategoryId='27' # Category for Education
+    )
+    response = request.execute()
+
+    videos = []
+    for item in response.get('items', []):
+        video_data = {
+            "title": item['snippet']['title'],
+            "link": f"https://www.youtube.com/watch?v={item['id']['videoId']}",
+            "snippet": item['snippet']['description'],
+            "thumbnail": item['snippet']['thumbnails']['high']['url']
+        }
+        videos.append(video_data)
+    return videos
+
+def _search_web_articles(query: str, max_results: int = 5):
+    service = _service("customsearch", "v1", PSE_API_KEY)
+
+    res = service.cse().list(
+        q=query,
+        cx=PSE_CX,
+        num=max_results,
+    ).execute()
+
+    articles = []
+    for item in res.get('items', []):
+        article_data = {
+            "title": item.get('title'),
+            "link": item.get('link'),
+            "snippet": item.get('snippet'),
+            # Use pagemap to get a thumbnail if available
+            "thumbnail": (item.get('pagemap', {}).get('cse_thumbnail', [{}])[0].get('src')
+                          if item.get('pagemap') and item['pagemap'].get('cse_thumbnail')
+                          else None)
+        }
+        articles.append(article_data)
+    return articles
+
+
+def normalize_topic(topic: str) -> str:
+    return " ".join(topic.lower().split())
+
+async def _fetch(topic: str) -> dict:
+    # Both APIs are queried at once. A failed lookup contributes no results, and the
+    # response is then not cached, so the next request tries again.
+    search_query = f"{topic} tutorial explanation"
+    youtube, articles = await asyncio.gather(
+        run_io(_search_youtube, search_query),
+        run_io(_search_web_articles, search_query),
+        return_exceptions=True,
+    )
+    failed = False
+    for api, result in (("YouTube", youtube), ("Custom Search", articles)):
+        if isinstance(result, Exception):
+            print(f"An error occurred with the {api} API: {result}")
+            failed = True
+    response = {
+        "youtube": [] if isinstance(youtube, Exception) else youtube,
+        "articles": [] if isinstance(articles, Exception) else articles,
+    }
+    if not failed:
+        with _lock:
+            _responses[topic] = (response, time.time())
+    return response
+
+def _fetch_once(topic: str) -> asyncio.Task:
+    # Concurrent requests for the same topic share one lookup.
+    task = _in_flight.get(topic)
+    if task is None:
+        task = asyncio.create_task(_fetch(topic))
+        _in_flight[topic] = task
+        task.add_done_callback(lambda _: _in_flight.pop(topic, None))
+    return task
+
+async def get_recommendations(topic: str) -> dict:
+    """YouTube videos and web articles for topic, served from the response cache when possible."""
+    topic = normalize_topic(topic)
+    with _lock:
+        entry = _responses.get(topic)
+    if entry is not None:
+        response, fetched_at = entry
+        if time.time() - fetched_at < RECOMMENDATION_CACHE_TTL_SECONDS:
+            metrics.increment("recommendation_cache.hits")
+        else:
+            # Stale-while-revalidate: answer now, refresh for the next request.
+            metrics.increment("recommendation_cache.stale_hits")
+            task = _fetch_once(topic)
+            _background_refreshes.add(task)
+            task.add_done_callback(_background_refreshes.discard)
+        return response
+    metrics.increment("recommendation_cache.misses")
+    return await asyncio.shield(_fetch_once(topic))
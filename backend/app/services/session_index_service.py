@@ -0,0 +1,197 @@
+# backend/app/services/session_index_service.py
+import bisect
+import heapq
+import json
+import os
+import shutil
+import threading
+from typing import List, Optional
+
+import faiss
+import numpy as np
+from cachetools import LRUCache
+
+from app.core.config import VECTOR_CACHE_DIR, SESSION_INDEX_CACHE_SIZE
+from app.core.executors import run_io
+from app.core import storage
+from app.services import vector_service
+
+# Consolidated index for a chat session: the vectors of every linked document in one
+# IndexIDMap2, so session chat runs a single search instead of one per document.
+#
+# Each document owns a contiguous range of vector ids, recorded in the session map:
+#   {"next_id": int, "documents": {doc_id: {"start": int, "count": int, "prefix": str}}}
+# so vector id -> (doc_id, chunk index) is a range lookup, and removing a document is a
+# single remove_ids(IDSelectorRange). Documents are migrated into the session index lazily,
+# from their per-document index, the first time the session is searched, and migrated again
+# when a document is replaced (its storage prefix, i.e. its blob, changes).
+INDEX_FILE = "session.index"
+MAP_FILE = "session_map.json"
+
+_sessions = LRUCache(maxsize=SESSION_INDEX_CACHE_SIZE)
+_sessions_lock = threading.Lock()
+_session_locks: dict[str, threading.RLock] = {}
+
+def _prefix(session_id: str) -> str:
+    return f"sessions/{session_id}"
+
+def _session_lock(session_id: str) -> threading.RLock:
+    # FAISS indexes are not safe to search while another thread adds or removes vectors,
+    # so every use of a session index happens under that session's lock.
+    with _sessions_lock:
+        return _session_locks.setdefault(session_id, threading.RLock())
+
+
+class SessionIndex:
+    def __init__(self, index, next_id: int = 0, documents: Optional[dict] = None):
+        self.index = index
+        self.next_id = next_id
+        self.documents = documents or {}
+        self._refresh_ranges()
+
+    def _refresh_ranges(self):
+        ranges = sorted((meta["start"], meta["count"], doc_id) for doc_id, meta in self.documents.items())
+        self._starts = [start for start, _, _ in ranges]
+        self._ranges = ranges
+
+    def locate(self, vector_id: int):
+        """Maps a vector id to (doc_id, chunk index), or None if it belongs to no document."""
+        position = bisect.bisect_right(self._starts, vector_id) - 1
+        if position < 0:
+            return None
+        start, count, doc_id = self._ranges[position]
+        return (doc_id, vector_id - start) if vector_id < start + count else None
+
+    def add_document(self, doc_id: str, vectors: np.ndarray, prefix: Optional[str] = None):
+        count = len(vectors)
+        ids = np.arange(self.next_id, self.next_id + count, dtype="int64")
+        self.index.add_with_ids(np.ascontiguousarray(vectors, dtype="float32"), ids)
+        self.documents[doc_id] = {"start": self.next_id, "count": count, "prefix": prefix}
+        self.next_id += count
+        self._refresh_ranges()
+
+    def remove_document(self, doc_id: str) -> bool:
+        meta = self.documents.pop(doc_id, None)
+        if meta is None:
+            return False
+        self.index.remove_ids(faiss.IDSelectorRange(meta["start"], meta["start"] + meta["count"]))
+        self._refresh_ranges()
+        return True
+
+    def to_map(self) -> dict:
+        return {"next_id": self.next_id, "documents": self.documents}
+
+
+def _new_session_index(dimension: int) -> SessionIndex:
+    return SessionIndex(faiss.IndexIDMap2(faiss.IndexFlatL2(dimension)))
+
+def _load(session_id: str) -> Optional[SessionIndex]:
+    with _sessions_lock:
+        session_index = _sessions.get(session_id)
+    if session_index is not None:
+        return session_index
+    try:
+        index_path = vector_service.fetch_cached_file(_prefix(session_id), INDEX_FILE)
+        map_path = vector_service.fetch_cached_file(_prefix(session_id), MAP_FILE)
+    except Exception:
+        # No consolidated index stored yet for this session.
+        return None
+    with open(map_path, "r", encoding="utf-8") as f:
+        session_map = json.load(f)
+    session_index = SessionIndex(faiss.read_index(index_path), session_map["next_id"], session_map["documents"])
+    with _sessions_lock:
+        _sessions[session_id] = session_index
+    return session_index
+
+def _save(session_id: str, session_index: SessionIndex):
+    vector_service.store_file(_prefix(session_id), INDEX_FILE, vector_service.serialize_index(session_index.index))
+    vector_service.store_file(_prefix(session_id), MAP_FILE, json.dumps(session_index.to_map()).encode("utf-8"), content_type="application/json")
+    with _sessions_lock:
+        _sessions[session_id] = session_index
+
+def sync_session(session_id: str, doc_ids: List[str]) -> SessionIndex:
+    """Makes the session index contain exactly doc_ids, migrating missing documents from
+    their per-document index (again, for replaced documents) and dropping documents no
+    longer linked to the session."""
+    with _session_lock(session_id):
+        session_index = _load(session_id)
+        # Read fresh on every search: a document replaced on another worker must not be
+        # served from its old vectors until a cached prefix expires.
+        prefixes = vector_service.resolve_artifact_prefixes(doc_ids)
+        # Entries written before prefixes were recorded are taken to be current.
+        stale = [
+            doc_id for doc_id, meta in (session_index.documents if session_index else {}).items()
+            if doc_id not in prefixes or (meta.get("prefix") or prefixes[doc_id]) != prefixes[doc_id]
+        ]
+        missing = [doc_id for doc_id in doc_ids if session_index is None or doc_id not in session_index.documents or doc_id in stale]
+        if not missing and not stale:
+            return session_index
+
+        for doc_id in stale:
+            session_index.remove_document(doc_id)
+        for doc_id in missing:
+            try:
+                vectors = vector_service.document_vectors(doc_id)
+            except Exception as e:
+                print(f"Warning: Could not add document {doc_id} to session index {session_id}. Error: {e}")
+                continue
+            if session_index is None:
+                session_index = _new_session_index(vectors.shape[1])
+            session_index.add_document(doc_id, vectors, prefixes[doc_id])
+
+        if session_index is not None:
+            _save(session_id, session_index)
+        return session_index
+
+def search_session(session_id: str, doc_ids: List[str], query_vector: np.ndarray, top_k: int) -> List[dict]:
+    with _session_lock(session_id):
+        session_index = sync_session(session_id, doc_ids)
+        indexed = set(session_index.documents) if session_index is not None else set()
+        distances, ids = ([[]], [[]])
+        if session_index is not None and session_index.index.ntotal > 0:
+            distances, ids = session_index.index.search(query_vector, top_k)
+
+    results = []
+    for distance, vector_id in zip(distances[0], ids[0]):
+        location = session_index.locate(int(vector_id)) if vector_id >= 0 else None
+        if location is None:
+            continue
+        doc_id, chunk_idx = location
+        _, chunks = vector_service.load_document(doc_id)
+        if chunk_idx < len(chunks):
+            results.append({"doc_id": doc_id, "text": chunks[chunk_idx], "score": float(distance)})
+
+    # A document that could not be migrated (e.g. its download failed) is searched on its own
+    # and merged in by distance, rather than left out of the session's results.
+    unindexed = [doc_id for doc_id in doc_ids if doc_id not in indexed]
+    if unindexed:
+        results.extend(vector_service.search_documents(unindexed, query_vector, top_k))
+        results = heapq.nsmallest(top_k, results, key=lambda result: result["score"])
+    return results
+
+async def retrieve_from_session_async(session_id: str, doc_ids: List[str], query: str, top_k: int = 10) -> List[dict]:
+    query_vector = await vector_service.encode_query_async(query)
+    return await run_io(search_session, session_id, doc_ids, query_vector, top_k)
+
+def remove_document(doc_id: str, session_ids: List[str]):
+    """Removes a deleted document's vectors from the indexes of the sessions it was linked to."""
+    for session_id in session_ids:
+        with _session_lock(session_id):
+            try:
+                session_index = _load(session_id)
+                if session_index is not None and session_index.remove_document(doc_id):
+                    _save(session_id, session_index)
+            except Exception as e:
+                print(f"Warning: Could not remove document {doc_id} from session index {session_id}. Error: {e}")
+
+def delete_session(session_id: str):
+    with _session_lock(session_id):
+        with _sessions_lock:
+            _sessions.pop(session_id, None)
+        try:
+            storage.remove([f"{_prefix(session_id)}/{INDEX_FILE}", f"{_prefix(session_id)}/{MAP_FILE}"])
+        except Exception as e:
+            print(f"Warning: Could not delete session index {session_id}. Error: {e}")
+        shutil.rmtree(os.path.join(VECTOR_CACHE_DIR, _prefix(session_id)), ignore_errors=True)
+    with _sessions_lock:
+        _session_locks.pop(session_id, None)
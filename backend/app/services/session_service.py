@@ -0,0 +1,58 @@
+# backend/app/services/session_service.py
+import threading
+from typing import Optional
+
+from cachetools import TTLCache
+
+from app.core import db
+from app.core.config import SESSION_METADATA_CACHE_SIZE, SESSION_METADATA_TTL_SECONDS
+from app.core.resources import get_supabase
+from app.services import vector_service
+
+
+# session_id -> {"user_id": str, "documents": [{"storage_path", "file_name", "content_hash"}, ...]}, so that
+# consecutive chat turns in a session do not read the session and its documents again.
+# Entries are dropped on this worker when the session is deleted or one of its documents is
+# deleted or replaced; the TTL bounds how long other workers may serve stale metadata.
+_session_metadata = TTLCache(maxsize=SESSION_METADATA_CACHE_SIZE, ttl=SESSION_METADATA_TTL_SECONDS)
+_lock = threading.Lock()
+
+def get_session_documents(session_id: str, user_id: str) -> Optional[list[dict]]:
+    """Returns the documents linked to the session (storage_path and file_name of each), or
+    None if the session does not exist or is not owned by user_id. A cache miss costs a
+    single query, joining the session with its links and their documents."""
+    with _lock:
+        entry = _session_metadata.get(session_id)
+    if entry is None:
+        rows = db.execute(get_supabase().table("chat_sessions").select(
+            "user_id, session_documents(documents(storage_path, file_name, content_hash))"
+        ).eq("id", session_id).limit(1)).data
+        if not rows:
+            return None
+        entry = {
+            "user_id": rows[0]["user_id"],
+            "documents": [link["documents"] for link in rows[0]["session_documents"] if link.get("documents")],
+        }
+        with _lock:
+            _session_metadata[session_id] = entry
+    if entry["user_id"] != user_id:
+        return None
+    # Retrieval then finds every document's storage prefix without a query of its own, even
+    # when the prefix memo has expired while this entry has not.
+    for document in entry["documents"]:
+        vector_service.remember_artifact_prefix(document["storage_path"], document.get("content_hash"))
+    return entry["documents"]
+
+def invalidate_session(session_id: str):
+    with _lock:
+        _session_metadata.pop(session_id, None)
+
+def invalidate_document(doc_id: str):
+    """Drops the cached sessions that link the document (deleted, or replaced with a new file name)."""
+    with _lock:
+        stale = [
+            session_id for session_id, entry in _session_metadata.items()
+            if any(document["storage_path"] == doc_id for document in entry["documents"])
+        ]
+        for session_id in stale:
+            _session_metadata.pop(session_id, None)
@@ -0,0 +1,198 @@
+# backend/app/services/study_service.py
+import json
+import random
+from typing import Optional
+
+import numpy as np
+
+from app.core.config import SUMMARY_RETRIEVAL_QUERY, QUIZ_POOL_SIZE, QUIZ_POOL_CONTEXT_CHUNKS
+from app.core.executors import run_io
+from app.services import context_service, llm_service, summary_service, vector_service
+
+# Summary, mind map and quiz generation for a single document, plus their stored copies.
+#
+# The whole-document summary, the default (overview) mind map and a pool of quiz questions
+# depend only on the document's content, so they are stored next to its index, under its
+# content-addressed blob prefix (blobs/{content_hash}/), and shared by every document with
+# the same file. They can be precomputed by the ingestion pipeline, and are otherwise
+# generated and stored on first request. Bump ARTIFACTS_VERSION when a prompt changes, so
+# stored copies made with the old prompt are regenerated.
+ARTIFACTS_VERSION = 1
+SUMMARY_FILE = "summary.json"
+MINDMAP_FILE = "mindmap.json"
+QUIZ_POOL_FILE = "quiz_pool.json"
+
+DEFAULT_MINDMAP_TOPIC = "the main topics of this document"
+
+SUMMARY_PROMPT = """
+Based ONLY on the following text, provide a high-quality summary with a main paragraph and a "Key Points" list.
+Do not add any preamble like "Here is the summary".
+Text to Summarize: --- {context} --- Summary:
+"""
+
+# This is a much more sophisticated prompt designed to extract a knowledge graph.
+MINDMAP_PROMPT = """
+Analyze the following text based on the central topic: "{topic}".
+Your task is to act as a knowledge graph expert and generate a JSON object representing a detailed mind map.
+
+The JSON object must have two keys: "nodes" and "edges".
+
+### Instructions for "nodes":
+- Each node must be an object with "id" (string), "position" ({{ "x": 0, "y": 0 }}), and a "data" object.
+- The "data" object for each node MUST contain the following three keys:
+  1. "label": A string for the main concept/entity name.
+  2. "description": A concise, one-sentence explanation of the concept based on the text.
+  3. "category": A single-word category for the concept. Choose from: ["Core Concept", "Process", "Example", "Property", "Person", "Location"]. This will be used for coloring.
+
+### Instructions for "edges":
+- Each edge must be an object with "id", "source" (source node id), "target" (target node id), and "label" (a string describing the relationship, e.g., "is a type of", "leads to", "defined by").
+
+### Example Structure:
+{{
+  "nodes": [
+    {{ "id": "1", "position": {{"x":0, "y":0}}, "data": {{ "label": "Photosynthesis", "description": "The process used by plants to convert light energy into chemical energy.", "category": "Process" }} }},
+    {{ "id": "2", "position": {{"x":0, "y":0}}, "data": {{ "label": "Chlorophyll", "description": "The green pigment responsible for absorbing light.", "category": "Property" }} }}
+  ],
+  "edges": [
+    {{ "id": "e1-2", "source": "1", "target": "2", "label": "requires" }}
+  ]
+}}
+
+IMPORTANT: Your response MUST be ONLY the valid JSON object. Do not include any explanations, markdown formatting, or any text outside the JSON structure.
+
+Context to analyze:
+---
+{context}
+---
+JSON Output:
+"""
+
+QUIZ_PROMPT = """
+Based ONLY on the following text, create a multiple-choice quiz with {num_questions} questions.
+Generate a JSON array of objects. Each object must have "question", "options" (an array of 4 strings), and "correctAnswer".
+IMPORTANT: Your entire response MUST be ONLY the JSON array.
+Text to analyze: --- {context} --- JSON Array Output:
+"""
+
+
+# --- Parsing LLM output ---
+
+def parse_mindmap(llm_response_str: str) -> dict:
+    json_start_index = llm_response_str.find('{')
+    json_end_index = llm_response_str.rfind('}')
+    if json_start_index == -1 or json_end_index == -1:
+        raise ValueError("No JSON object found in the LLM response.")
+    mind_map_json = json.loads(llm_response_str[json_start_index : json_end_index + 1])
+    if "nodes" not in mind_map_json or "edges" not in mind_map_json:
+        raise ValueError("Missing 'nodes' or 'edges' key in JSON")
+    return mind_map_json
+
+def parse_quiz(llm_response_str: str) -> list:
+    json_start_index = llm_response_str.find('[')
+    json_end_index = llm_response_str.rfind(']')
+    if json_start_index == -1 or json_end_index == -1:
+        raise ValueError("No JSON array found in the LLM response.")
+    quiz_json = json.loads(llm_response_str[json_start_index : json_end_index + 1])
+    if not isinstance(quiz_json, list) or not all("question" in q for q in quiz_json):
+        raise ValueError("Generated JSON is not a valid list of questions.")
+    return quiz_json
+
+
+# --- Stored copies ---
+
+def _load_stored(doc_id: str, file_name: str):
+    try:
+        path = vector_service.fetch_cached_file(vector_service.artifact_prefix(doc_id), file_name)
+    except Exception:
+        # Not generated yet for this content.
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        stored = json.load(f)
+    return stored["value"] if stored.get("version") == ARTIFACTS_VERSION else None
+
+def _store(doc_id: str, file_name: str, value):
+    data = json.dumps({"version": ARTIFACTS_VERSION, "value": value}).encode("utf-8")
+    vector_service.store_file(vector_service.artifact_prefix(doc_id), file_name, data, content_type="application/json")
+
+async def load_stored(doc_id: str, file_name: str):
+    return await run_io(_load_stored, doc_id, file_name)
+
+async def store(doc_id: str, file_name: str, value):
+    await run_io(_store, doc_id, file_name, value)
+
+
+# --- Generation ---
+
+async def summary_prompt(doc_id: str, mode: str = "full") -> Optional[str]:
+    """The final summary prompt: over every chunk ("full", map-reduce) or over the chunks
+    closest to a generic summary query ("retrieval"). None if the document has no text."""
+    if mode == "full":
+        return await summary_service.build_summary_prompt(doc_id)
+    context_chunks = await vector_service.retrieve_chunk_records_async(doc_id=doc_id, query=SUMMARY_RETRIEVAL_QUERY, top_k=20)
+    if not context_chunks:
+        return None
+    return SUMMARY_PROMPT.format(context=(await context_service.assemble_async(context_chunks))["text"])
+
+async def generate_mindmap(context: str, topic: str) -> dict:
+    return parse_mindmap(await llm_service.generate_chat_completion_async(MINDMAP_PROMPT.format(topic=topic, context=context)))
+
+async def generate_quiz(context: str, num_questions: int) -> list:
+    return parse_quiz(await llm_service.generate_chat_completion_async(QUIZ_PROMPT.format(num_questions=num_questions, context=context)))
+
+def _spread_chunks(doc_id: str, count: int) -> list[dict]:
+    # Evenly spaced chunks, so a quiz pool covers the whole document rather than one part.
+    _, chunks = vector_service.load_document(doc_id)
+    if not len(chunks):
+        return []
+    positions = np.unique(np.linspace(0, len(chunks) - 1, num=min(count, len(chunks))).astype(int))
+    return vector_service.chunk_records(doc_id, [int(i) for i in positions])
+
+async def get_summary(doc_id: str, refresh: bool = False) -> Optional[str]:
+    """The stored whole-document summary, generated (and stored) if missing or refresh is set."""
+    if not refresh:
+        summary = await load_stored(doc_id, SUMMARY_FILE)
+        if summary is not None:
+            return summary
+    prompt = await summary_prompt(doc_id, "full")
+    if prompt is None:
+        return None
+    summary = await llm_service.generate_chat_completion_async(prompt)
+    await store(doc_id, SUMMARY_FILE, summary)
+    return summary
+
+async def get_default_mindmap(doc_id: str, refresh: bool = False) -> Optional[dict]:
+    """The stored overview mind map, built from the whole-document summary."""
+    if not refresh:
+        mind_map = await load_stored(doc_id, MINDMAP_FILE)
+        if mind_map is not None:
+            return mind_map
+    summary = await get_summary(doc_id)
+    if summary is None:
+        return None
+    mind_map = await generate_mindmap(summary, DEFAULT_MINDMAP_TOPIC)
+    await store(doc_id, MINDMAP_FILE, mind_map)
+    return mind_map
+
+async def get_quiz_pool(doc_id: str, refresh: bool = False) -> list:
+    """The stored pool of QUIZ_POOL_SIZE questions spread over the whole document."""
+    if not refresh:
+        pool = await load_stored(doc_id, QUIZ_POOL_FILE)
+        if pool is not None:
+            return pool
+    context_chunks = await run_io(_spread_chunks, doc_id, QUIZ_POOL_CONTEXT_CHUNKS)
+    if not context_chunks:
+        return []
+    # Only duplicates and overlaps are removed: the pool is meant to cover every spread chunk.
+    context = await context_service.assemble_async(context_chunks, budget_tokens=None)
+    pool = await generate_quiz(context["text"], QUIZ_POOL_SIZE)
+    await store(doc_id, QUIZ_POOL_FILE, pool)
+    return pool
+
+async def get_quiz(doc_id: str, num_questions: int, refresh: bool = False) -> list:
+    pool = await get_quiz_pool(doc_id, refresh)
+    return random.sample(pool, min(num_questions, len(pool)))
+
+async def precompute(doc_id: str):
+    """Generates and stores whatever is missing of the summary, mind map and quiz pool."""
+    await get_default_mindmap(doc_id)  # also stores the summary it is built from
+    await get_quiz_pool(doc_id)
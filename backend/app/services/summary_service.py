@@ -0,0 +1,136 @@
+# backend/app/services/summary_service.py
+import asyncio
+import hashlib
+import os
+import threading
+from typing import List, Optional
+
+from app.core import metrics
+from app.core.config import (
+    MODEL_NAME, SUMMARY_CACHE_DIR, SUMMARY_CACHE_MAX_BYTES, SUMMARY_GROUP_CHUNKS, SUMMARY_REDUCE_FANOUT, SUMMARY_MAX_CONCURRENCY,
+)
+from app.core.disk_cache import DiskBudget
+from app.core.executors import run_io
+from app.services import llm_service, vector_service
+
+# Hierarchical ("map-reduce") summary of a whole document:
+#   map     consecutive chunks are grouped and each group is summarised on its own,
+#   reduce  the summaries are combined in groups of about SUMMARY_REDUCE_FANOUT, level by
+#           level, until few enough are left for the final summary prompt.
+# Group boundaries are content-defined (a group ends after an item whose hash falls on a
+# boundary), so an edit only moves the boundaries next to the changed chunks. Every
+# intermediate summary is cached on disk under the hash of its inputs, so re-running after a
+# small edit only recomputes the groups, and the reduce branches above them, that changed.
+
+# Part of every cache key; bump it when the prompts below change.
+PROMPT_VERSION = "1"
+
+_MAP_PROMPT = """
+Summarize the following part of a document in a short paragraph. Keep its key definitions, facts, figures and conclusions.
+Do not add any preamble like "Here is the summary".
+Text: --- {text} --- Summary:
+"""
+
+_REDUCE_PROMPT = """
+The following are summaries of consecutive parts of a document, in order. Combine them into one concise summary that keeps their key points in the same order.
+Do not add any preamble like "Here is the summary".
+Summaries: --- {text} --- Combined summary:
+"""
+
+FINAL_PROMPT = """
+Based ONLY on the following summaries of consecutive sections of a document, provide a high-quality summary of the whole document with a main paragraph and a "Key Points" list.
+Do not add any preamble like "Here is the summary".
+Section summaries: --- {text} --- Summary:
+"""
+
+_SEPARATOR = "\n\n"
+
+def _key(kind: str, hashes: List[str]) -> str:
+    return hashlib.sha256("\0".join([MODEL_NAME, PROMPT_VERSION, kind, *hashes]).encode("utf-8")).hexdigest()
+
+def _content_defined_groups(hashes: List[str], target: int) -> List[range]:
+    """Splits positions 0..len(hashes) into consecutive groups of about target items, ending a
+    group after an item whose hash is 0 modulo target. Groups (but the last) hold between
+    max(2, target/2) and 2*target items, so every reduce level at least halves the count."""
+    groups, start = [], 0
+    for i, item_hash in enumerate(hashes):
+        size = i + 1 - start
+        on_boundary = int(item_hash[:8], 16) % target == 0
+        if (on_boundary and size >= max(2, target // 2)) or size >= 2 * target:
+            groups.append(range(start, i + 1))
+            start = i + 1
+    if start < len(hashes):
+        groups.append(range(start, len(hashes)))
+    return groups
+
+
+# --- On-disk cache of intermediate summaries ---
+
+# Intermediate summaries of documents that are no longer read age out of the disk cache.
+_cache_budget = DiskBudget("summary_cache", SUMMARY_CACHE_DIR, SUMMARY_CACHE_MAX_BYTES)
+
+def _cache_path(key: str) -> str:
+    return os.path.join(SUMMARY_CACHE_DIR, key[:2], f"{key}.txt")
+
+def _read_cached(key: str) -> Optional[str]:
+    path = _cache_path(key)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            summary = f.read()
+    except FileNotFoundError:
+        return None
+    _cache_budget.touch(path)
+    return summary
+
+def _write_cached(key: str, summary: str):
+    path = _cache_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(summary)
+    os.replace(tmp_path, path)
+    _cache_budget.added(os.path.getsize(path))
+
+async def _summarize(key: str, prompt: str, llm_slots: asyncio.Semaphore) -> str:
+    summary = await run_io(_read_cached, key)
+    metrics.increment("summary_cache.hits" if summary is not None else "summary_cache.misses")
+    if summary is None:
+        async with llm_slots:
+            summary = await llm_service.generate_chat_completion_async(prompt)
+        await run_io(_write_cached, key, summary)
+    return summary
+
+
+def _load_chunks(doc_id: str):
+    _, chunks = vector_service.load_document(doc_id)
+    texts = list(chunks)
+    hashes = [chunks.metadata(i).get("hash") or vector_service.chunk_hash(text) for i, text in enumerate(texts)]
+    return texts, hashes
+
+async def build_summary_prompt(doc_id: str) -> Optional[str]:
+    """Runs the map and intermediate reduce levels over every chunk of the document and returns
+    the final summary prompt (for the caller to complete or stream), or None if it is empty."""
+    texts, hashes = await run_io(_load_chunks, doc_id)
+    if not texts:
+        return None
+    # One semaphore per run, so each summary being built has SUMMARY_MAX_CONCURRENCY LLM calls
+    # in flight. Precomputation from ingestion jobs also runs on the server loop (submitted
+    # with run_coroutine_threadsafe), so these runs all share that loop.
+    llm_slots = asyncio.Semaphore(SUMMARY_MAX_CONCURRENCY)
+
+    groups = _content_defined_groups(hashes, SUMMARY_GROUP_CHUNKS)
+    keys = [_key("map", hashes[group.start:group.stop]) for group in groups]
+    summaries = await asyncio.gather(*(
+        _summarize(key, _MAP_PROMPT.format(text=_SEPARATOR.join(texts[group.start:group.stop])), llm_slots)
+        for key, group in zip(keys, groups)
+    ))
+
+    while len(summaries) > max(2, SUMMARY_REDUCE_FANOUT):
+        groups = _content_defined_groups(keys, SUMMARY_REDUCE_FANOUT)
+        keys = [_key("reduce", keys[group.start:group.stop]) for group in groups]
+        summaries = await asyncio.gather(*(
+            _summarize(key, _REDUCE_PROMPT.format(text=_SEPARATOR.join(summaries[group.start:group.stop])), llm_slots)
+            for key, group in zip(keys, groups)
+        ))
+
+    return FINAL_PROMPT.format(text=_SEPARATOR.join(summaries))
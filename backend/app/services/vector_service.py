@@ -1,100 +1,752 @@
 # backend/app/services/vector_service.py (Complete, Final Corrected File)
+import asyncio
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
+import hashlib
+import heapq
 import io
-from supabase import create_client, Client
-from typing import List
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from cachetools import LRUCache, TTLCache
+from typing import Iterable, List, Optional
 
-from app.core.config import EMBEDDING_MODEL, SUPABASE_URL, SUPABASE_SERVICE_KEY
+from app.core.executors import run_io, run_cpu
+from app.core.config import (
+    EMBEDDING_MODEL, VECTOR_CACHE_DIR, VECTOR_CACHE_MAX_BYTES, VECTOR_CACHE_DISK_MAX_BYTES,
+    RETRIEVAL_MAX_WORKERS, RETRIEVAL_DOC_TIMEOUT_SECONDS, EMBED_MAX_BATCH_SIZE, EMBED_MAX_WAIT_MS,
+    EMBED_INGEST_SLICE_SIZE, QUERY_EMBEDDING_CACHE_MAX_ENTRIES, QUERY_EMBEDDING_CACHE_MAX_BYTES,
+    INDEX_FLAT_MAX_VECTORS, INDEX_HNSW_MAX_VECTORS, INDEX_HNSW_M, INDEX_HNSW_EF_CONSTRUCTION,
+    INDEX_HNSW_EF_SEARCH, INDEX_IVF_NPROBE, INDEX_PQ_M, CHUNK_STORE_COMPRESS, INDEX_MMAP_ENABLED, EMBEDDING_CACHE_PATH,
+    ARTIFACT_PREFIX_TTL_SECONDS, HYBRID_RETRIEVAL_ENABLED, HYBRID_CANDIDATES, RRF_K, LEXICAL_CACHE_MAX_BYTES,
+)
+from app.core import db, metrics, storage
+from app.core.disk_cache import DiskBudget
+from app.core.resilience import CircuitOpenError, is_transient
+from app.core.resources import get_embedding_model, get_supabase
+from app.services import chunk_store, lexical_index
 
-model = SentenceTransformer(EMBEDDING_MODEL)
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
-BUCKET_NAME = "files"
+INDEX_FILE = "doc.index"
+CHUNKS_FILE = "chunks.bin"
+# BM25 index of the chunks; documents indexed before it existed are searched by vector only.
+LEXICAL_FILE = "lexical.bin"
+# Documents indexed before the binary chunk store have a "\n---\n"-joined chunks.txt instead.
+LEGACY_CHUNKS_FILE = "chunks.txt"
+# Content-addressed artifacts: documents whose uploaded bytes hash the same share one index
+# and chunk store under blobs/{content_hash}/, recorded in documents.content_hash. Documents
+# uploaded before keep theirs under their own {doc_id}/ folder.
+BLOBS_PREFIX = "blobs"
 
-def create_and_store_embeddings(doc_id: str, chunks: list[str]):
-    try:
-        embeddings = model.encode(chunks, convert_to_tensor=False)
-        dimension = embeddings.shape[1]
+# Two-tier cache for downloaded documents:
+#   1. In memory: storage prefix -> (faiss.Index, chunk reader, size_in_bytes), evicted LRU
+#      once the total size of the cached files exceeds VECTOR_CACHE_MAX_BYTES.
+#   2. On disk: the raw files under VECTOR_CACHE_DIR/{prefix}/, so an evicted document
+#      (or a restarted worker) is reloaded locally instead of from Supabase Storage. Files
+#      are evicted least recently used once they total VECTOR_CACHE_DISK_MAX_BYTES; an open
+#      (memory-mapped) file stays readable after its removal.
+# Keying by prefix means documents sharing a blob also share the cached copy.
+_document_cache = LRUCache(maxsize=VECTOR_CACHE_MAX_BYTES, getsizeof=lambda entry: entry[2])
+# doc_id -> storage prefix. Replacing a document moves it to a new blob; request paths
+# refresh the entry from the documents row they read anyway (the ownership check, or the
+# session's documents), so the TTL only bounds background readers such as precomputation.
+_artifact_prefixes = TTLCache(maxsize=4096, ttl=ARTIFACT_PREFIX_TTL_SECONDS)
+_disk_cache = DiskBudget("vector_cache", VECTOR_CACHE_DIR, VECTOR_CACHE_DISK_MAX_BYTES)
+# Storage prefix -> LexicalIndex, evicted LRU by size, and prefixes known to have none. The
+# files under a prefix never change once a document record points at it (blobs are content
+# addressed, and legacy folders are only ever deleted), so a missing index is remembered for
+# the life of the process.
+_lexical_cache = LRUCache(maxsize=LEXICAL_CACHE_MAX_BYTES, getsizeof=lambda lexical: lexical.nbytes)
+_missing_lexical: set[str] = set()
+_cache_lock = threading.Lock()
+
+# Shared worker pool for multi-document retrieval, so a large session cannot open an
+# unbounded number of storage connections.
+_retrieval_executor = ThreadPoolExecutor(max_workers=RETRIEVAL_MAX_WORKERS, thread_name_prefix="retrieval")
+
+class EmbeddingBatcher:
+    """Runs every model.encode call on one background thread, with two queues.
+
+    Query encodes from concurrent requests are coalesced into a single batch: the first
+    query waits up to max_wait_ms for others to arrive (or until max_batch_size is reached).
+    Document encodes from ingestion are processed in slices of ingest_slice_size texts, and
+    only while no query is waiting, so a large upload cannot starve interactive requests.
+    """
+
+    def __init__(self, load_model, max_batch_size: int, max_wait_ms: float, ingest_slice_size: int):
+        # Called on the first encode, so creating the batcher does not load the model.
+        self.load_model = load_model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.ingest_slice_size = ingest_slice_size
+        self._queries = deque()  # (text, Future)
+        self._ingest_jobs = deque()  # {"texts", "future", "position", "parts"}
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def submit_query(self, text: str) -> Future:
+        future = Future()
+        with self._condition:
+            self._queries.append((text, future))
+            self._condition.notify()
+        return future
+
+    def submit_documents(self, texts: list[str]) -> Future:
+        future = Future()
+        with self._condition:
+            self._ingest_jobs.append({"texts": texts, "future": future, "position": 0, "parts": []})
+            self._condition.notify()
+        return future
+
+    def _encode(self, texts: list[str]) -> np.ndarray:
+        return np.asarray(self.load_model().encode(texts, convert_to_tensor=False), dtype="float32")
+
+    def _next_query_batch(self) -> list:
+        # Called with the condition held and at least one query queued.
+        deadline = time.monotonic() + self.max_wait
+        while len(self._queries) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._condition.wait(remaining)
+        batch = [self._queries.popleft() for _ in range(min(len(self._queries), self.max_batch_size))]
+        # A caller that gave up (e.g. a cancelled await on the wrapped future) is dropped here,
+        # so its future is never resolved twice.
+        return [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+
+    def _next_ingest_job(self) -> Optional[dict]:
+        # Called with the condition held and at least one ingest job queued.
+        job = self._ingest_jobs[0]
+        if not job["future"].running() and not job["future"].set_running_or_notify_cancel():
+            self._ingest_jobs.popleft()
+            return None
+        return job
+
+    def _run(self):
+        while True:
+            try:
+                with self._condition:
+                    while not self._queries and not self._ingest_jobs:
+                        self._condition.wait()
+                    if self._queries:
+                        batch, job = self._next_query_batch(), None
+                    else:
+                        batch, job = None, self._next_ingest_job()
+
+                if batch:
+                    self._run_query_batch(batch)
+                elif job is not None:
+                    self._run_ingest_slice(job)
+            except Exception as e:
+                # This thread serves every encode in the process, so it must outlive any one batch.
+                print(f"Warning: Embedding batcher error: {e}")
+
+    def _run_query_batch(self, batch: list):
+        try:
+            vectors = self._encode([text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), vector in zip(batch, vectors):
+            future.set_result(vector.reshape(1, -1))
+
+    def _run_ingest_slice(self, job: dict):
+        start = job["position"]
+        texts = job["texts"][start:start + self.ingest_slice_size]
+        try:
+            job["parts"].append(self._encode(texts))
+            job["position"] = start + len(texts)
+            finished = job["position"] >= len(job["texts"])
+        except Exception as e:
+            job["future"].set_exception(e)
+            finished = True
+        if finished:
+            with self._condition:
+                self._ingest_jobs.popleft()
+            if not job["future"].done():
+                job["future"].set_result(np.vstack(job["parts"]) if job["parts"] else np.empty((0, self.load_model().get_sentence_embedding_dimension()), dtype="float32"))
+
+_embedder = EmbeddingBatcher(get_embedding_model, EMBED_MAX_BATCH_SIZE, EMBED_MAX_WAIT_MS, EMBED_INGEST_SLICE_SIZE)
+
+
+class QueryEmbeddingCache:
+    """LRU memo of normalised query text -> (1, dim) float32 embedding, bounded both by
+    entry count and by the bytes held in keys and vectors. Hits and misses are reported
+    as the query_embedding_cache.* counters, so metrics hooks see them."""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        # all-MiniLM-L6-v2 is uncased, so case and whitespace do not change the embedding.
+        return " ".join(query.lower().split())
+
+    @staticmethod
+    def _entry_size(key: str, vector: np.ndarray) -> int:
+        return len(key) + vector.nbytes
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+        metrics.increment("query_embedding_cache.hits" if vector is not None else "query_embedding_cache.misses")
+        return vector
+
+    def put(self, key: str, vector: np.ndarray):
+        vector.flags.writeable = False  # shared between requests
+        size = self._entry_size(key, vector)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.nbytes -= self._entry_size(key, previous)
+            self._entries[key] = vector
+            self.nbytes += size
+            while len(self._entries) > self.max_entries or self.nbytes > self.max_bytes:
+                evicted_key, evicted = self._entries.popitem(last=False)
+                self.nbytes -= self._entry_size(evicted_key, evicted)
+
+_query_embeddings = QueryEmbeddingCache(QUERY_EMBEDDING_CACHE_MAX_ENTRIES, QUERY_EMBEDDING_CACHE_MAX_BYTES)
+
+def encode_query(query: str) -> np.ndarray:
+    """Returns the (1, dim) float32 embedding of a query, batched with concurrent queries."""
+    key = QueryEmbeddingCache.normalize(query)
+    vector = _query_embeddings.get(key)
+    if vector is None:
+        vector = _embedder.submit_query(key).result()
+        _query_embeddings.put(key, vector)
+    return vector
+
+async def encode_query_async(query: str) -> np.ndarray:
+    # Awaits the batcher directly instead of parking a CPU-pool thread on the future.
+    key = QueryEmbeddingCache.normalize(query)
+    vector = _query_embeddings.get(key)
+    if vector is None:
+        vector = await asyncio.wrap_future(_embedder.submit_query(key))
+        _query_embeddings.put(key, vector)
+    return vector
+
+def precompute_query_embeddings(queries: list[str]):
+    """Warms the memo, e.g. with the fixed /summarize and /quiz retrieval queries at startup."""
+    for query in queries:
+        encode_query(query)
+
+def encode_documents(texts: list[str]) -> np.ndarray:
+    """Returns (len(texts), dim) float32 embeddings, encoded at ingestion priority."""
+    return _embedder.submit_documents(texts).result()
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ChunkEmbeddingCache:
+    """Persistent chunk hash -> embedding map in a local SQLite file shared by the worker
+    processes on the host, so a re-upload or a revised version of a document only encodes
+    the chunks whose text changed. Hits and misses are reported as the
+    chunk_embedding_cache.* counters."""
+
+    # Stays under SQLite's default limit of 999 bound parameters per statement.
+    _LOOKUP_BATCH = 500
+
+    def __init__(self, path: str, model_name: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.model_name = model_name
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, chunk_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+            "PRIMARY KEY (model, chunk_hash))"
+        )
+        self._connection.commit()
+        self._lock = threading.Lock()
+
+    def get_many(self, hashes: list[str]) -> dict:
+        unique = list(dict.fromkeys(hashes))
+        found = {}
+        with self._lock:
+            for start in range(0, len(unique), self._LOOKUP_BATCH):
+                batch = unique[start:start + self._LOOKUP_BATCH]
+                rows = self._connection.execute(
+                    f"SELECT chunk_hash, vector FROM embeddings WHERE model = ? AND chunk_hash IN ({', '.join('?' * len(batch))})",
+                    [self.model_name, *batch],
+                ).fetchall()
+                found.update((row_hash, np.frombuffer(vector, dtype="float32")) for row_hash, vector in rows)
+        metrics.increment("chunk_embedding_cache.hits", len(found))
+        metrics.increment("chunk_embedding_cache.misses", len(unique) - len(found))
+        return found
+
+    def put_many(self, vectors: dict):
+        rows = [(self.model_name, row_hash, np.asarray(vector, dtype="float32").tobytes()) for row_hash, vector in vectors.items()]
+        with self._lock:
+            self._connection.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows)
+            self._connection.commit()
+
+_chunk_embeddings = ChunkEmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_MODEL)
+
+def encode_chunks(texts: list[str], hashes: list[str]) -> np.ndarray:
+    """Like encode_documents, but reuses the cached embedding of every chunk hash seen before
+    and encodes each new chunk text only once."""
+    vectors = _chunk_embeddings.get_many(hashes)
+    missing = {}
+    for text, text_hash in zip(texts, hashes):
+        if text_hash not in vectors:
+            missing.setdefault(text_hash, text)
+    if missing:
+        fresh = dict(zip(missing, encode_documents(list(missing.values()))))
+        _chunk_embeddings.put_many(fresh)
+        vectors.update(fresh)
+    if not hashes:
+        return np.empty((0, get_embedding_model().get_sentence_embedding_dimension()), dtype="float32")
+    return np.vstack([vectors[text_hash] for text_hash in hashes])
+
+def _local_path(doc_id: str, file_name: str) -> str:
+    return os.path.join(VECTOR_CACHE_DIR, doc_id, file_name)
+
+def _write_local_file(doc_id: str, file_name: str, data: bytes) -> str:
+    path = _local_path(doc_id, file_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write to a temporary file first so a concurrent reader never sees a partial file.
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    _disk_cache.added(len(data))
+    return path
+
+def _fetch_to_disk(doc_id: str, file_name: str, deadline: Optional[float] = None) -> str:
+    path = _local_path(doc_id, file_name)
+    if os.path.exists(path):
+        _disk_cache.touch(path)
+        return path
+    data = storage.download(f"{doc_id}/{file_name}", deadline=deadline)
+    return _write_local_file(doc_id, file_name, data)
+
+def build_index(embeddings: np.ndarray):
+    """Builds the index for one document, picking the type from its chunk count:
+    exact Flat for small documents, HNSW for medium ones, and IVF-PQ for very large ones,
+    where the compressed codes keep the stored index small and search sub-linear."""
+    num_vectors, dimension = embeddings.shape
+    if num_vectors <= INDEX_FLAT_MAX_VECTORS:
         index = faiss.IndexFlatL2(dimension)
-        index.add(np.array(embeddings).astype('float32'))
-
-        index_buffer = io.BytesIO()
-        faiss.write_index(index, faiss.PyCallbackIOWriter(index_buffer.write))
-        index_buffer.seek(0) 
-        
-        chunks_str = "\n---\n".join(chunks)
-        chunks_buffer = io.BytesIO(chunks_str.encode("utf-8"))
-        chunks_buffer.seek(0)
-
-        index_path = f"{doc_id}/doc.index"
-        chunks_path = f"{doc_id}/chunks.txt"
-        
-        supabase.storage.from_(BUCKET_NAME).upload(file=index_buffer.read(), path=index_path, file_options={"content-type": "application/octet-stream"})
-        supabase.storage.from_(BUCKET_NAME).upload(file=chunks_buffer.read(), path=chunks_path, file_options={"content-type": "text/plain"})
+    elif num_vectors <= INDEX_HNSW_MAX_VECTORS:
+        index = faiss.IndexHNSWFlat(dimension, INDEX_HNSW_M)
+        index.hnsw.efConstruction = INDEX_HNSW_EF_CONSTRUCTION
+    else:
+        # ~4*sqrt(n) lists, keeping at least 39 training points per list as FAISS expects.
+        nlist = max(1, min(int(4 * np.sqrt(num_vectors)), num_vectors // 39))
+        index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dimension), dimension, nlist, INDEX_PQ_M, 8)
+        index.train(embeddings)
+    index.add(embeddings)
+    configure_search(index)
+    return index
+
+def configure_search(index):
+    """Applies the configured search-time parameters (efSearch, nprobe) to a loaded index."""
+    parameters = faiss.ParameterSpace()
+    if isinstance(index, faiss.IndexHNSW):
+        parameters.set_index_parameter(index, "efSearch", INDEX_HNSW_EF_SEARCH)
+    elif isinstance(index, faiss.IndexIVF):
+        parameters.set_index_parameter(index, "nprobe", INDEX_IVF_NPROBE)
+
+# File signatures (FAISS fourcc) of the indexes whose codes are stored flat: IndexFlatL2/IP
+# and HNSW with flat storage.
+_FLAT_CODE_FOURCCS = {b"IxF2", b"IxFI", b"IHNf"}
+
+def _stores_flat_codes(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(4) in _FLAT_CODE_FOURCCS
+
+def read_index_file(path: str):
+    """Opens a local index file read-only through mmap, so the vectors live in the shared page
+    cache and every uvicorn worker on the host maps the same copy instead of holding its own."""
+    if INDEX_MMAP_ENABLED:
+        # IO_FLAG_MMAP maps IVF inverted lists. Newer FAISS releases also map the codes of flat
+        # (and HNSW storage) indexes with IO_FLAG_MMAP_IFC, which other index types reject.
+        io_flags = [faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY]
+        if hasattr(faiss, "IO_FLAG_MMAP_IFC") and _stores_flat_codes(path):
+            io_flags.insert(0, io_flags[0] | faiss.IO_FLAG_MMAP_IFC)
+        for flags in io_flags:
+            try:
+                index = faiss.read_index(path, flags)
+            except RuntimeError:
+                metrics.increment("index.mmap_failures")
+                continue
+            metrics.increment("index.mmap_reads")
+            return index
+    metrics.increment("index.memory_reads")
+    return faiss.read_index(path)
+
+def fetch_cached_file(prefix: str, file_name: str) -> str:
+    """Returns the local path of {prefix}/{file_name}, downloading it from storage on a miss."""
+    return _fetch_to_disk(prefix, file_name)
+
+def store_file(prefix: str, file_name: str, data: bytes, content_type: str = "application/octet-stream"):
+    """Uploads {prefix}/{file_name} to storage (overwriting) and writes it through to the local cache."""
+    storage.upload(f"{prefix}/{file_name}", data, content_type=content_type)
+    _write_local_file(prefix, file_name, data)
+
+def serialize_index(index) -> bytes:
+    index_buffer = io.BytesIO()
+    faiss.write_index(index, faiss.PyCallbackIOWriter(index_buffer.write))
+    return index_buffer.getvalue()
+
+def stores_exact_vectors(index) -> bool:
+    """Whether index.reconstruct returns the vectors that were added: true for Flat and HNSW
+    (flat storage), false for IVF-PQ, whose reconstructions are lossy decodings of PQ codes."""
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap):
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    return isinstance(index, faiss.IndexFlat)
+
+def _chunk_hashes(chunks) -> list[str]:
+    return [chunks.metadata(i).get("hash") or chunk_hash(chunks[i]) for i in range(len(chunks))]
+
+def document_vectors(doc_id: str) -> np.ndarray:
+    """Returns the exact embeddings of a document's chunks, in chunk order. Called while
+    serving a chat request (a session index migrating the document), so chunks missing from
+    the embedding cache are encoded at query priority, as in chunk_vectors."""
+    index, chunks = load_document(doc_id)
+    if stores_exact_vectors(index):
+        return index.reconstruct_n(0, index.ntotal)
+    # IVF-PQ indexes only keep compressed codes, so take the embeddings from the chunk
+    # embedding cache, or encode the chunk text again.
+    return chunk_vectors(doc_id, list(range(len(chunks))), _chunk_hashes(chunks))
+
+def _cache_document(prefix: str, index, chunks, nbytes: int):
+    with _cache_lock:
+        # cachetools refuses values larger than the whole cache; such documents stay disk-only.
+        if nbytes <= _document_cache.maxsize:
+            _document_cache[prefix] = (index, chunks, nbytes)
+
+def content_prefix(content_hash: str) -> str:
+    return f"{BLOBS_PREFIX}/{content_hash}"
+
+def artifact_prefix(doc_id: str) -> str:
+    """Returns the storage prefix holding a document's index and chunks."""
+    with _cache_lock:
+        prefix = _artifact_prefixes.get(doc_id)
+    if prefix is not None:
+        return prefix
+    rows = db.execute(get_supabase().table("documents").select("content_hash").eq("storage_path", doc_id).limit(1)).data
+    if not rows:
+        # Not registered (yet): only documents with a record are worth remembering.
+        return doc_id
+    return remember_artifact_prefix(doc_id, rows[0].get("content_hash"))
+
+def remember_artifact_prefix(doc_id: str, content_hash: Optional[str]) -> str:
+    """Records the prefix of a documents row the caller has just read, and returns it."""
+    prefix = content_prefix(content_hash) if content_hash else doc_id
+    with _cache_lock:
+        _artifact_prefixes[doc_id] = prefix
+    return prefix
+
+def resolve_artifact_prefixes(doc_ids: List[str]) -> dict:
+    """Reads the current prefix of each document in one query (documents without a record
+    map to their own doc_id)."""
+    if not doc_ids:
+        return {}
+    rows = db.execute(get_supabase().table("documents").select("storage_path, content_hash").in_("storage_path", doc_ids)).data
+    prefixes = {doc_id: doc_id for doc_id in doc_ids}
+    for row in rows:
+        prefixes[row["storage_path"]] = remember_artifact_prefix(row["storage_path"], row.get("content_hash"))
+    return prefixes
+
+def artifacts_exist(prefix: str) -> bool:
+    stored_files = storage.list_files(f"{prefix}/")
+    names = {f["name"] for f in stored_files}
+    return INDEX_FILE in names and CHUNKS_FILE in names
+
+def load_document(doc_id: str, deadline: Optional[float] = None):
+    """Returns the (faiss index, chunk reader) pair for a document, downloading it at most once.
+    The reader supports len(), chunks[i] and chunks.metadata(i). A deadline (time.monotonic())
+    bounds the downloads."""
+    prefix = artifact_prefix(doc_id)
+    with _cache_lock:
+        entry = _document_cache.get(prefix)
+    if entry is not None:
+        return entry[0], entry[1]
+
+    index_path = _fetch_to_disk(prefix, INDEX_FILE, deadline)
+    try:
+        chunks_path = _fetch_to_disk(prefix, CHUNKS_FILE, deadline)
+    except TimeoutError:
+        raise
+    except Exception:
+        chunks_path = _fetch_to_disk(prefix, LEGACY_CHUNKS_FILE, deadline)
+
+    index = read_index_file(index_path)
+    configure_search(index)
+    chunks = chunk_store.open_chunks(chunks_path)
+
+    _cache_document(prefix, index, chunks, os.path.getsize(index_path) + os.path.getsize(chunks_path))
+    return index, chunks
+
+def _cache_lexical(prefix: str, lexical):
+    with _cache_lock:
+        if lexical.nbytes <= _lexical_cache.maxsize:
+            _lexical_cache[prefix] = lexical
+
+def load_lexical_index(doc_id: str):
+    """Returns the document's LexicalIndex, or None if it was indexed without one."""
+    prefix = artifact_prefix(doc_id)
+    with _cache_lock:
+        lexical = _lexical_cache.get(prefix)
+        if lexical is not None or prefix in _missing_lexical:
+            return lexical
+    try:
+        path = _fetch_to_disk(prefix, LEXICAL_FILE)
     except Exception as e:
-        print(f"Error during embedding creation or upload: {e}")
-        raise e
+        # Only a definite answer from storage is remembered; after a network error or a
+        # circuit breaker rejection the next query tries again.
+        if not is_transient(e) and not isinstance(e, CircuitOpenError):
+            with _cache_lock:
+                _missing_lexical.add(prefix)
+        return None
+    lexical = lexical_index.LexicalIndex(path)
+    _cache_lexical(prefix, lexical)
+    return lexical
 
-def retrieve_relevant_chunks_from_multiple_docs(doc_ids: List[str], query: str, top_k: int = 10) -> List[dict]:
-    query_embedding = model.encode([query])
-    all_chunks_with_scores = []
+def invalidate_document(doc_id: str):
+    """Drops a document from both cache tiers. Called when the document is deleted.
+    A shared blob stays cached until release_artifacts removes it."""
+    with _cache_lock:
+        _artifact_prefixes.pop(doc_id, None)
+        _document_cache.pop(doc_id, None)
+        _lexical_cache.pop(doc_id, None)
+        _missing_lexical.discard(doc_id)
+    shutil.rmtree(os.path.join(VECTOR_CACHE_DIR, doc_id), ignore_errors=True)
 
-    for doc_id in doc_ids:
+def release_legacy_artifacts(doc_id: str):
+    """Deletes the index and chunks a document uploaded before content addressing kept in its
+    own {doc_id}/ folder, once it has moved to a blob. The folder's other files (the original
+    upload and its PDF rendition) stay."""
+    storage.remove([f"{doc_id}/{name}" for name in (INDEX_FILE, CHUNKS_FILE, LEGACY_CHUNKS_FILE, LEXICAL_FILE)])
+    with _cache_lock:
+        _document_cache.pop(doc_id, None)
+        _lexical_cache.pop(doc_id, None)
+        _missing_lexical.discard(doc_id)
+    for name in (INDEX_FILE, CHUNKS_FILE, LEGACY_CHUNKS_FILE, LEXICAL_FILE):
         try:
-            index_path = f"{doc_id}/doc.index"
-            chunks_path = f"{doc_id}/chunks.txt"
-
-            # The download() method returns the raw bytes of the file directly.
-            index_data_bytes = supabase.storage.from_(BUCKET_NAME).download(path=index_path)
-            chunks_data_bytes = supabase.storage.from_(BUCKET_NAME).download(path=chunks_path)
-
-            # --- FIX #1: Pass the bytes object directly to BytesIO ---
-            index_buffer = io.BytesIO(index_data_bytes)
-            index = faiss.read_index(faiss.PyCallbackIOReader(index_buffer.read))
-            
-            # --- FIX #2: Decode the bytes object directly ---
-            chunks_str = chunks_data_bytes.decode("utf-8")
-            chunks = chunks_str.strip().split("\n---\n")
-
-            distances, indices = index.search(np.array(query_embedding).astype('float32'), top_k * 2)
-
-            for i in range(len(indices[0])):
-                idx = indices[0][i]
-                if idx < len(chunks):
-                    all_chunks_with_scores.append({
-                        "doc_id": doc_id,
-                        "text": chunks[idx],
-                        "score": distances[0][i]
-                    })
+            os.remove(_local_path(doc_id, name))
+        except FileNotFoundError:
+            pass
+
+def release_artifacts(content_hash: str) -> bool:
+    """Deletes the blob of content_hash once no document record references it any more, i.e.
+    the documents.content_hash rows are its reference count. Returns whether it was deleted."""
+    references = db.execute(get_supabase().table("documents").select("id", count="exact").eq("content_hash", content_hash)).count
+    if references:
+        return False
+    prefix = content_prefix(content_hash)
+    storage.remove_folder(f"{prefix}/")
+    with _cache_lock:
+        _document_cache.pop(prefix, None)
+        _lexical_cache.pop(prefix, None)
+    shutil.rmtree(os.path.join(VECTOR_CACHE_DIR, prefix), ignore_errors=True)
+    return True
+
+def count_tokens(text: str) -> int:
+    """Number of word-piece tokens the embedding model sees for text (without [CLS]/[SEP])."""
+    return len(get_embedding_model().tokenizer(text, add_special_tokens=False)["input_ids"])
+
+def build_document_artifacts(prefix: str, chunks: Iterable[dict]) -> int:
+    """Embeds a stream of chunk dicts ({"text", ...metadata}) and writes the index and chunk
+    store (and BM25 index) for prefix to the local cache directory. Chunk text goes straight to
+    the chunk store and is embedded one slice at a time, so only the embeddings and postings
+    are kept in memory. Each chunk's hash is kept in its metadata and keys the chunk
+    embedding cache."""
+    chunks_path = _local_path(prefix, CHUNKS_FILE)
+    lexical_path = _local_path(prefix, LEXICAL_FILE)
+    embeddings, batch, batch_hashes = [], [], []
+    with chunk_store.ChunkStoreWriter(chunks_path, compress=CHUNK_STORE_COMPRESS) as writer, \
+            lexical_index.LexicalIndexWriter(lexical_path) as lexical_writer:
+        for chunk in chunks:
+            text = chunk["text"]
+            text_hash = chunk_hash(text)
+            writer.add(text, {**{key: value for key, value in chunk.items() if key != "text"}, "hash": text_hash})
+            lexical_writer.add(text)
+            batch.append(text)
+            batch_hashes.append(text_hash)
+            if len(batch) >= EMBED_INGEST_SLICE_SIZE:
+                embeddings.append(encode_chunks(batch, batch_hashes))
+                batch, batch_hashes = [], []
+        if batch:
+            embeddings.append(encode_chunks(batch, batch_hashes))
+        count = len(writer)
+    if count == 0:
+        os.remove(chunks_path)
+        os.remove(lexical_path)
+        return 0
+    _disk_cache.added(os.path.getsize(chunks_path) + os.path.getsize(lexical_path))
+
+    index = build_index(np.vstack(embeddings))
+    _write_local_file(prefix, INDEX_FILE, serialize_index(index))
+    return count
+
+def upload_document_artifacts(prefix: str):
+    """Uploads the locally built index, chunk store and BM25 index for prefix, and caches them
+    for retrieval."""
+    index_path = _local_path(prefix, INDEX_FILE)
+    chunks_path = _local_path(prefix, CHUNKS_FILE)
+    lexical_path = _local_path(prefix, LEXICAL_FILE)
+    for file_name, path in ((INDEX_FILE, index_path), (CHUNKS_FILE, chunks_path), (LEXICAL_FILE, lexical_path)):
+        with open(path, "rb") as f:
+            storage.upload(f"{prefix}/{file_name}", f.read())
+
+    # The uploading worker can serve the first queries from the mmap-backed local copy.
+    index = read_index_file(index_path)
+    configure_search(index)
+    _cache_document(prefix, index, chunk_store.open_chunks(chunks_path), os.path.getsize(index_path) + os.path.getsize(chunks_path))
+    _cache_lexical(prefix, lexical_index.LexicalIndex(lexical_path))
+    with _cache_lock:
+        _missing_lexical.discard(prefix)
+
+def seed_chunk_embeddings(doc_id: str) -> set:
+    """Copies a document's stored vectors into the chunk embedding cache, so rebuilding it
+    from a revised file only encodes the chunks whose text changed. Returns its chunk hashes."""
+    index, chunks = load_document(doc_id)
+    hashes = _chunk_hashes(chunks)
+    # Reconstructions from IVF-PQ codes are lossy and must never enter the cache: every later
+    # rebuild would index the degraded vectors, and store them again.
+    if stores_exact_vectors(index):
+        _chunk_embeddings.put_many(dict(zip(hashes, index.reconstruct_n(0, index.ntotal))))
+    return set(hashes)
+
+def local_chunk_hashes(prefix: str) -> list[str]:
+    chunks = chunk_store.open_chunks(_local_path(prefix, CHUNKS_FILE))
+    return [chunks.metadata(i)["hash"] for i in range(len(chunks))]
+
+def _search_document(doc_id: str, query_vector: np.ndarray, top_k: int, deadline: Optional[float] = None) -> List[dict]:
+    index, chunks = load_document(doc_id, deadline)
+    # FAISS releases the GIL while searching, so searches in the pool run in parallel.
+    distances, indices = index.search(query_vector, top_k)
+    return [
+        {"doc_id": doc_id, "text": chunks[idx], "score": float(distance)}
+        for distance, idx in zip(distances[0], indices[0])
+        if 0 <= idx < len(chunks)
+    ]
+
+def search_documents(doc_ids: List[str], query_vector: np.ndarray, top_k: int) -> List[dict]:
+    # Each document is downloaded (on a cache miss) and searched on the shared bounded pool,
+    # with RETRIEVAL_DOC_TIMEOUT_SECONDS of its own from the moment a pool thread picks it up;
+    # its downloads are only given what is left of that. A document that fails or runs out of
+    # time is skipped and the rest are still returned.
+    started = {}
+
+    def search(doc_id: str) -> List[dict]:
+        started[doc_id] = time.monotonic()
+        return _search_document(doc_id, query_vector, top_k, started[doc_id] + RETRIEVAL_DOC_TIMEOUT_SECONDS)
+
+    futures = {doc_id: _retrieval_executor.submit(search, doc_id) for doc_id in doc_ids}
+    all_chunks_with_scores = []
+    for doc_id, future in futures.items():
+        try:
+            # Still queued: wait for a thread to pick it up, then for the rest of its timeout.
+            while doc_id not in started and not future.done():
+                try:
+                    future.result(timeout=0.05)
+                except FutureTimeoutError:
+                    continue
+            remaining = started.get(doc_id, time.monotonic()) + RETRIEVAL_DOC_TIMEOUT_SECONDS - time.monotonic()
+            all_chunks_with_scores.extend(future.result(timeout=max(0.0, remaining)))
+        except (FutureTimeoutError, TimeoutError):
+            metrics.increment("retrieval.document_timeouts")
+            print(f"Warning: Timed out retrieving from document {doc_id}.")
         except Exception as e:
             print(f"Warning: Could not process document {doc_id}. Error: {e}")
-            continue
 
-    sorted_chunks = sorted(all_chunks_with_scores, key=lambda x: x['score'])
-    return sorted_chunks[:top_k]
+    return heapq.nsmallest(top_k, all_chunks_with_scores, key=lambda x: x['score'])
+
+def _rank_chunks(index, chunks, lexical, query: str, query_vector: np.ndarray, top_k: int) -> list[int]:
+    """Chunk positions for query, best first. With a BM25 index, the top HYBRID_CANDIDATES of
+    the vector and the lexical search are fused by reciprocal rank, so chunks containing the
+    exact query terms (codes, formula names) surface even when their embedding is not close."""
+    if lexical is None:
+        _, I = index.search(query_vector, top_k)
+        return [int(i) for i in I[0] if 0 <= i < len(chunks)]
+    candidates = max(top_k, HYBRID_CANDIDATES)
+    _, I = index.search(query_vector, candidates)
+    dense = [int(i) for i in I[0] if 0 <= i < len(chunks)]
+    lexical_ranking = [i for i, _ in lexical.search(query, candidates) if i < len(chunks)]
+    if not lexical_ranking:
+        return dense[:top_k]
+    metrics.increment("retrieval.hybrid_queries")
+    return lexical_index.reciprocal_rank_fusion([dense, lexical_ranking], k=RRF_K)[:top_k]
+
+def _chunk_records(doc_id: str, chunks, positions: Iterable[int]) -> List[dict]:
+    return [{**chunks.metadata(i), "doc_id": doc_id, "position": i, "text": chunks[i]} for i in positions]
+
+def chunk_records(doc_id: str, positions: Iterable[int]) -> List[dict]:
+    """Chunks at the given positions as dicts with their text, document, position in it and
+    stored metadata (page range, char offsets, token count and hash, when indexed with them)."""
+    _, chunks = load_document(doc_id)
+    return _chunk_records(doc_id, chunks, positions)
 
-# This function must also be corrected as it's used by other features.
-def retrieve_relevant_chunks(doc_id: str, query: str, top_k: int = 5) -> list[str]:
+def chunk_vectors(doc_id: str, positions: List[int], hashes: List[str]) -> np.ndarray:
+    """Exact embeddings of the chunks at positions, for use while serving a request: read from
+    the document's index when it stores exact vectors, otherwise from the chunk embedding cache,
+    with any misses encoded at query priority (never behind queued ingestion slices)."""
+    index, _ = load_document(doc_id)
+    if stores_exact_vectors(index):
+        return np.vstack([index.reconstruct(int(position)) for position in positions])
+    vectors = _chunk_embeddings.get_many(hashes)
+    missing = {text_hash: position for position, text_hash in zip(positions, hashes) if text_hash not in vectors}
+    if missing:
+        _, chunks = load_document(doc_id)
+        futures = {text_hash: _embedder.submit_query(chunks[position]) for text_hash, position in missing.items()}
+        fresh = {text_hash: future.result().reshape(-1) for text_hash, future in futures.items()}
+        _chunk_embeddings.put_many(fresh)
+        vectors.update(fresh)
+    return np.vstack([vectors[text_hash] for text_hash in hashes])
+
+def _load_lexical_index_or_none(doc_id: str):
+    if not HYBRID_RETRIEVAL_ENABLED:
+        return None
     try:
-        index_path = f"{doc_id}/doc.index"
-        chunks_path = f"{doc_id}/chunks.txt"
+        return load_lexical_index(doc_id)
+    except Exception as e:
+        print(f"Warning: Could not load the lexical index of {doc_id}. Error: {e}")
+        return None
 
-        index_data_bytes = supabase.storage.from_(BUCKET_NAME).download(path=index_path)
-        chunks_data_bytes = supabase.storage.from_(BUCKET_NAME).download(path=chunks_path)
+# --- Async variants used by the API endpoints ---
+# Downloads go to the I/O pool, encoding and FAISS search to the CPU pool.
 
-        # --- FIX #3: Apply the same fix here ---
-        index_buffer = io.BytesIO(index_data_bytes)
-        index = faiss.read_index(faiss.PyCallbackIOReader(index_buffer.read))
-        
-        chunks_str = chunks_data_bytes.decode("utf-8")
-        chunks = chunks_str.strip().split("\n---\n")
+async def retrieve_relevant_chunks_from_multiple_docs_async(doc_ids: List[str], query: str, top_k: int = 10) -> List[dict]:
+    query_vector = await encode_query_async(query)
+    return await run_io(search_documents, doc_ids, query_vector, top_k)
 
+async def retrieve_chunk_records_async(doc_id: str, query: str, top_k: int = 5, query_vector: Optional[np.ndarray] = None) -> List[dict]:
+    """Like retrieve_relevant_chunks_async, but returns chunk records (see chunk_records), best first."""
+    try:
+        index, chunks = await run_io(load_document, doc_id)
     except Exception as e:
         print(f"Error downloading or processing files from storage: {e}")
         return []
 
-    query_embedding = model.encode([query])
-    _, I = index.search(np.array(query_embedding).astype('float32'), top_k)
-    
-    return [chunks[i] for i in I[0] if i < len(chunks)]
\ No newline at end of file
+    lexical = await run_io(_load_lexical_index_or_none, doc_id)
+    if query_vector is None:
+        query_vector = await encode_query_async(query)
+    positions = await run_cpu(_rank_chunks, index, chunks, lexical, query, query_vector, top_k)
+
+    return _chunk_records(doc_id, chunks, positions)
+
+async def retrieve_relevant_chunks_async(doc_id: str, query: str, top_k: int = 5, query_vector: Optional[np.ndarray] = None) -> list[str]:
+    return [record["text"] for record in await retrieve_chunk_records_async(doc_id, query, top_k, query_vector)]
@@ -0,0 +1,103 @@
+# backend/benchmarks/auth_overhead.py
+"""Per-request cost of authenticating a bearer token: a cache hit, local verification with
+the JWT secret (HS256) and with a JWKS key (RS256), and the remote supabase.auth.get_user
+call. The remote call goes to a local fake Supabase Auth on loopback, so it is a lower
+bound: a real project adds its network round trip on top.
+
+    python -m benchmarks.auth_overhead [--requests 2000]
+"""
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SECRET = "benchmark-secret-with-at-least-32-bytes"
+os.environ.setdefault("SUPABASE_JWT_SECRET", SECRET)
+
+import jwt
+import numpy as np
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from app.core import auth
+
+USER_ID = "8c1f5a52-0000-4000-8000-000000000001"
+
+
+class FakeAuthHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    body = json.dumps({"id": USER_ID, "aud": "authenticated", "role": "authenticated", "email": "student@example.com",
+                       "app_metadata": {}, "user_metadata": {}, "created_at": "2025-01-01T00:00:00Z"}).encode()
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StaticJWKSClient:
+    def __init__(self, signing_key):
+        self.signing_key = signing_key
+
+    def get_signing_key_from_jwt(self, token):
+        return self.signing_key
+
+
+def make_token(key, algorithm: str) -> str:
+    now = int(time.time())
+    claims = {"sub": USER_ID, "aud": auth.AUDIENCE, "iat": now, "exp": now + 3600, "email": "student@example.com"}
+    return jwt.encode(claims, key, algorithm=algorithm)
+
+
+def timed(call, count: int) -> list[float]:
+    latencies = []
+    for _ in range(count):
+        started = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def report(name: str, latencies: list[float]):
+    p50, p95 = np.percentile(latencies, [50, 95]) * 1e6
+    print(f"{name:<28} p50 {p50:9.1f} µs   p95 {p95:9.1f} µs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    auth._jwks_client = StaticJWKSClient(jwt.PyJWK({**jwk, "alg": "RS256"}))
+    hs256, rs256 = make_token(SECRET, "HS256"), make_token(private_key, "RS256")
+
+    def verify_uncached(token):
+        auth._validated_tokens.clear()
+        return auth._verify_token(token)
+
+    asyncio.run(auth.get_current_user(hs256))
+    report("cache hit", timed(lambda: auth._cached_user(hs256), args.requests))
+    report("local HS256", timed(lambda: verify_uncached(hs256), args.requests))
+    report("local RS256 (JWKS key)", timed(lambda: verify_uncached(rs256), args.requests))
+
+    from supabase import create_client
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeAuthHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = create_client(f"http://127.0.0.1:{server.server_address[1]}", make_token(SECRET, "HS256"))
+    client.auth.get_user(hs256)
+    report("remote get_user (loopback)", timed(lambda: client.auth.get_user(hs256), args.requests // 4))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# backend/benchmarks/embedding_batcher.py
+"""Query-encode throughput and latency: one model.encode([query]) per request, as before the
+batcher, against EmbeddingBatcher coalescing concurrent queries.
+
+    python -m benchmarks.embedding_batcher [--model all-MiniLM-L6-v2] [--clients 16] [--queries 20]
+"""
+import argparse
+import threading
+import time
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from app.core.config import EMBEDDING_MODEL, EMBED_MAX_BATCH_SIZE, EMBED_MAX_WAIT_MS, EMBED_INGEST_SLICE_SIZE
+from app.services.vector_service import EmbeddingBatcher
+
+QUERIES = [
+    "What is the main idea of chapter {n}?",
+    "Explain equation {n} step by step.",
+    "Which experiments support the theory in section {n}?",
+    "Summarise the key points of lecture {n}.",
+]
+
+
+def run_clients(encode, clients: int, queries: int) -> tuple[float, list[float]]:
+    latencies, lock = [], threading.Lock()
+    start_gate = threading.Barrier(clients + 1)
+
+    def client(number):
+        start_gate.wait()
+        for i in range(queries):
+            query = QUERIES[i % len(QUERIES)].format(n=number * queries + i)
+            started = time.perf_counter()
+            encode(query)
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=client, args=(number,)) for number in range(clients)]
+    for thread in threads:
+        thread.start()
+    start_gate.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, latencies
+
+
+def report(name: str, elapsed: float, latencies: list[float]):
+    p50, p95 = np.percentile(latencies, [50, 95]) * 1000
+    print(f"{name:<10} {len(latencies) / elapsed:8.1f} QPS   p50 {p50:7.1f} ms   p95 {p95:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--queries", type=int, default=20, help="queries per client")
+    args = parser.parse_args()
+
+    model = SentenceTransformer(args.model)
+    model.encode(["warm up"])
+    batcher = EmbeddingBatcher(lambda: model, EMBED_MAX_BATCH_SIZE, EMBED_MAX_WAIT_MS, EMBED_INGEST_SLICE_SIZE)
+
+    print(f"{args.clients} concurrent clients, {args.queries} queries each")
+    report("per-call", *run_clients(lambda query: model.encode([query], convert_to_tensor=False), args.clients, args.queries))
+    report("batched", *run_clients(lambda query: batcher.submit_query(query).result(), args.clients, args.queries))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# backend/benchmarks/index_memory.py
+"""Memory per worker process with every index loaded, opened through mmap (read_index_file)
+and read into private memory as before (INDEX_MMAP_ENABLED=false).
+
+    python -m benchmarks.index_memory [--workers 4] [--documents 8] [--vectors 20000] [--kind flat|hnsw]
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+
+import faiss
+import numpy as np
+import psutil
+
+DIMENSION = 384
+
+
+def build_indexes(directory: str, documents: int, vectors: int, kind: str) -> list[str]:
+    paths = []
+    rng = np.random.default_rng(0)
+    for number in range(documents):
+        index = faiss.IndexFlatL2(DIMENSION) if kind == "flat" else faiss.IndexHNSWFlat(DIMENSION, 32)
+        index.add(rng.standard_normal((vectors, DIMENSION)).astype("float32"))
+        paths.append(os.path.join(directory, f"doc-{number}.index"))
+        faiss.write_index(index, paths[-1])
+    return paths
+
+
+def worker(mmap_enabled: bool, paths: list[str], loaded, done):
+    # The flag is read when app.core.config is imported, so set it first.
+    os.environ["INDEX_MMAP_ENABLED"] = "true" if mmap_enabled else "false"
+    from app.services.vector_service import read_index_file
+
+    query = np.zeros((1, DIMENSION), dtype="float32")
+    indexes = [read_index_file(path) for path in paths]
+    for index in indexes:
+        index.search(query, 10)  # a search touches every page of a flat index
+    # Every worker holds its indexes until all have been measured, as uvicorn workers would.
+    loaded.wait()
+    done.wait()
+
+
+def measure(mmap_enabled: bool, paths: list[str], workers: int) -> list[tuple[int, int, int]]:
+    context = multiprocessing.get_context("spawn")
+    loaded, done = context.Barrier(workers + 1), context.Barrier(workers + 1)
+    processes = [context.Process(target=worker, args=(mmap_enabled, paths, loaded, done)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    loaded.wait()
+    # Measured while every worker is alive, so PSS splits the shared pages between them.
+    samples = []
+    for process in processes:
+        memory = psutil.Process(process.pid).memory_full_info()
+        samples.append((memory.rss, memory.pss, memory.uss))
+    done.wait()
+    for process in processes:
+        process.join()
+    return samples
+
+
+def report(name: str, samples: list[tuple[int, int, int]]):
+    rss, pss, uss = (np.mean([sample[i] for sample in samples]) / 2 ** 20 for i in range(3))
+    total_pss = sum(sample[1] for sample in samples) / 2 ** 20
+    print(f"{name:<8} per worker: RSS {rss:7.1f} MiB  PSS {pss:7.1f} MiB  USS {uss:7.1f} MiB   all workers (PSS): {total_pss:7.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--documents", type=int, default=8)
+    parser.add_argument("--vectors", type=int, default=20000, help="vectors per document")
+    parser.add_argument("--kind", choices=["flat", "hnsw"], default="flat")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = build_indexes(directory, args.documents, args.vectors, args.kind)
+        size = sum(os.path.getsize(path) for path in paths) / 2 ** 20
+        print(f"{args.workers} workers, {args.documents} {args.kind} indexes of {args.vectors} vectors ({size:.1f} MiB on disk)")
+        report("memory", measure(False, paths, args.workers))
+        report("mmap", measure(True, paths, args.workers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# backend/benchmarks/lexical_search.py
+"""BM25 query time on a synthetic document: LexicalIndex (inverted index over mmap) against a
+scan that scores every chunk's term counts, the way a document without an index is searched.
+
+    python -m benchmarks.lexical_search [--chunks 5000] [--chunk-tokens 200] [--vocabulary 20000]
+"""
+import argparse
+import math
+import os
+import tempfile
+import time
+from collections import Counter
+
+import numpy as np
+
+from app.services.lexical_index import B, K1, LexicalIndex, LexicalIndexWriter, tokenize
+
+
+def synthetic_chunks(count: int, tokens: int, vocabulary: int) -> list[str]:
+    # Zipf-distributed terms, like natural text: a few very common, most rare.
+    rng = np.random.default_rng(0)
+    terms = [f"term{i}" for i in range(vocabulary)]
+    ranks = np.minimum(rng.zipf(1.3, size=(count, tokens)), vocabulary) - 1
+    return [" ".join(terms[rank] for rank in row) for row in ranks]
+
+
+def scan_search(counts: list[Counter], lengths: list[int], query: str, top_k: int) -> list[int]:
+    average_length = sum(lengths) / len(lengths)
+    terms = set(tokenize(query))
+    document_frequencies = {term: sum(1 for chunk in counts if term in chunk) for term in terms}
+    scores = []
+    for chunk_id, (chunk, length) in enumerate(zip(counts, lengths)):
+        score = 0.0
+        for term in terms:
+            tf = chunk.get(term)
+            if tf:
+                df = document_frequencies[term]
+                idf = math.log(1 + (len(counts) - df + 0.5) / (df + 0.5))
+                score += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / average_length))
+        if score:
+            scores.append((score, chunk_id))
+    return [chunk_id for _, chunk_id in sorted(scores, reverse=True)[:top_k]]
+
+
+def timed(search, queries: list[str]) -> list[float]:
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        search(query)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def report(name: str, latencies: list[float]):
+    p50, p95 = np.percentile(latencies, [50, 95]) * 1000
+    print(f"{name:<15} p50 {p50:8.3f} ms   p95 {p95:8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--chunk-tokens", type=int, default=200)
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    chunks = synthetic_chunks(args.chunks, args.chunk_tokens, args.vocabulary)
+    rng = np.random.default_rng(1)
+    queries = [" ".join(f"term{i}" for i in rng.integers(0, 2000, size=8)) for _ in range(args.queries)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "lexical.bin")
+        with LexicalIndexWriter(path) as writer:
+            for chunk in chunks:
+                writer.add(chunk)
+        started = time.perf_counter()
+        index = LexicalIndex(path)
+        opened = time.perf_counter() - started
+
+        counts = [Counter(tokenize(chunk)) for chunk in chunks]
+        lengths = [sum(chunk.values()) for chunk in counts]
+        for query in queries[:20]:
+            assert [chunk_id for chunk_id, _ in index.search(query, 10)][:1] == scan_search(counts, lengths, query, 10)[:1]
+
+        print(f"{args.chunks} chunks of {args.chunk_tokens} tokens, {args.vocabulary}-term vocabulary, "
+              f"8-term queries; lexical.bin {os.path.getsize(path) / 2 ** 20:.1f} MiB, opened in {opened * 1000:.1f} ms")
+        report("scan", timed(lambda query: scan_search(counts, lengths, query, 10), queries[:20]))
+        report("inverted index", timed(lambda query: index.search(query, 10), queries))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# backend/benchmarks/pdf_extraction.py
+"""Wall time and peak memory of turning a generated PDF into chunks: the previous whole-text
+extraction and word chunker, against iter_pdf_pages + iter_chunks, serially and on a process
+pool. Each mode runs in a fresh process so its peak RSS is its own.
+
+    python -m benchmarks.pdf_extraction [--pages 500] [--workers 2]
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz
+
+from app.services import document_service
+
+WORDS = ("photosynthesis energy equation chapter theorem proof lemma cell membrane protein "
+         "carbon stroma light reaction enzyme rate function graph derivative integral").split()
+
+
+def generate_pdf(path: str, pages: int):
+    rng = random.Random(0)
+    with fitz.open() as doc:
+        for _ in range(pages):
+            page = doc.new_page()
+            text = "\n".join(" ".join(rng.choice(WORDS) for _ in range(14)) + "." for _ in range(48))
+            page.insert_textbox(fitz.Rect(36, 36, 576, 806), text, fontsize=8)
+        doc.save(path)
+
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+def whole_text(path: str, workers: int) -> int:
+    # The extractor and chunker ingestion used before pages were streamed.
+    with open(path, "rb") as f:
+        file_stream = io.BytesIO(f.read())
+    doc = fitz.open(stream=file_stream.read(), filetype="pdf")
+    text = "".join(page.get_text() for page in doc)
+    doc.close()
+    words = text.split()
+    chunks = [" ".join(words[i:i + 500]) for i in range(0, len(words), 500 - 80)]
+    return len(chunks)
+
+
+def streamed(path: str, workers: int) -> int:
+    def chunk_count(executor):
+        pages = document_service.iter_pdf_pages(path, executor=executor, workers=workers)
+        return sum(1 for _ in document_service.iter_chunks(pages, count_words))
+
+    if workers <= 1:
+        return chunk_count(None)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return chunk_count(executor)
+
+
+def run_mode(mode, path: str, workers: int, results):
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    started = time.perf_counter()
+    chunks = mode(path, workers)
+    elapsed = time.perf_counter() - started
+    # ru_maxrss is in KiB on Linux; the pool's processes are counted separately.
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    results.put((elapsed, baseline, own, children, chunks))
+
+
+def measure(mode, path: str, workers: int):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=run_mode, args=(mode, path, workers, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=2, help="processes for the pooled run")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "generated.pdf")
+        generate_pdf(path, args.pages)
+        print(f"{args.pages}-page PDF, {os.path.getsize(path) / 2 ** 20:.1f} MiB")
+        for name, mode, workers in [("whole text", whole_text, 1), ("streamed", streamed, 1),
+                                    (f"streamed, {args.workers} processes", streamed, args.workers)]:
+            elapsed, baseline, own, children, chunks = measure(mode, path, workers)
+            pool = f"  (largest pool process {children:.1f} MiB)" if workers > 1 else ""
+            print(f"{name:<24} {elapsed:6.2f} s   peak RSS {own:6.1f} MiB, {own - baseline:5.1f} MiB over imports{pool}   {chunks} chunks")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# backend/benchmarks/startup.py
+"""Time from starting a uvicorn worker to its first `/` response: with the resource registry
+creating clients and the embedding model on first use, and with the embedding model loaded
+before the app is imported, as it was at import time before. Prewarming is off in both, as
+it runs in the background after startup.
+
+    python -m benchmarks.startup [--model all-MiniLM-L6-v2] [--runs 3]
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from app.core.config import EMBEDDING_MODEL
+
+SERVER = """
+import sys
+import uvicorn
+from app.core import resources
+if sys.argv[2] == "eager":
+    resources.EMBEDDING_MODEL = sys.argv[3]
+    resources.get_embedding_model()
+uvicorn.run("main:app", host="127.0.0.1", port=int(sys.argv[1]), log_level="warning")
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def time_to_first_response(mode: str, model: str, work_dir: str) -> float:
+    port = free_port()
+    env = {**os.environ, "INGEST_WORK_DIR": work_dir, "RESOURCE_PREWARM": ""}
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-c", SERVER, str(port), mode, model], env=env)
+    try:
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError(f"The {mode} server exited with {server.returncode}")
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/", timeout=1).status_code == 200:
+                    return time.perf_counter() - started
+            except httpx.TransportError:
+                time.sleep(0.01)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for mode in ("lazy", "eager"):
+            times = [time_to_first_response(mode, args.model, work_dir) for _ in range(args.runs)]
+            print(f"{mode:<6} median {statistics.median(times):6.2f} s   runs: {', '.join(f'{t:.2f}' for t in times)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,37 @@
 # backend/main.py
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.v1 import endpoints
+from app.core.config import SUMMARY_RETRIEVAL_QUERY, RESOURCE_PREWARM
+from app.core.executors import run_io, run_cpu
+from app.core.resources import registry
+from app.services import ingestion_service, vector_service
+
+
+async def prewarm_resources(names):
+    # Runs after startup has completed, so requests are served while the models load.
+    await run_io(registry.prewarm(names).join)
+    if registry.is_loaded("embedding_model"):
+        # /summarize in retrieval mode always retrieves with the same query text, so embed it once up front.
+        await run_cpu(vector_service.precompute_query_embeddings, [SUMMARY_RETRIEVAL_QUERY])
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Ingestion jobs run on worker threads and submit their LLM work (precomputed study
+    # artifacts) to this loop.
+    ingestion_service.attach_event_loop(asyncio.get_running_loop())
+    # Picks up the ingestion jobs of workers that stopped while the jobs were still running.
+    await run_io(ingestion_service.recover_jobs)
+    prewarm = asyncio.create_task(prewarm_resources(RESOURCE_PREWARM)) if RESOURCE_PREWARM else None
+    yield
+    if prewarm is not None:
+        prewarm.cancel()
+    await registry.close()
 
-app = FastAPI(title="AI Study Buddy")
+app = FastAPI(title="AI Study Buddy", lifespan=lifespan)
 
 # IMPORTANT: Configure CORS for security
 origins = [
@@ -0,0 +1,22 @@
+# backend/tests/conftest.py
+import os
+import tempfile
+
+# The app reads its settings at import time, so point every on-disk cache at a scratch
+# directory and use the offline LLM before any app module is imported.
+_data_dir = tempfile.mkdtemp(prefix="studhelp-tests-")
+os.environ.setdefault("VECTOR_CACHE_DIR", os.path.join(_data_dir, "vector_cache"))
+os.environ.setdefault("INGEST_WORK_DIR", os.path.join(_data_dir, "ingest"))
+os.environ.setdefault("EMBEDDING_CACHE_PATH", os.path.join(_data_dir, "embedding_cache.sqlite3"))
+os.environ.setdefault("SUMMARY_CACHE_DIR", os.path.join(_data_dir, "summary_cache"))
+os.environ.setdefault("LLM_BACKEND", "fake")
+
+import pytest
+
+from app.core import metrics
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.reset()
+    yield
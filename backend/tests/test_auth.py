@@ -0,0 +1,108 @@
+# backend/tests/test_auth.py
+import asyncio
+import json
+import time
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException
+
+from app.core import auth, metrics
+
+SECRET = "test-secret-with-at-least-32-bytes!"
+
+
+def make_token(expires_in=3600, audience=auth.AUDIENCE, secret=SECRET, subject="8c1f5a52-0000-4000-8000-000000000001", algorithm="HS256"):
+    now = int(time.time())
+    claims = {"sub": subject, "aud": audience, "iat": now, "exp": now + expires_in, "email": "student@example.com"}
+    return jwt.encode(claims, secret, algorithm=algorithm)
+
+
+@pytest.fixture(autouse=True)
+def local_secret(monkeypatch):
+    monkeypatch.setattr(auth, "SUPABASE_JWT_SECRET", SECRET)
+    auth._validated_tokens.clear()
+
+
+def current_user(token):
+    return asyncio.run(auth.get_current_user(token))
+
+
+def test_valid_token_is_verified_locally_once_then_cached():
+    token = make_token()
+
+    first, second = current_user(token), current_user(token)
+
+    assert first.id == second.id == "8c1f5a52-0000-4000-8000-000000000001"
+    assert first.email == "student@example.com"
+    assert metrics.get("auth.local_verifications") == 1
+    assert metrics.get("auth_cache.hits") == 1
+    assert metrics.get("auth_cache.misses") == 1
+
+
+def test_cached_token_stops_being_served_once_it_expires(monkeypatch):
+    token = make_token(expires_in=60)
+    current_user(token)
+
+    later = time.time() + 61
+    monkeypatch.setattr(auth.time, "time", lambda: later)
+    assert auth._cached_user(token) is None
+    assert metrics.get("auth_cache.misses") == 2
+
+
+@pytest.mark.parametrize("token", [
+    make_token(expires_in=-10),
+    make_token(audience="anon"),
+    make_token(secret="another-secret-with-at-least-32-bytes"),
+    "not-a-jwt",
+])
+def test_invalid_tokens_are_rejected_and_not_cached(token):
+    with pytest.raises(HTTPException) as error:
+        current_user(token)
+    assert error.value.status_code == 401
+    assert len(auth._validated_tokens) == 0
+
+
+def test_without_a_secret_tokens_are_checked_by_supabase(monkeypatch):
+    monkeypatch.setattr(auth, "SUPABASE_JWT_SECRET", "")
+    remote_user = object()
+    calls = []
+    monkeypatch.setattr(auth, "_verify_token_remotely", lambda token: calls.append(token) or remote_user)
+    token = make_token()
+
+    assert current_user(token) is remote_user
+    assert current_user(token) is remote_user
+    assert calls == [token]
+    assert metrics.get("auth.remote_verifications") == 1
+
+
+class FakeJWKSClient:
+    def __init__(self, signing_key):
+        self.signing_key = signing_key
+
+    def get_signing_key_from_jwt(self, token):
+        return self.signing_key
+
+
+@pytest.fixture
+def rsa_key(monkeypatch):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    monkeypatch.setattr(auth, "_jwks_client", FakeJWKSClient(jwt.PyJWK({**jwk, "alg": "RS256"})))
+    return private_key
+
+
+def test_asymmetric_tokens_are_verified_with_the_published_key(rsa_key):
+    token = make_token(secret=rsa_key, algorithm="RS256")
+
+    assert current_user(token).id == "8c1f5a52-0000-4000-8000-000000000001"
+
+
+def test_the_token_header_cannot_choose_another_algorithm_for_the_key(rsa_key):
+    # Signed by the right key, but with an algorithm the published key is not meant for.
+    token = make_token(secret=rsa_key, algorithm="PS256")
+
+    with pytest.raises(HTTPException) as error:
+        current_user(token)
+    assert error.value.status_code == 401
@@ -0,0 +1,92 @@
+# backend/tests/test_context_service.py
+import numpy as np
+import pytest
+
+from app.core import metrics
+from app.services import context_service, vector_service
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    # One token per word stands in for the embedding model's tokenizer.
+    monkeypatch.setattr(vector_service, "count_tokens", lambda text: len(text.split()))
+
+
+def record(position, text, **metadata):
+    return {"position": position, "text": text, **metadata}
+
+
+def test_chunks_touching_at_a_word_boundary_are_joined_with_a_space():
+    first = record(0, "The bird on the left is the", char_start=0, char_end=27)
+    second = record(1, "eagle that nests on the cliff.", char_start=28, char_end=58)
+    passages = context_service._merge_neighbours([first, second])
+    assert [p["text"] for p in passages] == ["The bird on the left is the eagle that nests on the cliff."]
+
+
+def test_chunks_without_offsets_are_not_joined_on_a_partial_word():
+    first = record(0, "The bird on the left is the")
+    second = record(1, "eagle that nests on the cliff.")
+    passages = context_service._merge_neighbours([first, second])
+    assert [p["text"] for p in passages] == [first["text"], second["text"]]
+
+
+def test_overlapping_chunks_share_their_overlap_once():
+    first = record(0, "Alpha beta gamma. Delta epsilon zeta.", char_start=0, char_end=37)
+    second = record(1, "Delta epsilon zeta. Eta theta iota.", char_start=18, char_end=53)
+    passages = context_service._merge_neighbours([first, second])
+    assert [p["text"] for p in passages] == ["Alpha beta gamma. Delta epsilon zeta. Eta theta iota."]
+
+
+def test_short_text_overlap_without_offsets_is_not_trusted():
+    first = record(0, "It ends with the same word")
+    second = record(1, "word starts this one")
+    assert context_service._word_overlap(first["text"], second["text"], context_service.MIN_TEXT_OVERLAP) == 0
+    assert len(context_service._merge_neighbours([first, second])) == 2
+
+
+def test_long_text_overlap_without_offsets_is_merged():
+    shared = "the shared sentence carried over."
+    first = record(0, f"Opening words. {shared}")
+    second = record(1, f"{shared} Closing words.")
+    passages = context_service._merge_neighbours([first, second])
+    assert [p["text"] for p in passages] == [f"Opening words. {shared} Closing words."]
+
+
+def test_assemble_packs_by_relevance_and_writes_in_document_order(monkeypatch):
+    monkeypatch.setattr(context_service, "_drop_near_duplicates", lambda records: records)
+    records = [
+        record(7, "best chunk here", token_count=3),
+        record(2, "second best chunk", token_count=3),
+        record(4, "a much longer third chunk that does not fit", token_count=9),
+    ]
+    context = context_service.assemble(records, budget_tokens=7)
+    assert context["text"] == "second best chunk\n\nbest chunk here"
+    assert context["tokens"] == 6
+    assert context["tokens_saved"] == 9
+    assert metrics.get("context.tokens_saved") == 9
+
+
+def test_near_duplicates_are_dropped_using_the_document_vectors(monkeypatch):
+    vectors = {0: [1.0, 0.0], 1: [0.99, 0.01], 2: [0.0, 1.0]}
+    monkeypatch.setattr(vector_service, "chunk_vectors", lambda doc_id, positions, hashes: np.array([vectors[p] for p in positions]))
+    records = [record(p, f"chunk {p}", doc_id="doc") for p in (0, 1, 2)]
+    kept = context_service._drop_near_duplicates(records)
+    assert [r["position"] for r in kept] == [0, 2]
+    assert metrics.get("context.duplicates_dropped") == 1
+
+
+def test_dedup_is_skipped_when_vectors_are_unavailable(monkeypatch):
+    def unavailable(doc_id, positions, hashes):
+        raise RuntimeError("storage is down")
+    monkeypatch.setattr(vector_service, "chunk_vectors", unavailable)
+    records = [record(p, "same text", doc_id="doc") for p in (0, 5)]
+    assert context_service._drop_near_duplicates(records) == records
+    assert metrics.get("context.dedup_skipped") == 1
+
+
+def test_assemble_records_a_per_request_histogram(monkeypatch):
+    monkeypatch.setattr(context_service, "_drop_near_duplicates", lambda records: records)
+    context_service.assemble([record(0, "one two three", token_count=3)], budget_tokens=None)
+    assert metrics.get("context.prompt_tokens_per_request.count") == 1
+    assert metrics.get("context.prompt_tokens_per_request.sum") == 3
+    assert metrics.get("context.tokens_saved_per_request.le_0") == 1
@@ -0,0 +1,33 @@
+# backend/tests/test_disk_cache.py
+import os
+
+from app.core import metrics
+from app.core.disk_cache import DiskBudget
+
+
+def write(path, size, mtime):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x" * size)
+    os.utime(path, (mtime, mtime))
+
+
+def test_evicts_least_recently_used_files_down_to_low_water(tmp_path):
+    budget = DiskBudget("test", str(tmp_path), max_bytes=1000, low_water=0.7)
+    for i in range(4):
+        write(tmp_path / "a" / f"{i}.bin", 300, mtime=1000 + i)
+    budget.touch(str(tmp_path / "a" / "0.bin"))
+
+    budget.added(300)
+
+    assert sorted(os.listdir(tmp_path / "a")) == ["0.bin", "3.bin"]
+    assert metrics.get("test.disk_evictions") == 2
+
+
+def test_stays_within_budget_as_files_are_added(tmp_path):
+    budget = DiskBudget("test", str(tmp_path), max_bytes=1000)
+    for i in range(10):
+        write(tmp_path / f"{i}.bin", 200, mtime=1000 + i)
+        budget.added(200)
+
+    assert sum(os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path)) <= 1000
+    assert (tmp_path / "9.bin").exists()
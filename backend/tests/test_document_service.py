@@ -0,0 +1,74 @@
+# backend/tests/test_document_service.py
+from concurrent.futures import ThreadPoolExecutor
+
+import fitz
+
+from app.services import document_service
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def chunk(pages, **kwargs):
+    return list(document_service.iter_chunks(iter(pages), count_words, **kwargs))
+
+
+def source_text(pages, chunk_record):
+    text = "".join(page for _, page in pages)
+    return " ".join(text[chunk_record["char_start"]:chunk_record["char_end"]].split())
+
+
+def test_chunk_offsets_span_their_text_across_pages():
+    pages = [
+        (1, "  First sentence here. Second one follows.\n\nA new paragraph starts. "),
+        (2, "\nPage two opens. It ends here."),
+    ]
+    chunks = chunk(pages, max_tokens=6, overlap_tokens=3)
+
+    assert len(chunks) > 2
+    for record in chunks:
+        assert source_text(pages, record) == record["text"]
+    assert chunks[0]["char_start"] == 2
+    assert chunks[-1]["page_end"] == 2
+
+
+def test_long_sentence_pieces_have_their_own_spans_and_overlap():
+    sentence = " ".join(f"w{i}" for i in range(100)) + "."
+    pages = [(1, f"Intro sentence. {sentence}")]
+    chunks = chunk(pages, max_tokens=30, overlap_tokens=5, min_tokens=8)
+
+    for record in chunks:
+        assert source_text(pages, record) == record["text"]
+        assert record["token_count"] == count_words(record["text"]) <= 30
+    for previous, following in zip(chunks, chunks[1:]):
+        # Every chunk starts inside the previous one: the overlap carries across pieces.
+        assert previous["char_start"] < following["char_start"] < previous["char_end"]
+        previous_words, following_words = previous["text"].split(), following["text"].split()
+        assert any(following_words[:k] == previous_words[-k:] for k in range(1, 6))
+
+
+def test_short_trailing_piece_is_merged_back():
+    sentence = " ".join(f"w{i}" for i in range(52))
+    pieces = list(document_service._split_long_sentence(sentence, 0, count_words, 25, 5, 10))
+
+    assert [piece[3] for piece in pieces] == [25, 25, 25]
+    assert pieces[-1][0].split()[-1] == "w51"
+    assert pieces[-1][2] == len(sentence)
+    for text, start, end, _ in pieces:
+        assert sentence[start:end] == text
+
+
+def test_pdf_pages_come_back_in_order_from_an_executor(tmp_path):
+    path = str(tmp_path / "doc.pdf")
+    with fitz.open() as doc:
+        for number in range(1, 8):
+            doc.new_page().insert_text((72, 72), f"Page {number} text.")
+        doc.save(path)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        pages = list(document_service.iter_pdf_pages(path, executor=executor, workers=2, pages_per_task=2))
+
+    assert [number for number, _ in pages] == list(range(1, 8))
+    assert [text.strip() for _, text in pages] == [f"Page {number} text." for number in range(1, 8)]
+    assert pages == list(document_service.iter_pdf_pages(path))
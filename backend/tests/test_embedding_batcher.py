@@ -0,0 +1,103 @@
+# backend/tests/test_embedding_batcher.py
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from app.services.vector_service import EmbeddingBatcher
+
+
+class FakeModel:
+    """Encodes "name:n" as a vector holding n, and records every encode call. With a gate set,
+    the first call blocks until the gate is opened."""
+
+    def __init__(self, gate=None):
+        self.calls = []
+        self.gate = gate
+        self.started = threading.Event()
+
+    def encode(self, texts, convert_to_tensor=False):
+        self.calls.append(list(texts))
+        self.started.set()
+        if self.gate is not None and len(self.calls) == 1:
+            self.gate.wait(5)
+        return np.array([[float(text.split(":")[1]), 1.0] for text in texts], dtype="float32")
+
+    def get_sentence_embedding_dimension(self):
+        return 2
+
+
+def make_batcher(model, **kwargs):
+    options = {"max_batch_size": 8, "max_wait_ms": 20, "ingest_slice_size": 3, **kwargs}
+    return EmbeddingBatcher(lambda: model, **options)
+
+
+def test_ingest_results_keep_input_order_across_slices():
+    model = FakeModel()
+    texts = [f"doc:{i}" for i in range(10)]
+
+    vectors = make_batcher(model).submit_documents(texts).result(5)
+
+    assert vectors[:, 0].tolist() == list(range(10))
+    assert [len(call) for call in model.calls] == [3, 3, 3, 1]
+
+
+def test_queries_jump_ahead_of_remaining_ingest_slices():
+    gate = threading.Event()
+    model = FakeModel(gate)
+    batcher = make_batcher(model)
+    ingest = batcher.submit_documents([f"doc:{i}" for i in range(9)])
+    assert model.started.wait(5)
+
+    # The first slice is being encoded; both queries arrive before it finishes.
+    queries = [batcher.submit_query("query:100"), batcher.submit_query("query:101")]
+    gate.set()
+
+    assert [future.result(5)[0, 0] for future in queries] == [100.0, 101.0]
+    assert ingest.result(5)[:, 0].tolist() == list(range(9))
+    assert model.calls[1] == ["query:100", "query:101"]
+
+
+def test_concurrent_queries_are_coalesced_and_matched_to_their_callers():
+    model = FakeModel()
+    batcher = make_batcher(model, max_wait_ms=200)
+
+    futures = [batcher.submit_query(f"query:{i}") for i in range(8)]
+
+    assert [future.result(5)[0, 0] for future in futures] == list(range(8))
+    assert len(model.calls) == 1
+
+
+def test_encode_errors_reach_every_waiting_caller():
+    class BrokenModel(FakeModel):
+        def encode(self, texts, convert_to_tensor=False):
+            raise RuntimeError("model failed")
+
+    batcher = make_batcher(BrokenModel())
+    future = batcher.submit_query("query:1")
+
+    with pytest.raises(RuntimeError, match="model failed"):
+        future.result(5)
+
+
+def test_a_cancelled_caller_does_not_stop_the_batcher():
+    gate = threading.Event()
+    model = FakeModel(gate)
+    batcher = make_batcher(model)
+    batcher.submit_documents(["doc:0"])
+    assert model.started.wait(5)
+
+    async def cancel_a_waiting_query():
+        waiting = asyncio.ensure_future(asyncio.wrap_future(batcher.submit_query("query:1")))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+
+    asyncio.run(cancel_a_waiting_query())
+    gate.set()
+
+    assert batcher.submit_query("query:2").result(5)[0, 0] == 2.0
+    assert ["query:1"] not in model.calls
+    assert batcher._thread.is_alive()
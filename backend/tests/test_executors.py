@@ -0,0 +1,123 @@
+# backend/tests/test_executors.py
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import numpy as np
+import pytest
+
+from app.core.executors import run_cpu, run_io
+from app.services.llm_service import FakeLLM
+
+
+def blocking_call(seconds, label=None):
+    time.sleep(seconds)
+    return threading.current_thread().name, label
+
+
+def test_calls_run_on_their_pool_with_their_arguments():
+    async def run():
+        return await run_io(blocking_call, 0, label="io"), await run_cpu(blocking_call, 0, label="cpu")
+
+    (io_thread, io_label), (cpu_thread, cpu_label) = asyncio.run(run())
+
+    assert io_thread.startswith("io") and io_label == "io"
+    assert cpu_thread.startswith("cpu") and cpu_label == "cpu"
+
+
+def test_event_loop_keeps_running_during_a_blocking_call():
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        await run_io(blocking_call, 0.2)
+        task.cancel()
+        return ticks
+
+    assert asyncio.run(run()) >= 5
+
+
+class FakeQuery:
+    """Chainable stand-in for a supabase-py query builder. execute() blocks like the sync
+    client does, so a call made on the event loop would stall every other request."""
+
+    http_method = "GET"
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def single(self):
+        return FakeQuery(self.rows[0])
+
+    def execute(self):
+        time.sleep(0.01)
+        return SimpleNamespace(data=self.rows)
+
+
+class FakeSupabase:
+    def table(self, name):
+        return FakeQuery([{"id": 1, "content_hash": None, "file_name": "notes.pdf", "storage_path": "doc-0"}])
+
+
+class SlowLLM(FakeLLM):
+    async def complete_async(self, prompt):
+        await asyncio.sleep(1.0)
+        return self.complete(prompt)
+
+
+async def slow_summary_prompt(doc_id, mode="retrieval"):
+    # Stands in for the CPU-bound encode, search and context assembly.
+    await run_cpu(time.sleep, 0.5)
+    return f"Summarise {doc_id}."
+
+
+@pytest.fixture
+def app(monkeypatch):
+    import main
+    from app.core.auth import get_current_user
+    from app.core.resources import get_supabase
+    from app.services import cache_service, llm_service, study_service
+
+    monkeypatch.setattr(study_service, "summary_prompt", slow_summary_prompt)
+    monkeypatch.setattr(llm_service, "_llm", SlowLLM())
+    cache_service._response_cache.clear()
+    main.app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id="user-1")
+    main.app.dependency_overrides[get_supabase] = FakeSupabase
+    yield main.app
+    main.app.dependency_overrides.clear()
+
+
+def test_documents_latency_stays_flat_while_summaries_are_in_flight(app):
+    async def document_latency(client):
+        started = time.perf_counter()
+        response = await client.get("/api/v1/documents")
+        assert response.status_code == 200
+        return time.perf_counter() - started
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            idle = [await document_latency(client) for _ in range(30)]
+            summaries = [asyncio.create_task(client.post("/api/v1/summarize", json={"doc_id": f"doc-{i}"})) for i in range(4)]
+            busy = []
+            while not all(summary.done() for summary in summaries):
+                busy.append(await document_latency(client))
+            return idle, busy, [summary.result() for summary in summaries]
+
+    idle, busy, responses = asyncio.run(run())
+
+    assert all(response.status_code == 200 for response in responses)
+    # The summaries take over two seconds in all; /documents is served throughout.
+    assert len(busy) > 50
+    assert np.percentile(busy, 99) < np.percentile(idle, 99) + 0.1
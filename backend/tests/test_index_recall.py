@@ -0,0 +1,63 @@
+# backend/tests/test_index_recall.py
+import time
+
+import faiss
+import numpy as np
+import pytest
+
+from app.services import vector_service
+
+# Recall and latency of each index type build_index picks, against exact search, on
+# clustered unit vectors (like sentence embeddings) with queries close to stored chunks.
+# The indexes go through serialize/read_index_file, as they are served. Run with -s to see
+# the per-query latencies.
+DIMENSION = 64
+K = 10
+QUERIES = 100
+
+
+def clustered_vectors(rng, count, clusters=50):
+    centers = rng.standard_normal((clusters, DIMENSION))
+    vectors = centers[rng.integers(0, clusters, count)] + 0.6 * rng.standard_normal((count, DIMENSION))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype("float32")
+
+
+@pytest.fixture(autouse=True)
+def small_index_thresholds(monkeypatch):
+    monkeypatch.setattr(vector_service, "INDEX_FLAT_MAX_VECTORS", 1000)
+    monkeypatch.setattr(vector_service, "INDEX_HNSW_MAX_VECTORS", 4000)
+    monkeypatch.setattr(vector_service, "INDEX_PQ_M", 16)
+
+
+@pytest.mark.parametrize("count, index_type, min_recall", [
+    (1000, faiss.IndexFlatL2, 1.0),
+    (3000, faiss.IndexHNSWFlat, 0.95),
+    # PQ codes are lossy; this is the floor below which IVF-PQ would hurt answers noticeably.
+    (6000, faiss.IndexIVFPQ, 0.6),
+])
+def test_recall_at_k(tmp_path, count, index_type, min_recall):
+    rng = np.random.default_rng(0)
+    vectors = clustered_vectors(rng, count)
+    queries = vectors[rng.choice(count, QUERIES, replace=False)]
+    queries = (queries + 0.05 * rng.standard_normal(queries.shape)).astype("float32")
+    exact = faiss.IndexFlatL2(DIMENSION)
+    exact.add(vectors)
+    _, truth = exact.search(queries, K)
+
+    path = tmp_path / "doc.index"
+    path.write_bytes(vector_service.serialize_index(vector_service.build_index(vectors)))
+    index = vector_service.read_index_file(str(path))
+    vector_service.configure_search(index)
+    assert isinstance(faiss.downcast_index(index), index_type)
+
+    # One query per search call, as requests arrive.
+    found = []
+    started = time.perf_counter()
+    for query in queries:
+        _, ids = index.search(query.reshape(1, -1), K)
+        found.append(ids[0])
+    latency_ms = (time.perf_counter() - started) * 1000 / QUERIES
+
+    recall = np.mean([len(set(row) & set(expected)) / K for row, expected in zip(found, truth)])
+    print(f"\n{index_type.__name__}: {count} vectors, recall@{K} {recall:.3f}, {latency_ms:.3f} ms/query")
+    assert recall >= min_recall
@@ -0,0 +1,93 @@
+# backend/tests/test_ingestion_service.py
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import ingestion_service, session_index_service, vector_service
+
+
+class FakeQuery:
+    """Chainable stand-in for a supabase-py query builder over a list of row dicts."""
+
+    http_method = "GET"
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.values = None
+        self.one = False
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def update(self, values):
+        self.values = values
+        self.http_method = "PATCH"
+        return self
+
+    def single(self):
+        self.one = True
+        return self
+
+    def execute(self):
+        if self.values is not None:
+            for row in self.rows:
+                row.update(self.values)
+        data = [dict(row) for row in self.rows]
+        return SimpleNamespace(data=data[0] if self.one else data)
+
+
+class FakeSupabase:
+    def __init__(self):
+        self.documents = [{"storage_path": "doc-1", "file_name": "old.pdf", "content_hash": "old"}]
+
+    def table(self, name):
+        return FakeQuery(self.documents if name == "documents" else [])
+
+
+@pytest.fixture
+def supabase(monkeypatch):
+    fake = FakeSupabase()
+    monkeypatch.setattr(ingestion_service, "get_supabase", lambda: fake)
+    monkeypatch.setattr(ingestion_service.time, "sleep", lambda seconds: None)
+    return fake
+
+
+def replace_job():
+    return {"id": "job-1", "kind": "replace", "document_id": "doc-1", "file_name": "new.pdf", "content_hash": "new"}
+
+
+def test_a_retried_switch_releases_the_previous_blob(supabase, monkeypatch):
+    failures = [RuntimeError("storage unavailable")]
+
+    def remove_document(doc_id, session_ids):
+        if failures:
+            raise failures.pop()
+
+    released = []
+    monkeypatch.setattr(session_index_service, "remove_document", remove_document)
+    monkeypatch.setattr(vector_service, "release_artifacts", released.append)
+    job = replace_job()
+
+    # The first attempt fails after the record already points at the new blob.
+    ingestion_service._run_stage(job, {}, "switch", ingestion_service._stage_switch)
+
+    assert supabase.documents[0]["content_hash"] == "new"
+    assert job["previous_content_hash"] == "old"
+    assert released == ["old"]
+
+
+def test_a_failed_switch_releases_the_previous_blob_once_the_record_moved(supabase, monkeypatch):
+    def remove_document(doc_id, session_ids):
+        raise RuntimeError("storage unavailable")
+
+    released = []
+    monkeypatch.setattr(session_index_service, "remove_document", remove_document)
+    monkeypatch.setattr(vector_service, "release_artifacts", released.append)
+    job = replace_job()
+
+    with pytest.raises(RuntimeError):
+        ingestion_service._run_stage(job, {}, "switch", ingestion_service._stage_switch)
+    ingestion_service._cleanup_failed_job(job)
+
+    assert supabase.documents[0]["content_hash"] == "new"
+    assert released == ["old"]
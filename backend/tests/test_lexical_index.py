@@ -0,0 +1,77 @@
+# backend/tests/test_lexical_index.py
+import pytest
+
+from app.services import lexical_index
+from app.services.lexical_index import LexicalIndex, LexicalIndexWriter, reciprocal_rank_fusion
+
+CHUNKS = [
+    "Photosynthesis converts light energy into chemical energy.",
+    "Equation 3.2 gives the rate of photosynthesis as a function of light.",
+    "The Calvin cycle fixes carbon dioxide in the stroma.",
+    "Course CS-101 covers sorting algorithms and their complexity.",
+    "Light light light light: a chunk that repeats one word many times.",
+]
+
+
+@pytest.fixture
+def index(tmp_path):
+    path = str(tmp_path / "lexical.bin")
+    with LexicalIndexWriter(path) as writer:
+        for chunk in CHUNKS:
+            writer.add(chunk)
+    return LexicalIndex(path)
+
+
+def test_tokenize_indexes_compound_tokens_whole_and_by_part():
+    assert lexical_index.tokenize("See Eq. 3.2 and CS-101") == ["see", "eq", "3.2", "3", "2", "and", "cs-101", "cs", "101"]
+
+
+def test_round_trip_keeps_every_chunk(index):
+    assert index.chunk_count == len(CHUNKS)
+    assert [chunk_id for chunk_id, _ in index.search("calvin stroma", top_k=5)] == [2]
+
+
+@pytest.mark.parametrize("query, best", [
+    ("3.2", 1),
+    ("cs-101", 3),
+    ("CS 101 sorting", 3),
+    ("carbon dioxide", 2),
+])
+def test_exact_terms_rank_their_chunk_first(index, query, best):
+    assert index.search(query, top_k=3)[0][0] == best
+
+
+def test_scores_are_sorted_and_limited_to_top_k(index):
+    results = index.search("light energy photosynthesis", top_k=2)
+
+    assert len(results) == 2
+    assert results[0][1] >= results[1][1] > 0
+
+
+def test_term_frequency_saturates(index):
+    # BM25 dampens repetition: the chunk repeating "light" does not outscore one that
+    # matches both query terms.
+    assert index.search("light photosynthesis", top_k=1)[0][0] != 4
+
+
+def test_unknown_terms_and_empty_index(index, tmp_path):
+    assert index.search("mitochondria", top_k=3) == []
+    path = str(tmp_path / "empty.bin")
+    with LexicalIndexWriter(path):
+        pass
+    assert LexicalIndex(path).search("anything", top_k=3) == []
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "doc.index"
+    path.write_bytes(b"IxF2" + bytes(64))
+    with pytest.raises(ValueError):
+        LexicalIndex(str(path))
+
+
+def test_reciprocal_rank_fusion():
+    vector_ranking = [7, 3, 9]
+    lexical_ranking = [3, 5]
+
+    # 3 is near the top of both lists; ids in only one list follow by their rank there.
+    assert reciprocal_rank_fusion([vector_ranking, lexical_ranking], k=60) == [3, 7, 5, 9]
@@ -0,0 +1,61 @@
+# backend/tests/test_llm_service.py
+import asyncio
+
+import pytest
+
+from app.services import cache_service, llm_service
+from app.services.llm_service import FakeLLM
+
+
+@pytest.fixture
+def llm():
+    fake = FakeLLM(["First answer.", "Second answer."])
+    llm_service.set_llm(fake)
+    cache_service._response_cache.clear()
+    yield fake
+    llm_service.set_llm(FakeLLM())
+
+
+def complete(prompt):
+    return asyncio.run(llm_service.generate_chat_completion_async(prompt))
+
+
+def collect(stream):
+    async def run():
+        return [token async for token in stream]
+    return asyncio.run(run())
+
+
+def test_fake_llm_replays_its_responses_in_order(llm):
+    assert complete("prompt one") == "First answer."
+    assert complete("prompt two") == "Second answer."
+    assert complete("prompt three") == "First answer."
+    assert llm.prompts == ["prompt one", "prompt two", "prompt three"]
+
+
+def test_repeated_prompts_are_answered_from_the_cache(llm):
+    first = complete("same prompt")
+    second = complete("same prompt")
+
+    assert first == second == "First answer."
+    assert llm.prompts == ["same prompt"]
+
+
+def test_streamed_answers_arrive_word_by_word_and_are_cached(llm):
+    tokens = collect(llm_service.stream_chat_completion("stream this"))
+
+    assert tokens == ["First ", "answer."]
+    assert collect(llm_service.stream_chat_completion("stream this")) == ["First answer."]
+    assert llm.prompts == ["stream this"]
+
+
+def test_errors_reach_the_caller_and_are_not_cached(llm):
+    class BrokenLLM(FakeLLM):
+        def complete(self, prompt):
+            raise RuntimeError("backend down")
+
+    llm_service.set_llm(BrokenLLM())
+    with pytest.raises(RuntimeError):
+        complete("prompt")
+    llm_service.set_llm(llm)
+    assert complete("prompt") == "First answer."
@@ -0,0 +1,234 @@
+# backend/tests/test_resilience.py
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from app.core import metrics, resilience, resources, storage
+from app.core.resilience import CircuitBreaker, CircuitOpenError
+from app.services import llm_service
+from app.services.llm_service import GroqLLM
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class Flaky:
+    """Raises the given errors in turn, then returns "ok"."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(resilience, "backoff_delay", lambda attempt: 0)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.mark.parametrize("error, transient", [
+    (httpx.ConnectError("refused"), True),
+    (httpx.ReadTimeout("slow"), True),
+    (StatusError(503), True),
+    (StatusError(429), True),
+    (StatusError(404), False),
+    (ValueError("bad input"), False),
+])
+def test_is_transient(error, transient):
+    assert resilience.is_transient(error) is transient
+
+
+def test_transient_failures_are_retried():
+    breaker = CircuitBreaker("test", failure_threshold=5)
+    func = Flaky(StatusError(503), httpx.ConnectError("refused"))
+
+    assert breaker.call(func, attempts=3) == "ok"
+    assert func.calls == 3
+    assert metrics.get("test.retries") == 2
+    assert breaker.state == "closed"
+
+
+def test_other_errors_are_raised_at_once_and_do_not_count():
+    breaker = CircuitBreaker("test", failure_threshold=1)
+    func = Flaky(StatusError(404))
+
+    with pytest.raises(StatusError):
+        breaker.call(func, attempts=3)
+    assert func.calls == 1
+    assert breaker.state == "closed"
+
+
+def test_retry_if_limits_what_is_retried():
+    breaker = CircuitBreaker("test", failure_threshold=5)
+    func = Flaky(httpx.ReadTimeout("slow"))
+
+    with pytest.raises(httpx.ReadTimeout):
+        breaker.call(func, retry_if=resilience.is_connect_error, attempts=3)
+    assert func.calls == 1
+
+
+def test_breaker_opens_fails_fast_and_closes_after_a_successful_trial(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_seconds=30)
+    with pytest.raises(StatusError):
+        breaker.call(Flaky(StatusError(503), StatusError(503)), attempts=2)
+    assert breaker.state == "open"
+
+    func = Flaky()
+    with pytest.raises(CircuitOpenError):
+        breaker.call(func)
+    assert func.calls == 0
+    assert metrics.get("test.circuit_opened") == 1
+    assert metrics.get("test.circuit_rejections") == 1
+
+    clock[0] += 30
+    assert breaker.state == "half_open"
+    assert breaker.call(func) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_failed_trial_reopens_the_breaker(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_seconds=30)
+    with pytest.raises(StatusError):
+        breaker.call(Flaky(StatusError(503)), attempts=1)
+
+    clock[0] += 30
+    with pytest.raises(StatusError):
+        breaker.call(Flaky(StatusError(502)), attempts=1)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.call(Flaky())
+
+
+def test_only_one_trial_call_while_half_open(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_seconds=30)
+    with pytest.raises(StatusError):
+        breaker.call(Flaky(StatusError(503)), attempts=1)
+    clock[0] += 30
+
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_call_async_retries():
+    breaker = CircuitBreaker("test", failure_threshold=5)
+    func = Flaky(StatusError(500))
+
+    async def call():
+        return func()
+
+    assert asyncio.run(breaker.call_async(call, attempts=2)) == "ok"
+    assert func.calls == 2
+
+
+class FakeServer:
+    """A local HTTP/1.1 keep-alive server. Each path answers with the status codes queued for
+    it (e.g. 503s), then 200 with its body; it counts the connections and requests it gets."""
+
+    def __init__(self):
+        self.connections = 0
+        self.requests = []
+        self.failures = {}
+        self.bodies = {}
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                server.connections += 1
+
+            def respond(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                self.rfile.read(length)
+                server.requests.append(self.path)
+                queued = server.failures.get(self.path)
+                status = queued.pop(0) if queued else 200
+                body = server.bodies.get(self.path, b"") if status == 200 else b"unavailable"
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json" if body.startswith(b"{") else "application/octet-stream")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST = respond
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def server():
+    fake = FakeServer()
+    yield fake
+    fake.close()
+
+
+def test_storage_downloads_share_one_pooled_connection_and_retry_503s(server, monkeypatch):
+    http = resources._create_http_client()
+    monkeypatch.setattr(storage, "get_http_client", lambda: http)
+    monkeypatch.setattr(storage, "SUPABASE_URL", server.url)
+    monkeypatch.setattr(storage, "SUPABASE_SERVICE_KEY", "service-key")
+    path = "/storage/v1/object/files/blobs/abc/doc.index"
+    server.bodies[path] = b"index bytes"
+    server.failures[path] = [503, 503]
+
+    downloads = [storage.download("blobs/abc/doc.index", deadline=time.monotonic() + 5) for _ in range(3)]
+
+    assert downloads == [b"index bytes"] * 3
+    assert len(server.requests) == 5
+    assert metrics.get("storage.retries") == 2
+    assert server.connections == 1
+    http.close()
+
+
+def test_llm_calls_share_one_pooled_connection_and_retry_503s(server, monkeypatch):
+    from groq import AsyncGroq
+
+    path = "/openai/v1/chat/completions"
+    server.bodies[path] = json.dumps({
+        "id": "chat-1", "object": "chat.completion", "created": 0, "model": "test",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "An answer."}}],
+    }).encode()
+    server.failures[path] = [503]
+
+    async def run():
+        async with resources._create_async_http_client() as http:
+            client = AsyncGroq(api_key="test", base_url=server.url, http_client=http, max_retries=0)
+            monkeypatch.setattr(llm_service, "get_async_groq", lambda: client)
+            return [await GroqLLM().complete_async(f"prompt {i}") for i in range(3)]
+
+    assert asyncio.run(run()) == ["An answer."] * 3
+    assert len(server.requests) == 4
+    assert metrics.get("llm.retries") == 1
+    assert server.connections == 1
@@ -0,0 +1,60 @@
+# backend/tests/test_resources.py
+import asyncio
+import threading
+import time
+
+from app.core.resources import ResourceRegistry
+
+
+class Client:
+    def __init__(self):
+        self.closed = False
+
+    async def aclose(self):
+        self.closed = True
+
+
+def test_resources_are_created_on_first_use_and_only_once():
+    created = []
+
+    def factory():
+        time.sleep(0.05)
+        created.append(Client())
+        return created[-1]
+
+    registry = ResourceRegistry()
+    registry.register("client", factory)
+    assert not registry.is_loaded("client")
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get("client"))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(created) == 1
+    assert all(result is created[0] for result in results)
+    assert registry.is_loaded("client")
+
+
+def test_prewarm_loads_in_the_background_and_skips_failures():
+    registry = ResourceRegistry()
+    registry.register("broken", lambda: 1 / 0)
+    registry.register("client", Client)
+
+    registry.prewarm(["broken", "client"]).join(5)
+
+    assert registry.is_loaded("client")
+    assert not registry.is_loaded("broken")
+
+
+def test_close_closes_loaded_resources():
+    registry = ResourceRegistry()
+    registry.register("client", Client)
+    client = registry.get("client")
+
+    asyncio.run(registry.close())
+
+    assert client.closed
+    assert not registry.is_loaded("client")
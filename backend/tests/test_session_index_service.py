@@ -0,0 +1,43 @@
+# backend/tests/test_session_index_service.py
+import faiss
+import numpy as np
+import pytest
+
+from app.services import session_index_service, vector_service
+
+DIMENSION = 8
+
+
+def document(seed):
+    vectors = np.random.default_rng(seed).standard_normal((4, DIMENSION)).astype("float32")
+    index = faiss.IndexFlatL2(DIMENSION)
+    index.add(vectors)
+    return index, [f"doc-{seed} chunk {i}" for i in range(4)]
+
+
+@pytest.fixture
+def documents(monkeypatch):
+    loaded = {"a": document(1), "b": document(2)}
+    monkeypatch.setattr(vector_service, "load_document", lambda doc_id, deadline=None: loaded[doc_id])
+    monkeypatch.setattr(vector_service, "resolve_artifact_prefixes", lambda doc_ids: {doc_id: doc_id for doc_id in doc_ids})
+    monkeypatch.setattr(session_index_service, "_load", lambda session_id: None)
+    monkeypatch.setattr(session_index_service, "_save", lambda session_id, session_index: None)
+    return loaded
+
+
+def test_a_document_that_fails_to_migrate_is_still_searched(documents, monkeypatch):
+    def document_vectors(doc_id):
+        if doc_id == "b":
+            raise RuntimeError("download failed")
+        index, _ = documents[doc_id]
+        return index.reconstruct_n(0, index.ntotal)
+
+    monkeypatch.setattr(vector_service, "document_vectors", document_vectors)
+    # A query sitting on one of b's chunks: b must come first, from its own index.
+    query = documents["b"][0].reconstruct(2).reshape(1, -1)
+
+    results = session_index_service.search_session("session", ["a", "b"], query, top_k=8)
+
+    assert results[0] == {"doc_id": "b", "text": "doc-2 chunk 2", "score": 0.0}
+    assert sorted(result["doc_id"] for result in results) == ["a"] * 4 + ["b"] * 4
+    assert [result["score"] for result in results] == sorted(result["score"] for result in results)
@@ -0,0 +1,88 @@
+# backend/tests/test_session_service.py
+import asyncio
+from types import SimpleNamespace
+
+import faiss
+import httpx
+import numpy as np
+import pytest
+
+from app.core import metrics
+from app.services import session_service, vector_service
+
+DOCUMENTS = [
+    {"storage_path": "doc-a", "file_name": "a.pdf", "content_hash": "aaaa"},
+    {"storage_path": "doc-b", "file_name": "b.pdf", "content_hash": "bbbb"},
+    {"storage_path": "doc-c", "file_name": "c.pdf", "content_hash": None},
+]
+
+
+class FakeQuery:
+    """Chainable stand-in for a supabase-py query builder that returns fixed rows."""
+
+    http_method = "GET"
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        return SimpleNamespace(data=self.rows)
+
+
+class FakeSupabase:
+    def table(self, name):
+        if name == "chat_sessions":
+            return FakeQuery([{"user_id": "user-1", "session_documents": [{"documents": document} for document in DOCUMENTS]}])
+        return FakeQuery([{"content_hash": "stale"}])
+
+
+@pytest.fixture
+def app(monkeypatch):
+    import main
+    from app.api.v1 import endpoints
+    from app.core.auth import get_current_user
+
+    supabase = FakeSupabase()
+    monkeypatch.setattr(session_service, "get_supabase", lambda: supabase)
+    monkeypatch.setattr(vector_service, "get_supabase", lambda: supabase)
+    monkeypatch.setattr(endpoints, "SESSION_INDEX_ENABLED", False)
+    query_vector = np.ones((1, 8), dtype="float32")
+    monkeypatch.setattr(vector_service, "encode_query_async", lambda query: asyncio.sleep(0, query_vector))
+    session_service._session_metadata.clear()
+    vector_service._artifact_prefixes.clear()
+    vector_service._document_cache.clear()
+    for document in DOCUMENTS:
+        index = faiss.IndexFlatL2(8)
+        index.add(np.random.default_rng(0).standard_normal((3, 8)).astype("float32"))
+        prefix = vector_service.content_prefix(document["content_hash"]) if document["content_hash"] else document["storage_path"]
+        vector_service._cache_document(prefix, index, [f"{document['file_name']} chunk {i}" for i in range(3)], 1)
+    main.app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id="user-1")
+    yield main.app
+    main.app.dependency_overrides.clear()
+
+
+def test_a_chat_turn_costs_one_query_then_none_while_cached(app):
+    async def chat(client):
+        response = await client.post("/api/v1/chat/session-1", json={"query": "What is covered?"})
+        assert response.status_code == 200
+        return response.json()
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            first = await chat(client)
+            queries_after_first = metrics.get("db.requests")
+            vector_service._artifact_prefixes.clear()  # the prefix memo expires before the session entry
+            await chat(client)
+            return first, queries_after_first, metrics.get("db.requests")
+
+    first, queries_after_first, queries_after_second = asyncio.run(run())
+
+    assert sorted(first["citations"]) == ["a.pdf", "b.pdf", "c.pdf"]
+    assert queries_after_first == 1
+    assert queries_after_second == 1
+    assert vector_service.artifact_prefix("doc-a") == vector_service.content_prefix("aaaa")
+    assert vector_service.artifact_prefix("doc-c") == "doc-c"
@@ -0,0 +1,144 @@
+# backend/tests/test_vector_service.py
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from app.core import metrics
+from app.services import vector_service
+
+
+class FakeChunks(list):
+    def metadata(self, i):
+        return {"hash": f"hash-{i}"}
+
+
+def random_vectors(count, dimension=64, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, dimension)).astype("float32")
+
+
+@pytest.fixture(autouse=True)
+def small_index_thresholds(monkeypatch):
+    # Flat up to 200 vectors, HNSW up to 1000, IVF-PQ above (16 sub-quantizers of 64 dims).
+    monkeypatch.setattr(vector_service, "INDEX_FLAT_MAX_VECTORS", 200)
+    monkeypatch.setattr(vector_service, "INDEX_PQ_M", 16)
+    monkeypatch.setattr(vector_service, "INDEX_HNSW_MAX_VECTORS", 1000)
+
+
+@pytest.mark.parametrize("count, exact", [(100, True), (500, True), (3000, False)])
+def test_only_flat_storage_counts_as_exact(count, exact):
+    index = vector_service.build_index(random_vectors(count))
+    assert vector_service.stores_exact_vectors(index) is exact
+
+
+def test_seed_chunk_embeddings_never_caches_pq_reconstructions(monkeypatch):
+    vectors = random_vectors(3000)
+    index = vector_service.build_index(vectors)
+    chunks = FakeChunks(f"chunk {i}" for i in range(len(vectors)))
+    monkeypatch.setattr(vector_service, "load_document", lambda doc_id: (index, chunks))
+    stored = {}
+    monkeypatch.setattr(vector_service._chunk_embeddings, "put_many", stored.update)
+
+    hashes = vector_service.seed_chunk_embeddings("doc")
+
+    assert len(hashes) == len(vectors)
+    assert stored == {}
+
+
+def test_seed_chunk_embeddings_caches_exact_vectors(monkeypatch):
+    vectors = random_vectors(50)
+    index = vector_service.build_index(vectors)
+    chunks = FakeChunks(f"chunk {i}" for i in range(len(vectors)))
+    monkeypatch.setattr(vector_service, "load_document", lambda doc_id: (index, chunks))
+    stored = {}
+    monkeypatch.setattr(vector_service._chunk_embeddings, "put_many", stored.update)
+
+    vector_service.seed_chunk_embeddings("doc")
+
+    assert np.array_equal(stored["hash-7"], vectors[7])
+
+
+@pytest.mark.parametrize("count", [100, 500, 3000])
+def test_read_index_file_maps_every_index_type(tmp_path, monkeypatch, count):
+    monkeypatch.setattr(vector_service, "INDEX_MMAP_ENABLED", True)
+    vectors = random_vectors(count)
+    index = vector_service.build_index(vectors)
+    path = tmp_path / "doc.index"
+    path.write_bytes(vector_service.serialize_index(index))
+
+    loaded = vector_service.read_index_file(str(path))
+
+    assert loaded.ntotal == count
+    assert metrics.get("index.mmap_reads") == 1
+    assert metrics.get("index.mmap_failures") == 0
+    assert metrics.get("index.memory_reads") == 0
+    vector_service.configure_search(loaded)
+    _, ids = loaded.search(vectors[:5], 1)
+    assert (ids[:, 0] == np.arange(5)).sum() >= 4
+
+
+class StorageError(Exception):
+    def __init__(self, status):
+        super().__init__(f"storage answered {status}")
+        self.status = status
+
+
+@pytest.mark.parametrize("error, remembered", [(StorageError(404), True), (StorageError(503), False)])
+def test_missing_lexical_index_is_remembered_only_when_storage_says_so(monkeypatch, error, remembered):
+    fetches = []
+
+    def fetch(prefix, file_name):
+        fetches.append(prefix)
+        raise error
+
+    monkeypatch.setattr(vector_service, "artifact_prefix", lambda doc_id: f"blobs/{doc_id}")
+    monkeypatch.setattr(vector_service, "_fetch_to_disk", fetch)
+    monkeypatch.setattr(vector_service, "_missing_lexical", set())
+
+    assert vector_service.load_lexical_index("doc") is None
+    assert vector_service.load_lexical_index("doc") is None
+    assert len(fetches) == (1 if remembered else 2)
+
+
+def test_every_document_gets_its_own_retrieval_timeout(monkeypatch):
+    monkeypatch.setattr(vector_service, "RETRIEVAL_DOC_TIMEOUT_SECONDS", 0.3)
+    # One thread: the second document only starts once the first is done.
+    monkeypatch.setattr(vector_service, "_retrieval_executor", ThreadPoolExecutor(max_workers=1))
+    delays = {"a": 0.2, "b": 0.2, "slow": 1.0, "c": 0.0}
+    deadlines = {}
+
+    def search(doc_id, query_vector, top_k, deadline):
+        deadlines[doc_id] = deadline - time.monotonic()
+        time.sleep(delays[doc_id])
+        return [{"doc_id": doc_id, "text": doc_id, "score": delays[doc_id]}]
+
+    monkeypatch.setattr(vector_service, "_search_document", search)
+
+    results = vector_service.search_documents(["a", "b", "slow", "c"], None, top_k=10)
+
+    assert [result["doc_id"] for result in results] == ["c", "a", "b"]
+    assert metrics.get("retrieval.document_timeouts") == 1
+    assert all(0.25 < left <= 0.3 for left in deadlines.values())
+
+
+def test_document_vectors_of_a_pq_index_are_encoded_at_query_priority(monkeypatch):
+    vectors = random_vectors(3000)
+    index = vector_service.build_index(vectors)
+    chunks = FakeChunks(f"chunk {i}" for i in range(len(vectors)))
+    monkeypatch.setattr(vector_service, "load_document", lambda doc_id: (index, chunks))
+    monkeypatch.setattr(vector_service._chunk_embeddings, "get_many", lambda hashes: {})
+    monkeypatch.setattr(vector_service._chunk_embeddings, "put_many", lambda vectors: None)
+    queries = []
+
+    def submit_query(text):
+        queries.append(text)
+        future = Future()
+        future.set_result(vectors[int(text.split()[1])].reshape(1, -1))
+        return future
+
+    monkeypatch.setattr(vector_service._embedder, "submit_query", submit_query)
+    monkeypatch.setattr(vector_service._embedder, "submit_documents", lambda texts: pytest.fail("encoded at ingestion priority"))
+
+    assert np.array_equal(vector_service.document_vectors("doc"), vectors)
+    assert len(queries) == len(vectors)
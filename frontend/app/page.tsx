@@ -2,7 +2,7 @@
 import { useEffect, useState } from 'react';
 import Link from 'next/link';
 import { useAuth } from '@/context/AuthContext';
-import { uploadDocument, deleteDocument } from '@/lib/api';
+import { uploadDocument, deleteDocument, waitForJob } from '@/lib/api';
 import toast from 'react-hot-toast';
 import { UploadCloud, LoaderCircle, FileText, PlusCircle, Trash2 } from 'lucide-react';
 import ConfirmModal from '@/components/ConfirmModal';
@@ -73,12 +73,16 @@ export default function Dashboard() {
     setIsUploading(true);
     const uploadToast = toast.loading('Uploading and processing...');
     try {
-      await uploadDocument(file);
+      const { data } = await uploadDocument(file);
+      const job = await waitForJob(data.job_id);
+      if (job.status === 'failed') {
+        throw new Error(job.error || 'Processing failed. Please try again.');
+      }
       toast.success('Document uploaded!', { id: uploadToast });
       setFile(null); // Reset file input after successful upload
       fetchDocuments(); // Refresh the document list to show the new document
     } catch (err: any) {
-      const errorMessage = err.response?.data?.detail || 'Upload failed. Please try again.';
+      const errorMessage = err.response?.data?.detail || err.message || 'Upload failed. Please try again.';
       toast.error(errorMessage, { id: uploadToast });
       console.error(err);
     } finally {
@@ -44,12 +44,8 @@ const MindMapContent = ({ documentId }: { documentId: string }) => {
   const onNodesChange: OnNodesChange = useCallback((changes) => setNodes((nds) => applyNodeChanges(changes, nds)), []);
   const onEdgesChange: OnEdgesChange = useCallback((changes) => setEdges((eds) => applyEdgeChanges(changes, eds)), []);
 
+  // An empty topic asks for the document's overview mind map, which the backend serves from storage.
   const handleGenerate = async () => {
-    if (!topic.trim()) {
-      toast.error("Please enter a central topic to generate the map.");
-      return;
-    }
-
     setIsLoading(true);
     setNodes([]);
     setEdges([]);
@@ -109,7 +105,7 @@ const MindMapContent = ({ documentId }: { documentId: string }) => {
                 type="text" 
                 value={topic}
                 onChange={(e) => setTopic(e.target.value)}
-                placeholder="Enter central topic for the mind map..."
+                placeholder="Enter a central topic, or leave empty for an overview..."
                 className="flex-1 p-3 bg-slate-700 border border-slate-600 rounded-lg focus:outline-none focus:ring-2 focus:ring-indigo-500"
                 disabled={isLoading}
             />
@@ -34,6 +34,43 @@ export const uploadDocument = (file: File) => {
   });
 };
 
+export interface IngestionJob {
+  job_id: string;
+  document_id: string;
+  filename: string;
+  status: 'queued' | 'running' | 'completed' | 'failed';
+  stage: string | null;
+  progress: number;
+  attempts: number;
+  error: string | null;
+}
+
+export const getJobStatus = async (jobId: string): Promise<IngestionJob> => {
+  const response = await apiClient.get(`/jobs/${jobId}`);
+  return response.data;
+};
+
+// Uploads are processed in the background; poll the job until it finishes or fails. The
+// interval backs off from intervalMs to maxIntervalMs, and polling gives up after timeoutMs.
+export const waitForJob = async (
+  jobId: string,
+  { intervalMs = 1000, maxIntervalMs = 10000, timeoutMs = 15 * 60 * 1000 } = {},
+): Promise<IngestionJob> => {
+  const deadline = Date.now() + timeoutMs;
+  let delay = intervalMs;
+  while (true) {
+    const job = await getJobStatus(jobId);
+    if (job.status === 'completed' || job.status === 'failed') {
+      return job;
+    }
+    if (Date.now() + delay > deadline) {
+      throw new Error('Processing is taking longer than expected. Check your documents again later.');
+    }
+    await new Promise(resolve => setTimeout(resolve, delay));
+    delay = Math.min(delay * 1.5, maxIntervalMs);
+  }
+};
+
 export const askQuestion = (docId: string, query: string) => {
   return apiClient.post('/chat', { doc_id: docId, query });
 };
@@ -43,8 +80,9 @@ export const generateMindMap = async (docId: string, topic: string) => {
     return response.data;
 };
 
-export const summarizeDocument = (docId: string) => {
-  return apiClient.post('/summarize', { doc_id: docId, query: 'summarize' });
+// 'full' summarises every chunk of the document (map-reduce); 'retrieval' only the most relevant ones.
+export const summarizeDocument = (docId: string, mode: 'retrieval' | 'full' = 'retrieval') => {
+  return apiClient.post('/summarize', { doc_id: docId, mode });
 };
 
 export const generateQuiz = async (docId: string, numQuestions: number): Promise<QuizQuestion[]> => {